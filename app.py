@@ -1,11 +1,23 @@
+import time
+
 import boto3
-from chalice import Chalice
+from chalice import BadRequestError, Chalice, NotFoundError, Response
 
 # Load environment variables from .env files.
 from dotenv import find_dotenv, load_dotenv
 
 # Import the modules from the chalicelib directory.
-from chalicelib import dlq, events, persistence, services
+from chalicelib import (
+    codec,
+    config,
+    dlq,
+    events,
+    jobs,
+    persistence,
+    ratelimit,
+    services,
+    utils,
+)
 
 # Load environment variables before initializing the application.
 load_dotenv(find_dotenv())
@@ -13,44 +25,287 @@ load_dotenv(find_dotenv())
 # Create a new Chalice application instance.
 app = Chalice(app_name="daily-ai-coding-task")
 
-# Initialize AWS CloudWatch logs client for event logging.
-event_logger = events.EventLogger(client=boto3.client("logs"))
+# AWS clients and the components built on top of them are created lazily, the first
+# time a route needs them, and then reused across warm invocations. This keeps cold
+# starts fast and makes each route pay only for what it touches.
+resources = {}
 
-# Initialize a Dead Letter Queue (DLQ) for handling message failures.
-dead_letter_queue = dlq.DeadLetterQueue(
-    sqs_resource=boto3.client("sqs"), event_logger=event_logger
-)
 
-# Set up the DynamoDB table for user data persistence.
-users_table = persistence.UsersTable(
-    dynamo_resource=boto3.resource("dynamodb"), event_logger=event_logger
-)
+def get_resource(name, factory):
+    # Build the named resource on first use and cache it.
+    if name not in resources:
+        resources[name] = factory()
+
+    return resources[name]
+
+
+class LazyResource:
+    # Stand in for a resource that's only built when one of its attributes is first
+    # used, for components that rarely need it (e.g. to log their errors).
+    def __init__(self, getter):
+        self.getter = getter
+
+    def __getattr__(self, name):
+        return getattr(self.getter(), name)
+
+
+def get_event_logger():
+    # Initialize AWS CloudWatch logs client for event logging. Events are buffered and
+    # sent in batches, off the request's hot path.
+    def create():
+        provision = utils.provisioning_checks_required("logs")
+        event_logger = events.EventLogger(
+            client=boto3.client("logs"),
+            buffered=True,
+            flush_interval=config.LOG_FLUSH_INTERVAL_SECONDS,
+            provision=provision,
+        )
+
+        # The log group and streams exist now, so skip their check from now on.
+        if provision:
+            utils.mark_provisioned("logs")
+
+        return event_logger
+
+    return get_resource("event_logger", create)
+
+
+def get_dead_letter_queue():
+    # Initialize a Dead Letter Queue (DLQ) for handling message failures. The queue is
+    # looked up on the first message sent, so most runs never pay for it. Messages are
+    # sent in batches, at the latest when the fetch run ends.
+    return get_resource(
+        "dead_letter_queue",
+        lambda: dlq.DeadLetterQueue(
+            sqs_resource=boto3.client("sqs"),
+            event_logger=get_event_logger(),
+            provision=False,
+            buffered=True,
+        ),
+    )
+
+
+def get_users_table():
+    # Set up the DynamoDB table for user data persistence.
+    def create():
+        users_table = persistence.UsersTable(
+            dynamo_resource=boto3.resource("dynamodb"),
+            event_logger=get_event_logger(),
+        )
+
+        # Ensure the users table exists or create it, unless it's known to exist.
+        if not utils.provisioning_checks_required("users"):
+            users_table.bind()
+            return users_table
+
+        if not users_table.exists():
+            users_table.create_table()
+
+        utils.mark_provisioned("users")
+        return users_table
+
+    return get_resource("users_table", create)
+
+
+def get_state_table():
+    # Set up the DynamoDB table holding the status of the latest run.
+    def create():
+        # The event logger is only set up if the table has an error to log.
+        state_table = persistence.StateTable(
+            dynamo_resource=boto3.resource("dynamodb"),
+            event_logger=LazyResource(get_event_logger),
+        )
+
+        # Ensure the state table exists or create it, unless it's known to exist.
+        if not utils.provisioning_checks_required("state"):
+            state_table.bind()
+            return state_table
+
+        if not state_table.exists():
+            state_table.create_table()
+
+        utils.mark_provisioned("state")
+        return state_table
+
+    return get_resource("state_table", create)
 
-# Initialize the data fetching service with the necessary components.
-data_fetcher = services.DataFetcher(
-    event_logger=event_logger, users_table=users_table, dlq=dead_letter_queue
-)
+
+def get_job_queue():
+    # Initialize the queue handing fetch jobs over to the workers. It's looked up on
+    # the first job sent.
+    return get_resource(
+        "job_queue",
+        lambda: jobs.JobQueue(
+            sqs_client=boto3.client("sqs"), event_logger=get_event_logger()
+        ),
+    )
+
+
+def get_rate_limiter():
+    # Initialize the rate limiter shared by every instance fetching from the API.
+    return get_resource(
+        "rate_limiter", lambda: ratelimit.SharedRateLimiter(get_state_table())
+    )
+
+
+def get_data_fetcher():
+    # Initialize the data fetching service with the necessary components. API calls
+    # draw from the rate budget shared by all the instances.
+    return get_resource(
+        "data_fetcher",
+        lambda: services.DataFetcher(
+            event_logger=get_event_logger(),
+            users_table=get_users_table(),
+            dlq=get_dead_letter_queue(),
+            provision=False,
+            state_table=get_state_table(),
+            rate_limiter=get_rate_limiter(),
+        ),
+    )
+
+
+# Make sure every buffered event is sent before any handler returns, since the Lambda
+# may be frozen right after that. Failing to send them doesn't fail the request: the
+# events are kept for the next flush, and the failure is logged.
+@app.middleware("all")
+def flush_event_logs(event, get_response):
+    try:
+        return get_response(event)
+    finally:
+        if "event_logger" in resources:
+            try:
+                resources["event_logger"].flush()
+            except Exception as e:
+                app.log.error("Could not flush buffered events: %s", e)
+
+
+def get_remaining_time(context, timeout_millis=None):
+    # Build a callable returning the milliseconds left before the invocation times out,
+    # or the given timeout elapses, whichever comes first. Outside of Lambda there is
+    # no deadline.
+    if context is None:
+        return None
+
+    if timeout_millis is None:
+        return context.get_remaining_time_in_millis
+
+    deadline = time.monotonic() + timeout_millis / 1000
+
+    def remaining_time():
+        timeout_remaining_millis = (deadline - time.monotonic()) * 1000
+        return min(context.get_remaining_time_in_millis(), timeout_remaining_millis)
+
+    return remaining_time
 
 
 # Define a Chalice route to fetch data when a POST request is made to /fetch-data.
+# By default, it fetches the data within the request and returns the status of the run,
+# stopping before API Gateway times out. With `?async=true`, it enqueues a fetch job
+# and returns its id right away instead, and the job's progress can be polled at
+# /jobs/{job_id}. Either way, an interrupted run is resumed by the next one. With
+# `?fanout=true`, the `users` to fetch are split into slices fetched by parallel
+# workers, asynchronously too.
 @app.route("/fetch-data", methods=["POST"])
 def fetch_data():
-    # Fetch data using the data_fetcher service and return the status.
-    status = data_fetcher.fetch()
-    return status
+    params = app.current_request.query_params or {}
+
+    # Parse the number of users to fetch, if given.
+    target_users = None
+    if "users" in params:
+        try:
+            target_users = int(params["users"])
+        except ValueError:
+            raise BadRequestError("users must be an integer.")
+        if target_users <= 0:
+            raise BadRequestError("users must be positive.")
+
+    if is_enabled(params.get("fanout")):
+        if target_users is None:
+            raise BadRequestError("users is required to fan out a fetch.")
+        if target_users > config.FANOUT_MAX_USERS:
+            raise BadRequestError(
+                f"users can't exceed {config.FANOUT_MAX_USERS} to fan out a fetch."
+            )
+        job = jobs.create_fanout_job(get_state_table(), get_job_queue(), target_users)
+    elif is_enabled(params.get("async")):
+        job = jobs.create_job(get_state_table(), get_job_queue(), target_users)
+    else:
+        # Fetch data using the data_fetcher service and return the status.
+        return get_data_fetcher().fetch(
+            target_users=target_users,
+            remaining_time=get_remaining_time(
+                app.lambda_context, config.API_GATEWAY_TIMEOUT_MILLIS
+            ),
+        )
+
+    return Response(
+        body=job,
+        status_code=202,
+        headers={"Location": f"/jobs/{job['id']}"},
+    )
+
+
+def is_enabled(flag):
+    # Tell whether a boolean query parameter is set.
+    return (flag or "").lower() in ("1", "true", "yes")
+
+
+# Define a Chalice route to poll the state and progress of a fetch job.
+@app.route("/jobs/{job_id}", methods=["GET"])
+def get_job(job_id):
+    job = jobs.get_job(get_state_table(), job_id)
+    if job is None:
+        raise NotFoundError(f"Job {job_id} not found.")
+
+    return job
+
+
+# Run the fetch jobs, and the slices of fan-out jobs, enqueued by /fetch-data, one at
+# a time, within the worker's own (longer) Lambda timeout. As many of them run in
+# parallel as the `reserved_concurrency` of the worker in `.chalice/config.json`.
+@app.on_sqs_message(queue=config.JOBS_QUEUE, batch_size=1)
+def run_fetch_job(event):
+    for record in event:
+        jobs.handle_message(
+            get_data_fetcher(),
+            get_state_table(),
+            get_job_queue(),
+            codec.loads(record.body),
+            remaining_time=get_remaining_time(event.context),
+        )
 
 
 # Define a Chalice route to retrieve and view data with a GET request to /view-data.
+# It returns one page of users at a time. Clients pass the `next_cursor` of a page
+# as the `cursor` of the next request, and can restrict the returned attributes
+# with a comma-separated `fields` list.
 @app.route("/view-data", methods=["GET"])
 def view_data():
-    # Get data from the data_fetcher service and return it.
-    data = data_fetcher.get()
-    return data
+    params = app.current_request.query_params or {}
+
+    # Parse the page size, falling back to the default one.
+    try:
+        limit = int(params.get("limit", config.VIEW_DATA_DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequestError("limit must be an integer.")
+
+    fields = [f for f in params.get("fields", "").split(",") if f]
+
+    # Get a page of data straight from the users table and return it.
+    try:
+        page = services.get_users_page(
+            get_users_table(), limit=limit, cursor=params.get("cursor"), fields=fields
+        )
+    except ValueError as e:
+        raise BadRequestError(str(e))
+
+    return page
 
 
 # Define a Chalice route for checking the status of the data fetcher with a GET request to /status.
 @app.route("/status", methods=["GET"])
 def status():
-    # Retrieve and return the current status from the data_fetcher service.
-    status = data_fetcher.status()
+    # Retrieve and return the status of the last fetch from the state table. The event
+    # logger is only set up when the status has to be read from its log stream.
+    status = services.get_latest_status(get_event_logger, get_state_table())
     return status
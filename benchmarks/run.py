@@ -0,0 +1,464 @@
+"""
+Benchmarks for the fetch/persist/log pipeline, run against local stand-ins: the
+in-memory AWS fakes of `test_tools` and an in-process Random Data API.
+
+Each benchmark reports its throughput, the p50/p99 latency of every stage and the
+peak memory allocated while it ran. Results can be saved as a baseline and later
+compared against it, failing when a benchmark regresses past a tolerance.
+
+Usage:
+    python -m benchmarks.run [--users 2000] [--http-latency-ms 50] \
+        [--aws-latency-ms 5] [--baseline benchmarks/baseline.json] [--save-baseline]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import boto3
+from boto3.dynamodb.types import TypeSerializer
+
+from benchmarks import standins
+from chalicelib import codec
+from chalicelib import config
+from chalicelib.events import EventLogger
+from chalicelib.persistence import StateTable
+from chalicelib.persistence import UsersTable
+from chalicelib.services import DataFetcher
+from chalicelib.services import get_users_page
+from test_tools.cloudwatch_fake import CloudWatchFake
+from test_tools.dynamodb_fake import DynamoDBFake
+from test_tools.sqs_fake import SqsFake
+
+# The region the stand-in clients are created in. No call ever leaves the process.
+REGION = "us-west-1"
+
+# Where the baseline is stored by default.
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+class Recorder:
+    """Collects the latency of every call, grouped by stage."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {}
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.timings.setdefault(stage, []).append(seconds)
+
+    def summary(self):
+        return {
+            stage: {
+                "calls": len(timings),
+                "p50_ms": round(percentile(timings, 50) * 1000, 3),
+                "p99_ms": round(percentile(timings, 99) * 1000, 3),
+            }
+            for stage, timings in sorted(self.timings.items())
+        }
+
+
+def percentile(values, p):
+    """Return the p-th percentile of the values, using the nearest-rank method."""
+    values = sorted(values)
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+class Environment:
+    """Fake AWS clients and the project components built on top of them."""
+
+    def __init__(self, aws_latency):
+        self.logs = CloudWatchFake(
+            boto3.client("logs", region_name=REGION), latency=aws_latency, stage="logs"
+        ).activate()
+        dynamo_resource = boto3.resource("dynamodb", region_name=REGION)
+        self.dynamodb = DynamoDBFake(
+            dynamo_resource.meta.client, latency=aws_latency, stage="dynamodb"
+        ).activate()
+        self.sqs = SqsFake(
+            boto3.client("sqs", region_name=REGION), latency=aws_latency, stage="sqs"
+        ).activate()
+
+        self.event_logger = EventLogger(client=self.logs.client, buffered=True)
+        dynamodb_client = self.dynamodb.attach(
+            boto3.client("dynamodb", region_name=REGION)
+        )
+        self.users_table = UsersTable(
+            dynamo_resource, self.event_logger, dynamodb_client=dynamodb_client
+        )
+        self.users_table.create_table()
+        self.state_table = StateTable(dynamo_resource, self.event_logger)
+        self.state_table.create_table()
+
+    def record_into(self, recorder):
+        """Record the latency of every AWS call into the recorder."""
+        for service in (self.logs, self.dynamodb, self.sqs):
+            service.recorder = recorder
+
+
+def measure(name, units, setup, run):
+    """
+    Run a benchmark, returning its throughput, stage latencies and peak memory.
+
+    `setup` builds the benchmark's state, outside of the measurements, and `run`
+    takes that state and a Recorder.
+    """
+    # Time a first run. Tracing allocations slows everything down, so the peak memory
+    # is measured in a second run.
+    recorder = Recorder()
+    state = setup()
+    start = time.perf_counter()
+    run(state, recorder)
+    elapsed = time.perf_counter() - start
+
+    state = setup()
+    tracemalloc.start()
+    run(state, Recorder())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "throughput": round(units / elapsed, 1),
+        "throughput_unit": "events/s" if "event" in name else "users/s",
+        "seconds": round(elapsed, 3),
+        "peak_memory_kb": round(peak / 1024, 1),
+        "stages": recorder.summary(),
+    }
+
+
+def make_pages(users):
+    """Build pages of users, as returned by the Random Data API."""
+    return [
+        [standins.make_user(i + j) for j in range(config.MAX_USERS_PER_API_CALL)]
+        for i in range(0, users, config.MAX_USERS_PER_API_CALL)
+    ]
+
+
+def bench_fetch(args):
+    """DataFetcher.fetch end to end: HTTP calls, DynamoDB writes and logging."""
+
+    def setup():
+        env = Environment(args.aws_latency_ms / 1000)
+        fetcher = DataFetcher(
+            event_logger=env.event_logger,
+            users_table=env.users_table,
+            dlq=None,
+            provision=False,
+            state_table=env.state_table,
+        )
+        fetcher.limiter_session = standins.InProcessApiSession(
+            latency=args.http_latency_ms / 1000
+        )
+        return env, fetcher
+
+    def run(state, recorder):
+        env, fetcher = state
+        env.record_into(recorder)
+        fetcher.limiter_session.recorder = recorder
+        fetcher.fetch(target_users=args.users)
+        env.event_logger.flush()
+
+    return measure("fetch", args.users, setup, run)
+
+
+def bench_fetch_streaming(args):
+    """DataFetcher.fetch end to end, streaming the responses into the table."""
+
+    def setup():
+        env = Environment(args.aws_latency_ms / 1000)
+        fetcher = DataFetcher(
+            event_logger=env.event_logger,
+            users_table=env.users_table,
+            dlq=None,
+            provision=False,
+            state_table=env.state_table,
+        )
+        fetcher.limiter_session = standins.InProcessApiSession(
+            latency=args.http_latency_ms / 1000
+        )
+        return env, fetcher
+
+    def run(state, recorder):
+        env, fetcher = state
+        env.record_into(recorder)
+        fetcher.limiter_session.recorder = recorder
+        fetcher.fetch(target_users=args.users, stream=True)
+        env.event_logger.flush()
+
+    return measure("fetch_streaming", args.users, setup, run)
+
+
+def bench_add_elements(args):
+    """UsersTable.add_elements, one API page at a time."""
+
+    def setup():
+        return Environment(args.aws_latency_ms / 1000), make_pages(args.users)
+
+    def run(state, recorder):
+        env, pages = state
+        env.record_into(recorder)
+        for page in pages:
+            env.users_table.add_elements(page)
+        env.event_logger.flush()
+
+    return measure("add_elements", args.users, setup, run)
+
+
+def bench_marshal(args):
+    """UsersTable.marshal, turning users into DynamoDB items of the wire format."""
+
+    def setup():
+        users_table = UsersTable(dynamo_resource=None, event_logger=None)
+        return users_table, [standins.make_user(i) for i in range(args.users)]
+
+    def run(state, recorder):
+        users_table, users = state
+        for user in users:
+            users_table.marshal(user)
+
+    return measure("marshal", args.users, setup, run)
+
+
+def bench_marshal_resource_layer(args):
+    """UsersTable.serialize then boto3's TypeSerializer, as the resource layer does."""
+
+    def setup():
+        users_table = UsersTable(dynamo_resource=None, event_logger=None)
+        users = [standins.make_user(i) for i in range(args.users)]
+        return users_table, TypeSerializer(), users
+
+    def run(state, recorder):
+        users_table, serializer, users = state
+        for user in users:
+            item = users_table.serialize(user)
+            {name: serializer.serialize(value) for name, value in item.items()}
+
+    return measure("marshal_resource_layer", args.users, setup, run)
+
+
+def bench_get_elements(args):
+    """UsersTable.get_elements over a table holding `--users` users."""
+
+    def setup():
+        env = Environment(args.aws_latency_ms / 1000)
+        for page in make_pages(args.users):
+            env.users_table.add_elements(page)
+        env.event_logger.flush()
+        return env
+
+    def run(env, recorder):
+        env.record_into(recorder)
+        env.users_table.get_elements(total_segments=config.SCAN_TOTAL_SEGMENTS)
+
+    return measure("get_elements", args.users, setup, run)
+
+
+def bench_view_data(cached):
+    """Paging through the users table 5 times, as /view-data clients do."""
+
+    def bench(args):
+        def setup():
+            env = Environment(args.aws_latency_ms / 1000)
+            for page in make_pages(args.users):
+                env.users_table.add_elements(page)
+            env.event_logger.flush()
+            if not cached:
+                env.users_table.page_cache = None
+            return env
+
+        def run(env, recorder):
+            env.record_into(recorder)
+            for _ in range(5):
+                cursor = None
+                while True:
+                    page = get_users_page(
+                        env.users_table, limit=config.VIEW_DATA_MAX_LIMIT, cursor=cursor
+                    )
+                    cursor = page["next_cursor"]
+                    if cursor is None:
+                        break
+
+        name = "view_data" if cached else "view_data_uncached"
+        return measure(name, 5 * args.users, setup, run)
+
+    return bench
+
+
+def bench_event_logger(args):
+    """EventLogger info calls, flushed at the end like a request."""
+
+    def setup():
+        return Environment(args.aws_latency_ms / 1000)
+
+    def run(env, recorder):
+        env.record_into(recorder)
+        for i in range(args.users):
+            env.event_logger.info(event={"message": f"Performing call {i}"})
+        env.event_logger.flush()
+
+    return measure("event_logger", args.users, setup, run)
+
+
+def bench_json_pages(backend):
+    """Parsing pages of users with a JSON backend, as returned by the Random Data API."""
+
+    def bench(args):
+        def setup():
+            codec.use_backend(backend)
+            size = config.MAX_USERS_PER_API_CALL
+            response = standins.InProcessApiSession().get(None, {"size": size})
+            return size, response.content
+
+        def run(state, recorder):
+            size, page = state
+            for _ in range(args.users // size):
+                codec.loads(page)
+
+        try:
+            return measure(f"json_pages_{backend}", args.users, setup, run)
+        finally:
+            codec.use_backend(config.JSON_BACKEND)
+
+    return bench
+
+
+def bench_json_events(backend):
+    """Encoding error events and statuses with a JSON backend, as the fetcher logs them."""
+
+    def bench(args):
+        def setup():
+            codec.use_backend(backend)
+            error_event = {
+                "message": "Received 503 code, but expected 200",
+                "response_code": 503,
+                "response_content": '{"error": "Service Unavailable"}',
+            }
+            status = {
+                "users": 1000,
+                "api_calls": 10,
+                "errors": [error_event] * 5,
+                "timestamp": 1700449327942,
+                "duration": 24.515415,
+                "remaining_users": 0,
+            }
+            return [error_event, status]
+
+        def run(events, recorder):
+            for i in range(args.users):
+                codec.dumps(events[i % 2])
+
+        try:
+            return measure(f"json_events_{backend}", args.users, setup, run)
+        finally:
+            codec.use_backend(config.JSON_BACKEND)
+
+    return bench
+
+
+BENCHMARKS = {
+    "fetch": bench_fetch,
+    "fetch_streaming": bench_fetch_streaming,
+    "add_elements": bench_add_elements,
+    "get_elements": bench_get_elements,
+    "view_data": bench_view_data(cached=True),
+    "view_data_uncached": bench_view_data(cached=False),
+    "marshal": bench_marshal,
+    "marshal_resource_layer": bench_marshal_resource_layer,
+    "json_pages_json": bench_json_pages("json"),
+    "json_events_json": bench_json_events("json"),
+    "event_logger": bench_event_logger,
+}
+
+
+# orjson is optional, so it's only benchmarked when it's installed.
+if codec.orjson is not None:
+    BENCHMARKS["json_pages_orjson"] = bench_json_pages("orjson")
+    BENCHMARKS["json_events_orjson"] = bench_json_events("orjson")
+
+
+def compare(results, baseline, tolerance, latency_slack_ms):
+    """Return a description of every regression of the results against the baseline."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name]
+
+        if result["throughput"] < expected["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {result['throughput']} < baseline {expected['throughput']}"
+            )
+
+        if result["peak_memory_kb"] > expected["peak_memory_kb"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: peak memory {result['peak_memory_kb']} KB > baseline {expected['peak_memory_kb']} KB"
+            )
+
+        for stage, timings in result["stages"].items():
+            expected_p99 = expected["stages"].get(stage, {}).get("p99_ms")
+            # Tail latencies of a few calls are noisy, so they get some extra slack.
+            allowed_p99 = expected_p99 * (1 + tolerance) + latency_slack_ms
+            if expected_p99 and timings["p99_ms"] > allowed_p99:
+                regressions.append(
+                    f"{name}: {stage} p99 {timings['p99_ms']} ms > baseline {expected_p99} ms"
+                )
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--http-latency-ms", type=float, default=50)
+    parser.add_argument("--aws-latency-ms", type=float, default=5)
+    parser.add_argument(
+        "--only", action="append", choices=sorted(BENCHMARKS), help="Run only these."
+    )
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store the results as baseline."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.3,
+        help="Allowed relative regression before failing (default: 0.3).",
+    )
+    parser.add_argument(
+        "--latency-slack-ms",
+        type=float,
+        default=20,
+        help="Allowed absolute p99 regression on top of the tolerance (default: 20).",
+    )
+    args = parser.parse_args(argv)
+
+    results = {name: BENCHMARKS[name](args) for name in args.only or BENCHMARKS}
+    print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        return 0
+
+    with open(args.baseline) as f:
+        regressions = compare(
+            results, json.load(f), args.tolerance, args.latency_slack_ms
+        )
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
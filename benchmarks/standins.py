@@ -0,0 +1,73 @@
+"""
+A local, in-process stand-in for the Random Data API, used by the benchmarks.
+
+The AWS services are stood in for by the in-memory fakes of `test_tools`.
+"""
+
+import json
+import threading
+import time
+
+from test_tools.random_data_api import make_user
+
+
+class InProcessApiResponse:
+    """A minimal stand-in for a `requests` response."""
+
+    def __init__(self, first_id, users, status_code=200):
+        self.first_id = first_id
+        self.users = users
+        self.status_code = status_code
+
+    def _users(self):
+        # The users of the body, given unique ids.
+        for i, tail in enumerate(self.users):
+            yield b'{"id":%d%s' % (self.first_id + i, tail)
+
+    @property
+    def content(self):
+        return b"[" + b",".join(self._users()) + b"]"
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def iter_content(self, chunk_size):
+        # Send the body a user at a time, so the whole page is never held in memory.
+        yield b"["
+        for i, user in enumerate(self._users()):
+            yield b"," + user if i else user
+        yield b"]"
+
+    def close(self):
+        pass
+
+
+class InProcessApiSession:
+    """Stands in for the rate-limited session used to call the Random Data API."""
+
+    def __init__(self, latency=0.0, recorder=None):
+        self.latency = latency
+        self.recorder = recorder
+        self.next_id = 0
+        self.pages = {}
+        self.lock = threading.Lock()
+
+    def get(self, endpoint, params, stream=False):
+        start = time.perf_counter()
+        size = params["size"]
+        with self.lock:
+            first_id = self.next_id
+            self.next_id += size
+            # Generating users is the server's work, so every page size is only
+            # generated once. Each user is kept encoded, but for its leading id.
+            if size not in self.pages:
+                encoded = [
+                    json.dumps(make_user(i), separators=(",", ":")).encode("utf-8")
+                    for i in range(size)
+                ]
+                self.pages[size] = [b"," + user.split(b",", 1)[1] for user in encoded]
+        time.sleep(self.latency)
+        if self.recorder is not None:
+            self.recorder.record("http", time.perf_counter() - start)
+        return InProcessApiResponse(first_id, self.pages[size])
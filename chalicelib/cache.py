@@ -0,0 +1,213 @@
+import collections
+import hashlib
+import os
+import sys
+import threading
+import time
+
+# Import local configuration settings.
+from . import codec
+
+# Tells a miss apart from a cached value.
+_MISSING = object()
+
+
+def deep_size(value):
+    # Return the bytes taken in memory by a value made of dicts, lists, tuples and
+    # scalars, counting shared objects each time they're referenced.
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(k) + deep_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(deep_size(v) for v in value)
+    return size
+
+
+# Define a read-through cache whose values are kept in memory, and optionally in files of
+# a directory, for `ttl` seconds. In memory, each value is measured by `measure`, an
+# estimate of the bytes it takes; on disk, by the size of its encoding. The least
+# recently used values are evicted past the budget of each tier. Values are only encoded
+# to be written to disk. The files outlive the process, so a new one in the same
+# environment picks them up. Values are shared by every caller, which must not change
+# them.
+class ReadThroughCache:
+    def __init__(
+        self,
+        encode,
+        decode,
+        ttl,
+        max_bytes,
+        directory=None,
+        disk_max_bytes=0,
+        clock=time.time,
+        measure=deep_size,
+    ):
+        self.encode = encode
+        self.decode = decode
+        self.measure = measure
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # The values in memory by key, as (value, size, stored_at), and their total size.
+        # The least recently used come first.
+        self.entries = collections.OrderedDict()
+        self.size = 0
+
+        # The sizes of the files on disk by name, and their total, in the same order.
+        self.files = collections.OrderedDict()
+        self.disk_size = 0
+        if directory is not None:
+            self._index_files()
+
+        # Bumped by every invalidation, so values loaded before one aren't stored.
+        self.generation = 0
+
+    def get(self, key, load):
+        # Return the value cached for the key (a string), or load it with `load()` and
+        # cache it.
+        with self.lock:
+            value = self._get_from_memory(key)
+            if value is _MISSING and self.directory is not None:
+                value = self._get_from_disk(key)
+            generation = self.generation
+
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = load()
+        size = self.measure(value)
+        data = self.encode(value) if self.directory is not None else None
+        with self.lock:
+            if generation == self.generation:
+                stored_at = self.clock()
+                self._store_in_memory(key, value, size, stored_at)
+                if data is not None:
+                    self._store_on_disk(key, data, stored_at)
+
+        return value
+
+    def invalidate(self):
+        # Drop every value, including those being loaded.
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.size = 0
+            for name in list(self.files):
+                self._remove_file(name)
+
+    def _expired(self, stored_at):
+        return self.clock() - stored_at >= self.ttl
+
+    def _get_from_memory(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return _MISSING
+
+        value, size, stored_at = entry
+        if self._expired(stored_at):
+            del self.entries[key]
+            self.size -= size
+            return _MISSING
+
+        self.entries.move_to_end(key)
+        return value
+
+    def _store_in_memory(self, key, value, size, stored_at):
+        if size > self.max_bytes:
+            return
+
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= previous[1]
+        self.entries[key] = (value, size, stored_at)
+        self.size += size
+
+        while self.size > self.max_bytes:
+            _, (_, evicted_size, _) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+
+    # The disk tier is only an optimization, so failing to use it is ignored. Each file
+    # holds a JSON header line, with the key and when the value was stored, followed by
+    # the encoded value.
+
+    def _file_name(self, key):
+        return (
+            hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest() + ".json"
+        )
+
+    def _index_files(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with os.scandir(self.directory) as entries:
+                files = [
+                    (entry.stat().st_mtime, entry.name, entry.stat().st_size)
+                    for entry in entries
+                    if entry.name.endswith(".json")
+                ]
+        except OSError:
+            self.directory = None
+            return
+
+        for _, name, size in sorted(files):
+            self.files[name] = size
+            self.disk_size += size
+
+    def _get_from_disk(self, key):
+        name = self._file_name(key)
+        if name not in self.files:
+            return _MISSING
+
+        try:
+            with open(os.path.join(self.directory, name), "rb") as file:
+                header = codec.loads(file.readline())
+                data = file.read()
+        except (OSError, ValueError):
+            self._remove_file(name)
+            return _MISSING
+
+        if header.get("key") != key or self._expired(header["stored_at"]):
+            self._remove_file(name)
+            return _MISSING
+
+        self.files.move_to_end(name)
+        value = self.decode(data)
+        self._store_in_memory(key, value, self.measure(value), header["stored_at"])
+        return value
+
+    def _store_on_disk(self, key, data, stored_at):
+        header = codec.dumps({"key": key, "stored_at": stored_at}).encode("utf-8")
+        size = len(header) + 1 + len(data)
+        if size > self.disk_max_bytes:
+            return
+
+        name = self._file_name(key)
+        path = os.path.join(self.directory, name)
+        try:
+            # Write the file aside first, so it's never read half-written.
+            with open(path + ".tmp", "wb") as file:
+                file.write(header + b"\n" + data)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            return
+
+        self.disk_size -= self.files.pop(name, 0)
+        self.files[name] = size
+        self.disk_size += size
+
+        while self.disk_size > self.disk_max_bytes:
+            self._remove_file(next(iter(self.files)))
+
+    def _remove_file(self, name):
+        self.disk_size -= self.files.pop(name, 0)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
@@ -0,0 +1,59 @@
+import json
+
+# Import local configuration settings and utility functions.
+from . import config
+from . import utils
+
+# orjson is an optional dependency: a native JSON library several times faster than the
+# json module, used when it's installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The JSON library in use, "orjson" or "json".
+backend = None
+
+
+def use_backend(name):
+    # Switch the JSON library in use. "auto" picks orjson when it's installed.
+    global backend
+    if name == "auto":
+        name = "json" if orjson is None else "orjson"
+    if name not in ("json", "orjson"):
+        raise ValueError(f"Unknown JSON backend: {name}")
+    if name == "orjson" and orjson is None:
+        raise ValueError("The orjson backend is not installed")
+
+    backend = name
+
+
+def dumps(value):
+    # Encode a value as compact JSON, with the Decimals read from DynamoDB as numbers.
+    # Both libraries give the same text.
+    if backend == "orjson":
+        try:
+            return orjson.dumps(
+                value, default=utils.decimal_to_number, option=orjson.OPT_NON_STR_KEYS
+            ).decode("utf-8")
+        except TypeError:
+            # orjson doesn't encode integers past 64 bits, the json module does.
+            pass
+
+    return json.dumps(
+        value,
+        default=utils.decimal_to_number,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+
+
+def loads(data):
+    # Parse a JSON document, given as text or UTF-8 bytes.
+    if backend == "orjson":
+        return orjson.loads(data)
+
+    return json.loads(data)
+
+
+use_backend(config.JSON_BACKEND)
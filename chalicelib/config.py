@@ -1,22 +1,212 @@
-# The endpoint URL for the random user data API.
-USERS_ENDPOINT = "https://random-data-api.com/api/v2/users"
+import os
+
+# The endpoint URL for the random user data API. It can be pointed to a local
+# stand-in (see `test_tools/random_data_api.py`) with the USERS_ENDPOINT variable.
+USERS_ENDPOINT = os.environ.get(
+    "USERS_ENDPOINT", "https://random-data-api.com/api/v2/users"
+)
+
+# Set this environment variable to skip the checks that create missing AWS resources
+# (log group and streams, queue and table) when the infrastructure is known to exist.
+SKIP_PROVISIONING_CHECKS_ENV_VAR = "SKIP_PROVISIONING_CHECKS"
+
+# Once a resource has been checked, a marker file is written here so that later
+# cold starts in the same execution environment can skip its check.
+PROVISIONED_MARKER_PATH = "/tmp/daily-ai-coding-task.{resource}.provisioned"
+
+# The maximum number of messages sent to the DLQ in a single batch (an SQS limit).
+DLQ_BATCH_SIZE = 10
+
+# How many times a DLQ batch entry is sent before giving up on it.
+DLQ_MAX_SEND_ATTEMPTS = 3
 
 # The number of API calls allowed per minute to avoid rate limiting.
 API_CALLS_PER_MINUTE = 75
 
+# The API calls budget is shared by every Lambda instance through a token bucket kept
+# in the state table under this key. It holds at most RATE_LIMIT_BURST tokens, and is
+# refilled at API_CALLS_PER_MINUTE.
+RATE_LIMIT_KEY = "rate_limit#users_api"
+RATE_LIMIT_BURST = 10
+
+# The tokens an instance takes from the shared bucket at once, and how long it may keep
+# the ones it hasn't used yet.
+RATE_LIMIT_RESERVATION_SIZE = 5
+RATE_LIMIT_RESERVATION_TTL_SECONDS = 5
+
+# The maximum number of attempts of an API call that fails with a transient error, and
+# the bounds of the exponential backoff between them, in seconds.
+RETRY_MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY_SECONDS = 0.5
+RETRY_MAX_DELAY_SECONDS = 10
+
+# The API responses worth retrying: rate limiting and server-side errors.
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# The number of consecutive failed API calls after which a fetch stops calling the API.
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5
+
+# The maximum number of API calls kept in flight at the same time during a fetch.
+MAX_CONCURRENT_CALLS = 5
+
+# API calls go through a pool of connections shared by every fetcher of the process, so
+# warm invocations reuse them. It keeps up to HTTP_POOL_MAXSIZE connections per host (and
+# at least MAX_CONCURRENT_CALLS).
+HTTP_POOL_MAXSIZE = 10
+
+# The seconds to wait for a connection to the API, and between two reads of a response.
+HTTP_CONNECT_TIMEOUT_SECONDS = 3.05
+HTTP_READ_TIMEOUT_SECONDS = 10
+
+# Idle connections are probed with TCP keep-alives, after HTTP_KEEPALIVE_IDLE_SECONDS and
+# then every HTTP_KEEPALIVE_INTERVAL_SECONDS, so they outlive the 350 seconds after
+# which NAT gateways drop idle connections.
+HTTP_KEEPALIVE_IDLE_SECONDS = 60
+HTTP_KEEPALIVE_INTERVAL_SECONDS = 30
+
+# The maximum number of fetched pages waiting to be written into DynamoDB.
+PIPELINE_QUEUE_DEPTH = 4
+
+# Whether fetches stream the users of each response into DynamoDB as they're parsed,
+# handing them to the writer in batches instead of whole pages, so memory use doesn't
+# grow with the page size. Responses are then read STREAM_CHUNK_SIZE bytes at a time.
+STREAM_INGESTION = os.environ.get("STREAM_INGESTION", "").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# The JSON library used for API responses, log events, queue messages and stored state:
+# "orjson" when it's installed and "auto" is set, or the standard "json" module.
+JSON_BACKEND = os.environ.get("JSON_BACKEND", "auto")
+
 # The number of days to retain data in CloudWatch.
 RETENTION_PERIOD_IN_DAYS = 30
 
 # The name of the log group in CloudWatch
 LOG_GROUP = "DailyAIDataFetcher"
 
+# The name of the DynamoDB table holding small state items, such as the latest status.
+STATE_TABLE = "fetcher_state"
+
+# The key of the state item holding the status of the latest fetch run.
+LATEST_STATUS_KEY = "latest_status"
+
+# The key of the state item holding the checkpoint of a fetch run that ran out of time,
+# so the next run resumes its plan instead of starting over.
+CHECKPOINT_KEY = "fetch_checkpoint"
+
+# The time left before the invocation's deadline when a fetch stops starting new calls,
+# to write the pending pages, flush the logs and store the checkpoint.
+FETCH_DEADLINE_MARGIN_MILLIS = 10000
+
+# The SQS queue holding the fetch jobs requested through the API, and how long a
+# received job stays invisible to other workers (it must outlast the worker's timeout).
+JOBS_QUEUE = "fetch-jobs"
+JOBS_VISIBILITY_TIMEOUT_SECONDS = 960
+
+# The prefix of the state items holding the progress of each job.
+JOB_KEY_PREFIX = "job#"
+
+# The minimum time between two progress updates of a running job.
+JOB_PROGRESS_INTERVAL_SECONDS = 2
+
+# The users fetched by each work item of a fan-out job, that is, by each worker run.
+FANOUT_SLICE_USERS = 500
+
+# The maximum number of users of a fan-out job. Its slices are all enqueued within the
+# request that creates it, which must answer before API Gateway times out.
+FANOUT_MAX_USERS = 50000
+
+# API Gateway times out integrations after 29 seconds, whatever the Lambda timeout is.
+API_GATEWAY_TIMEOUT_MILLIS = 29000
+
 # Log stream names for different types of logs within the log group.
 ERROR_LOG_STREAM = "Error"  # Log stream for error messages.
 STATUS_LOG_STREAM = "Status"  # Log stream for status updates.
 INFO_LOG_STREAM = "Info"  # Log stream for informational messages.
 
-# A tuple representing the minimum and maximum number of users to fetch per API call.
-USERS_PER_API_CALL = (1, 150)
+# How often, in seconds, a buffered event logger flushes its events in the background.
+LOG_FLUSH_INTERVAL_SECONDS = 5
+
+# PutLogEvents limits: events per batch, bytes per batch (each event counts its UTF-8
+# message size plus a fixed overhead), and the time span covered by a single batch.
+LOG_BATCH_MAX_EVENTS = 10000
+LOG_BATCH_MAX_BYTES = 1048576
+LOG_EVENT_OVERHEAD_BYTES = 26
+LOG_BATCH_MAX_SPAN_MILLIS = 24 * 60 * 60 * 1000
+
+# The maximum number of users the API returns per call. Larger requests are rejected
+# with "Maximum allowed size is 100"; if the server reports a smaller cap, it's used
+# for the rest of the run.
+MAX_USERS_PER_API_CALL = 100
+
+# A tuple indicating the range of the number of users to fetch in each data fetch operation.
+USERS_PER_FETCH = (1, 2000)
+
+# The maximum number of items written by a single BatchWriteItem call (a DynamoDB limit).
+DYNAMODB_BATCH_WRITE_SIZE = 25
+
+# The errors DynamoDB answers a request with when it exceeds the table's capacity.
+DYNAMODB_THROTTLING_ERROR_CODES = (
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+)
+
+# Once DynamoDB throttles a write, writes are paced to a rate of write capacity units
+# per second. It starts at WRITE_THROTTLE_DECREASE times the capacity consumed over the
+# last second, grows by WRITE_THROTTLE_INCREASE after every batch that goes through and
+# is multiplied by WRITE_THROTTLE_DECREASE after every throttled one, within the given
+# bounds (the maximum is the default per-table quota).
+WRITE_THROTTLE_MIN_RATE = 1
+WRITE_THROTTLE_MAX_RATE = 40000
+WRITE_THROTTLE_INCREASE = 5
+WRITE_THROTTLE_DECREASE = 0.5
+
+# The maximum number of keys read by a single BatchGetItem call (a DynamoDB limit).
+DYNAMODB_BATCH_GET_SIZE = 100
+
+# Every element is written along with a hash of its content, in this attribute, and
+# elements whose content is unchanged aren't written again. The hashes written by a warm
+# instance are cached, up to DEDUP_MAX_CACHED_KEYS keys. With DEDUP_LOOKUP_STORED_HASHES
+# set, the other ones are read from the table, which costs a fraction of the write
+# capacity a rewrite would, but takes read capacity from /view-data. The elements whose
+# hash can't be read, e.g. when reads are throttled, are written anyway.
+CONTENT_HASH_ATTRIBUTE = "content_hash"
+DEDUP_MAX_CACHED_KEYS = 100000
+DEDUP_LOOKUP_STORED_HASHES = os.environ.get(
+    "DEDUP_LOOKUP_STORED_HASHES", ""
+).lower() in ("1", "true", "yes")
+
+# The maximum number of BatchWriteItem calls in flight at the same time while adding
+# elements to a table.
+WRITE_MAX_CONCURRENCY = 4
+
+# How many times a batch write is attempted while DynamoDB throttles it or leaves items
+# unprocessed, and the bounds of the exponential backoff between the attempts.
+WRITE_RETRY_MAX_ATTEMPTS = 5
+WRITE_RETRY_BASE_DELAY_SECONDS = 0.1
+WRITE_RETRY_MAX_DELAY_SECONDS = 5
+
+# The number of segments scanned in parallel when reading the whole users table.
+SCAN_TOTAL_SEGMENTS = 4
+
+# The default and maximum number of users returned by a single /view-data page.
+VIEW_DATA_DEFAULT_LIMIT = 25
+VIEW_DATA_MAX_LIMIT = 100
+
+# The pages of users read by /view-data are cached for VIEW_CACHE_TTL_SECONDS (0 turns
+# the cache off), and dropped as soon as the instance writes users. Users written by
+# other instances show up once the pages cached before expire.
+VIEW_CACHE_TTL_SECONDS = int(os.environ.get("VIEW_CACHE_TTL_SECONDS", 60))
+
+# The memory budget of the cache, in bytes the decoded pages are estimated to take. The
+# least recently read pages are evicted past it.
+VIEW_CACHE_MAX_BYTES = int(os.environ.get("VIEW_CACHE_MAX_BYTES", 16 * 1024 * 1024))
 
-# A tuple indicating the range of number of calls to make for each data fetch operation.
-USERS_CALLS_PER_FETCH = (1, 20)
+# Pages can also be cached in files of this directory (e.g. under /tmp), within their
+# own budget, so a new process of a warm environment doesn't read them again.
+VIEW_CACHE_DIR = os.environ.get("VIEW_CACHE_DIR")
+VIEW_CACHE_DISK_MAX_BYTES = 64 * 1024 * 1024
@@ -1,17 +1,27 @@
-import json
+import threading
 from botocore.exceptions import ClientError
+from chalicelib import codec
+from chalicelib import config
 from chalicelib.events import EventLogger
 
 
 class DeadLetterQueue:
     # Initialize DLQ with AWS SQS resource and an event logger for monitoring.
-    def __init__(self, sqs_resource, event_logger: EventLogger):
+    # When `provision` is False, the queue is only looked up on the first send.
+    # When `buffered` is True, messages are grouped and sent in batches by `flush()`.
+    def __init__(
+        self, sqs_resource, event_logger: EventLogger, provision=True, buffered=False
+    ):
         self.sqs = sqs_resource
         self.queue_name = "dlq"
         self.queue_url = None  # Queue URL will be determined dynamically.
         self.event_logger = event_logger
+        self.buffered = buffered
+        self.buffer = []
+        self.buffer_lock = threading.Lock()
 
-        self._create_queue_if_not_exists()  # Ensure queue exists during object initialization.
+        if provision:
+            self._create_queue_if_not_exists()  # Ensure queue exists during object initialization.
 
     # Checks for the existence of the queue and creates it if it does not exist.
     def _create_queue_if_not_exists(self):
@@ -46,11 +56,31 @@ class DeadLetterQueue:
     # Sends a message to the DLQ.
     def send(self, message, attributes=None):
         attributes = attributes or {}
+
+        # Buffered messages wait until there's a full batch or until the next flush.
+        if self.buffered:
+            with self.buffer_lock:
+                self.buffer.append(
+                    {
+                        "MessageBody": codec.dumps(message),
+                        "MessageAttributes": attributes,
+                    }
+                )
+                full = len(self.buffer) >= config.DLQ_BATCH_SIZE
+
+            if full:
+                self.flush()
+            return
+
+        # Look up (or create) the queue if it wasn't done during initialization.
+        if self.queue_url is None:
+            self._create_queue_if_not_exists()
+
         try:
             # Serialize message to JSON for SQS compatibility.
             self.sqs.send_message(
                 QueueUrl=self.queue_url,
-                MessageBody=json.dumps(message),
+                MessageBody=codec.dumps(message),
                 MessageAttributes=attributes,
             )
             # Log every message sent for traceability.
@@ -64,3 +94,62 @@ class DeadLetterQueue:
                     "message": f"Failed to send message to DLQ {self.queue_name}. Error: {e}"
                 }
             )
+
+    # Sends every buffered message, in batches.
+    def flush(self):
+        with self.buffer_lock:
+            messages, self.buffer = self.buffer, []
+
+        if not messages:
+            return
+
+        # Look up (or create) the queue if it wasn't done during initialization.
+        if self.queue_url is None:
+            self._create_queue_if_not_exists()
+
+        for i in range(0, len(messages), config.DLQ_BATCH_SIZE):
+            self._send_batch(messages[i : i + config.DLQ_BATCH_SIZE])
+
+    # Sends a batch of messages, retrying only the entries that failed on SQS's side.
+    def _send_batch(self, messages):
+        entries = {str(i): message for i, message in enumerate(messages)}
+        sent = 0
+        errors = []
+
+        for _ in range(config.DLQ_MAX_SEND_ATTEMPTS):
+            try:
+                response = self.sqs.send_message_batch(
+                    QueueUrl=self.queue_url,
+                    Entries=[{"Id": i, **message} for i, message in entries.items()],
+                )
+            except Exception as e:
+                # The whole request failed, so every entry is retried.
+                errors = [str(e)]
+                continue
+
+            sent += len(response.get("Successful", []))
+            errors = []
+            retryable = {}
+            for failure in response.get("Failed", []):
+                errors.append(failure.get("Message", failure["Code"]))
+                # Entries rejected because of the request itself would fail again.
+                if not failure["SenderFault"]:
+                    retryable[failure["Id"]] = entries[failure["Id"]]
+
+            entries = retryable
+            if not entries:
+                break
+
+        # Log a single line per batch for traceability.
+        if sent:
+            self.event_logger.info(
+                event={"message": f"Sent {sent} messages to DLQ {self.queue_name}"}
+            )
+
+        # Log failures to send messages to ensure visibility into delivery issues.
+        if errors:
+            self.event_logger.error(
+                event={
+                    "message": f"Failed to send {len(messages) - sent} messages to DLQ {self.queue_name}. Errors: {errors}"
+                }
+            )
@@ -1,18 +1,37 @@
-import json
+import threading
 
 # Import configuration settings and utility functions from the local package.
+from . import codec
 from . import config
 from . import utils
 
 
 # Define a class to handle event logging with AWS CloudWatch.
+# When `buffered` is set, events are queued in memory and sent in batches, either by
+# a background thread every `flush_interval` seconds or by an explicit `flush()`.
+# Set `provision` to False to skip creating the log group and streams.
 class EventLogger:
-    def __init__(self, client):
+    def __init__(self, client, buffered=False, flush_interval=None, provision=True):
         try:
             # Initialize with an AWS client and create necessary log groups and streams.
             self.client = client
-            self._create_log_group()
-            self._create_log_streams()
+            if provision:
+                self._create_log_group()
+                self._create_log_streams()
+
+            # Set up the in-memory buffers, one per log stream.
+            self.buffered = buffered
+            self.buffers = {}
+            self.buffer_lock = threading.Lock()
+            self.flush_lock = threading.Lock()
+            self.stop_flushing = threading.Event()
+            self.flush_thread = None
+
+            if buffered and flush_interval:
+                self.flush_thread = threading.Thread(
+                    target=self._flush_periodically, args=(flush_interval,), daemon=True
+                )
+                self.flush_thread.start()
         except Exception as e:
             # If initialization fails, print an error and re-raise the exception.
             print("[FATAL] Could not initialize EventLogger", e)
@@ -78,15 +97,60 @@ class EventLogger:
         self._log_event(log_stream_name=config.STATUS_LOG_STREAM, event=event)
 
     def peek_status(self):
-        # Retrieve the latest status event.
-        events = self._get_events(config.STATUS_LOG_STREAM, limit=1)
+        # Retrieve the latest status event, reading the stream from its end.
+        events = self._get_events(
+            config.STATUS_LOG_STREAM, limit=1, start_from_head=False
+        )
 
         # If there is a status event, return it as a JSON object.
         if len(events) > 0:
-            return json.loads(events[0]["message"])
+            return codec.loads(events[0]["message"])
 
         return None
 
+    def flush(self):
+        # Send every buffered event, in as few PutLogEvents calls as the limits allow.
+        # Each stream is sent on its own, so one failing doesn't hold back the others:
+        # its unsent events go back to its buffer for the next flush, and the first
+        # failure is raised once every stream was tried.
+        with self.flush_lock:
+            with self.buffer_lock:
+                buffers, self.buffers = self.buffers, {}
+
+            failure = None
+            for log_stream_name, events in buffers.items():
+                batches = list(self._split_in_batches(events))
+                for i, batch in enumerate(batches):
+                    try:
+                        self._put_log_events(log_stream_name, batch)
+                    except Exception as e:
+                        unsent = [event for pending in batches[i:] for event in pending]
+                        with self.buffer_lock:
+                            buffer = self.buffers.setdefault(log_stream_name, [])
+                            buffer[:0] = unsent
+                        failure = failure or e
+                        break
+
+            if failure is not None:
+                raise failure
+
+    def close(self):
+        # Stop the background flushing thread, if any, and flush what's left.
+        self.stop_flushing.set()
+        if self.flush_thread is not None:
+            self.flush_thread.join()
+
+        self.flush()
+
+    def _flush_periodically(self, flush_interval):
+        # Flush the buffers every `flush_interval` seconds until asked to stop.
+        while not self.stop_flushing.wait(flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                # There's nowhere else to report a failure, so print it.
+                print("[ERROR] Could not flush buffered events", e)
+
     def _log_event(self, log_stream_name, event):
         # Log a single event to the specified log stream.
         self._log_events(log_stream_name, events=[event])
@@ -97,6 +161,21 @@ class EventLogger:
             if "timestamp" not in event:
                 event["timestamp"] = utils.get_timestamp_millis()
 
+        # Send the log events right away, unless they have to be buffered.
+        if not self.buffered:
+            self._put_log_events(log_stream_name, events)
+            return
+
+        with self.buffer_lock:
+            buffer = self.buffers.setdefault(log_stream_name, [])
+            buffer.extend(events)
+            full = len(buffer) >= config.LOG_BATCH_MAX_EVENTS
+
+        # Don't let a single buffer grow past what fits in one batch.
+        if full:
+            self.flush()
+
+    def _put_log_events(self, log_stream_name, events):
         # Send the log events to the specified log stream in AWS CloudWatch.
         self.client.put_log_events(
             logGroupName=config.LOG_GROUP,
@@ -104,12 +183,42 @@ class EventLogger:
             logEvents=events,
         )
 
-    def _get_events(self, log_stream_name, limit=100):
+    @staticmethod
+    def _split_in_batches(events):
+        # PutLogEvents requires the events of a batch to be in chronological order.
+        events = sorted(events, key=lambda e: e["timestamp"])
+
+        batch = []
+        batch_bytes = 0
+        for event in events:
+            event_bytes = (
+                len(event["message"].encode("utf-8")) + config.LOG_EVENT_OVERHEAD_BYTES
+            )
+
+            # Start a new batch when adding this event would break any of the limits.
+            if batch and (
+                len(batch) >= config.LOG_BATCH_MAX_EVENTS
+                or batch_bytes + event_bytes > config.LOG_BATCH_MAX_BYTES
+                or event["timestamp"] - batch[0]["timestamp"]
+                > config.LOG_BATCH_MAX_SPAN_MILLIS
+            ):
+                yield batch
+                batch = []
+                batch_bytes = 0
+
+            batch.append(event)
+            batch_bytes += event_bytes
+
+        if batch:
+            yield batch
+
+    def _get_events(self, log_stream_name, limit=100, start_from_head=False):
         # Retrieve a list of events from the specified log stream.
         response = self.client.get_log_events(
             logGroupName=config.LOG_GROUP,
             logStreamName=log_stream_name,
             limit=limit,
+            startFromHead=start_from_head,
         )
 
         return response["events"]
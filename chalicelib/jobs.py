@@ -0,0 +1,324 @@
+import threading
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+
+# Import local configuration settings and utility functions.
+from . import codec
+from . import config
+from . import services
+from . import utils
+
+# A fan-out job is split into slices, fetched in parallel by many workers.
+FANOUT = "fanout"
+
+# The states a job goes through. An interrupted job ran out of time, and the next run
+# resumes its plan.
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+INTERRUPTED = "interrupted"
+FAILED = "failed"
+
+
+# Define the SQS queue that hands fetch jobs over to the workers.
+class JobQueue:
+    # The queue is looked up, or created, on the first job sent.
+    def __init__(self, sqs_client, event_logger):
+        self.sqs = sqs_client
+        self.event_logger = event_logger
+        self.queue_url = None
+
+    def send(self, message):
+        # Enqueue a job, or a slice of one. Its state lives in the state table.
+        self.send_batch([message])
+
+    def send_batch(self, messages):
+        # Enqueue many messages, in as few calls as SQS allows.
+        if self.queue_url is None:
+            self.queue_url = self._get_queue_url()
+
+        for i in range(0, len(messages), config.DLQ_BATCH_SIZE):
+            batch = messages[i : i + config.DLQ_BATCH_SIZE]
+            response = self.sqs.send_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {"Id": str(n), "MessageBody": codec.dumps(message)}
+                    for n, message in enumerate(batch)
+                ],
+            )
+
+            # Messages that weren't enqueued would never run.
+            if response.get("Failed"):
+                raise RuntimeError(
+                    f"Couldn't enqueue {len(response['Failed'])} messages: "
+                    f"{response['Failed'][0].get('Message')}"
+                )
+
+    def _get_queue_url(self):
+        try:
+            return self.sqs.get_queue_url(QueueName=config.JOBS_QUEUE)["QueueUrl"]
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in (
+                "AWS.SimpleQueueService.NonExistentQueue",
+                "QueueDoesNotExist",
+            ):
+                raise
+
+        response = self.sqs.create_queue(
+            QueueName=config.JOBS_QUEUE,
+            Attributes={
+                "VisibilityTimeout": str(config.JOBS_VISIBILITY_TIMEOUT_SECONDS)
+            },
+        )
+        self.event_logger.info(
+            event={"message": f"Queue created: {response['QueueUrl']}"}
+        )
+        return response["QueueUrl"]
+
+
+def job_key(job_id):
+    # Return the key of the state item holding the job.
+    return f"{config.JOB_KEY_PREFIX}{job_id}"
+
+
+def create_job(state_table, job_queue, target_users=None):
+    # Record a new job and enqueue it, returning its initial state. Without a target,
+    # the job resumes an interrupted run or fetches a random number of users.
+    job = {
+        "id": uuid.uuid4().hex,
+        "state": QUEUED,
+        "created_at": utils.get_timestamp_millis(),
+        "updated_at": utils.get_timestamp_millis(),
+        "target_users": target_users,
+        "status": None,
+    }
+    state_table.put_state(job_key(job["id"]), job)
+
+    try:
+        job_queue.send({"job_id": job["id"]})
+    except Exception as e:
+        # The job will never run, so don't leave it queued.
+        _update_job(state_table, job, state=FAILED, error=str(e))
+        raise
+
+    return job
+
+
+def create_fanout_job(state_table, job_queue, target_users, slice_users=None):
+    # Record a new fan-out job and enqueue one work item per slice of users, returning
+    # the job. Every worker reduces its slice's status into the job's counters.
+    slice_users = slice_users or config.FANOUT_SLICE_USERS
+    slices = [
+        min(slice_users, target_users - start)
+        for start in range(0, target_users, slice_users)
+    ]
+    job = {
+        "id": uuid.uuid4().hex,
+        "mode": FANOUT,
+        "state": RUNNING,
+        "created_at": utils.get_timestamp_millis(),
+        "updated_at": utils.get_timestamp_millis(),
+        "target_users": target_users,
+        "status": None,
+    }
+    state_table.put_state(job_key(job["id"]), job)
+    state_table.add_counters(job_key(job["id"]), {"slices": len(slices)})
+
+    try:
+        job_queue.send_batch(
+            [
+                {"job_id": job["id"], "slice": i, "users": users}
+                for i, users in enumerate(slices)
+            ]
+        )
+    except Exception as e:
+        # The job would never complete, so don't leave it running. The workers skip
+        # the slices that were enqueued before the failure.
+        _update_job(state_table, job, state=FAILED, error=str(e))
+        raise
+
+    return get_job(state_table, job["id"])
+
+
+def get_job(state_table, job_id):
+    # Return the current state of the job, or None if there's no such job.
+    job = state_table.get_state(job_key(job_id))
+
+    # The state of a fan-out job is the sum of its slices, unless it failed to start.
+    if job is not None and job.get("mode") == FANOUT and job["state"] != FAILED:
+        counters = state_table.get_counters(job_key(job_id))
+        done = counters.get("slices_done", 0) >= counters.get("slices", 0)
+        job["state"] = COMPLETED if done else RUNNING
+        job["slices"] = counters.get("slices", 0)
+        job["slices_done"] = counters.get("slices_done", 0)
+        job["status"] = _fanout_status(job, counters)
+
+    return job
+
+
+def handle_message(data_fetcher, state_table, job_queue, message, remaining_time=None):
+    # Run the job, or the slice of a fan-out job, carried by a message of the queue.
+    if "slice" in message:
+        return run_slice(data_fetcher, state_table, job_queue, message, remaining_time)
+
+    return run_job(data_fetcher, state_table, message["job_id"], remaining_time)
+
+
+def run_job(data_fetcher, state_table, job_id, remaining_time=None):
+    # Run the fetch of a queued job, recording its progress along the way.
+    job = get_job(state_table, job_id)
+    if job is None:
+        data_fetcher.event_logger.error(
+            event={"message": f"Job {job_id} not found, skipping it."}
+        )
+        return None
+
+    # SQS delivers messages at least once, so finished jobs are never run again.
+    if job["state"] in (COMPLETED, INTERRUPTED, FAILED):
+        return job
+
+    job = _update_job(state_table, job, state=RUNNING)
+
+    # Store the progress at most every few seconds, to keep writes to the table low.
+    lock = threading.Lock()
+    last_update = [time.monotonic()]
+
+    def on_progress(status):
+        with lock:
+            if time.monotonic() - last_update[0] < config.JOB_PROGRESS_INTERVAL_SECONDS:
+                return
+            last_update[0] = time.monotonic()
+            _update_job(state_table, job, status=status)
+
+    try:
+        status = data_fetcher.fetch(
+            target_users=job.get("target_users"),
+            remaining_time=remaining_time,
+            on_progress=on_progress,
+        )
+    except Exception as e:
+        # Don't let the message be redelivered, rerunning a fetch that keeps failing.
+        data_fetcher.event_logger.error(event={"message": f"Job {job_id} failed: {e}"})
+        with lock:
+            return _update_job(state_table, job, state=FAILED, error=str(e))
+
+    with lock:
+        return _update_job(
+            state_table,
+            job,
+            state=INTERRUPTED if status["remaining_users"] else COMPLETED,
+            status=status,
+        )
+
+
+def run_slice(data_fetcher, state_table, job_queue, message, remaining_time=None):
+    # Fetch a slice of a fan-out job, and add its status to the job's counters.
+    key = job_key(message["job_id"])
+    job = state_table.get_state(key)
+    if job is None or job["state"] == FAILED:
+        data_fetcher.event_logger.error(
+            event={
+                "message": f"Job {message['job_id']} not found or failed, skipping slice {message['slice']}."
+            }
+        )
+        return None
+
+    # SQS delivers messages at least once, so a slice that was counted already isn't
+    # fetched again.
+    if state_table.was_applied(key, f"slice-{message['slice']}"):
+        return None
+
+    try:
+        status = data_fetcher.fetch(
+            target_users=message["users"], remaining_time=remaining_time, record=False
+        )
+        split_slice = f"{message['slice']}.1"
+        if status["remaining_users"]:
+            # Hand the users this worker didn't get to over to another one, as a new
+            # slice. It's counted before this one is done, so the job never looks
+            # complete in between, and enqueued by every delivery of this slice, since
+            # an earlier one may have failed to. Its copies are only counted once.
+            state_table.add_counters(
+                key, {"slices": 1}, once=f"split-{message['slice']}"
+            )
+            job_queue.send(
+                {
+                    "job_id": message["job_id"],
+                    "slice": split_slice,
+                    "users": status["remaining_users"],
+                }
+            )
+        elif state_table.was_applied(key, f"split-{message['slice']}"):
+            # An earlier delivery split this slice, but this one fetched every user, so
+            # the new slice is done with nothing left to fetch.
+            state_table.add_counters(
+                key, {"slices_done": 1}, once=f"slice-{split_slice}"
+            )
+
+        # Each slice is only counted once, even when fetched by several deliveries.
+        counters = state_table.add_counters(
+            key,
+            {
+                "slices_done": 1,
+                "users": status["users"],
+                "api_calls": status["api_calls"],
+                "errors": len(status["errors"]),
+                "write_retries": status.get("write_retries", 0),
+                "dropped_users": status.get("dropped_users", 0),
+                "skipped_users": status.get("skipped_users", 0),
+            },
+            once=f"slice-{message['slice']}",
+        )
+    except Exception as e:
+        # Don't let the message be redelivered until it expires, and don't leave the
+        # job running forever.
+        data_fetcher.event_logger.error(
+            event={
+                "message": f"Slice {message['slice']} of job {message['job_id']} failed: {e}"
+            }
+        )
+        return _update_job(state_table, job, state=FAILED, error=str(e))
+
+    # The worker completing the last slice records the status of the whole job.
+    if counters is not None and counters["slices_done"] == counters["slices"]:
+        state_table.add_counters(
+            key, {"finished_at": utils.get_timestamp_millis()}, once="finished"
+        )
+        job = get_job(state_table, message["job_id"])
+        services.record_status(data_fetcher.event_logger, state_table, job["status"])
+
+    return counters
+
+
+def _fanout_status(job, counters):
+    # Build a fetch status out of the counters of a fan-out job. Only the number of
+    # errors is kept, the errors themselves are in the Error log stream and the DLQ.
+    errors = counters.get("errors", 0)
+    return {
+        "users": counters.get("users", 0),
+        "api_calls": counters.get("api_calls", 0),
+        "errors": (
+            [{"message": f"{errors} API calls failed, see the Error log stream."}]
+            if errors
+            else []
+        ),
+        "timestamp": job["created_at"],
+        "duration": (
+            counters.get("finished_at", utils.get_timestamp_millis())
+            - job["created_at"]
+        )
+        / 1000,
+        "remaining_users": 0,
+        "write_retries": counters.get("write_retries", 0),
+        "dropped_users": counters.get("dropped_users", 0),
+        "skipped_users": counters.get("skipped_users", 0),
+    }
+
+
+def _update_job(state_table, job, **changes):
+    # Apply the changes to the job and store it.
+    job.update(changes, updated_at=utils.get_timestamp_millis())
+    state_table.put_state(job_key(job["id"]), job)
+    return job
@@ -1,21 +1,168 @@
+import hashlib
 import json
+import math
+import os
+import sys
+import threading
+import time
 from abc import ABC
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 
+import boto3
+from boto3.dynamodb.types import TypeDeserializer
+from boto3.dynamodb.types import TypeSerializer
+
 # Import the exception class to handle client errors from AWS SDK.
 from botocore.exceptions import ClientError
 
+# Import local configuration settings.
+from . import codec
+from . import config
+from .cache import ReadThroughCache
+from .cache import deep_size
+from .ratelimit import AdaptiveThrottle
+from .retry import RetryPolicy
+
+
+def build_projection(fields):
+    # Build a ProjectionExpression for the given (possibly nested, dot-separated)
+    # attribute names. Every name is aliased, so reserved words are safe to use.
+    paths = []
+    names = {}
+    for field in fields:
+        path = []
+        for part in field.split("."):
+            alias = f"#f{len(names)}"
+            names[alias] = part
+            path.append(alias)
+        paths.append(".".join(path))
+
+    return ", ".join(paths), names
+
+
+# Marshals the values the fast path below doesn't handle itself, such as sets.
+_type_serializer = TypeSerializer()
+_type_deserializer = TypeDeserializer()
+
+
+def marshal_value(value):
+    # Convert a value, as parsed from JSON, into a DynamoDB AttributeValue. It gives the
+    # same result as boto3's TypeSerializer, minus its generic type checks, and floats
+    # are converted directly rather than through Decimal.
+    kind = type(value)
+    if kind is str:
+        return {"S": value}
+    if kind is dict:
+        return {"M": {k: marshal_value(v) for k, v in value.items()}}
+    if kind is float:
+        if not math.isfinite(value):
+            raise TypeError("Infinity and NaN not supported")
+        # The shortest representation of the float, the same digits as Decimal(str()).
+        text = repr(value)
+        return {"N": text if "e" not in text else str(Decimal(text))}
+    if kind is bool:
+        return {"BOOL": value}
+    if kind is int or kind is Decimal:
+        return {"N": str(value)}
+    if kind is list:
+        return {"L": [marshal_value(v) for v in value]}
+    if value is None:
+        return {"NULL": True}
+    return _type_serializer.serialize(value)
+
+
+def marshal_item(item):
+    # Convert an item into the attribute map of the DynamoDB wire format.
+    return {name: marshal_value(value) for name, value in item.items()}
+
+
+def unmarshal_item(item):
+    # Convert an attribute map of the DynamoDB wire format back into an item.
+    return {name: _type_deserializer.deserialize(value) for name, value in item.items()}
+
+
+def encode_page(page):
+    # Encode a page of items and the key following it, in the wire format so that
+    # numbers are kept exactly.
+    items, last_key = page
+    return codec.dumps(
+        {
+            "items": [marshal_item(item) for item in items],
+            "last_key": marshal_item(last_key) if last_key else None,
+        }
+    ).encode("utf-8")
+
+
+def decode_page(data):
+    # Decode a page encoded by `encode_page`.
+    page = codec.loads(data)
+    last_key = page["last_key"]
+    return (
+        [unmarshal_item(item) for item in page["items"]],
+        unmarshal_item(last_key) if last_key else None,
+    )
+
+
+def page_size(page):
+    # Estimate the bytes a page of items takes in memory from about four of its items,
+    # since the items of a page are alike and measuring every one costs more than
+    # encoding the page.
+    items, last_key = page
+    size = sys.getsizeof(page) + sys.getsizeof(items) + deep_size(last_key)
+    if items:
+        samples = items[:: max(1, len(items) // 4)]
+        size += len(items) * sum(deep_size(item) for item in samples) // len(samples)
+    return size
+
+
+def content_hash(element):
+    # Hash the content of an element, the same whether its numbers are floats or the
+    # Decimals DynamoDB needs.
+    payload = json.dumps(
+        element,
+        sort_keys=True,
+        separators=(",", ":"),
+        default=lambda value: float(value)
+        if isinstance(value, Decimal)
+        else str(value),
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).digest()
+
 
 # Define an abstract base class for a DynamoDB table.
 class DynamoDbTable(ABC):
-    def __init__(self, dynamo_resource, table_name, event_logger):
+    def __init__(self, dynamo_resource, table_name, event_logger, dynamodb_client=None):
         # Initialize with AWS DynamoDB resource, table name, and an event logger.
         self.dynamo_resource = dynamo_resource
         self.table_name = table_name
         self.event_logger = event_logger
         self.table = None
 
+        # Batches are written and read in the wire format, through a plain client
+        # without the resource layer's marshalling. Unless given, it's created on
+        # first use.
+        self.dynamodb_client = dynamodb_client
+        self.dynamodb_client_lock = threading.Lock()
+
+        # Writes are paced against the table's capacity, learnt as they go, and the
+        # throttled ones are retried with backoff.
+        self.write_throttle = AdaptiveThrottle()
+        self.write_retry_policy = RetryPolicy(
+            max_attempts=config.WRITE_RETRY_MAX_ATTEMPTS,
+            base_delay=config.WRITE_RETRY_BASE_DELAY_SECONDS,
+            max_delay=config.WRITE_RETRY_MAX_DELAY_SECONDS,
+        )
+
+        # The hash of the content last written for each key, so unchanged elements
+        # aren't written again. It's kept across runs while the instance is warm.
+        self.content_hashes = {}
+        self.content_hashes_lock = threading.Lock()
+
+        # The cache of the pages read with `get_page`, if any, dropped by every write.
+        self.page_cache = None
+
     def exists(self):
         # Check if the table exists by trying to load it.
         try:
@@ -30,7 +177,7 @@ class DynamoDbTable(ABC):
                 # Log any other exceptions and re-raise them.
                 self.event_logger.error(
                     event={
-                        "message": json.dumps(
+                        "message": codec.dumps(
                             {
                                 "message": f"Could not check for existence of {self.table_name}",
                                 "error_code": e.response["Error"]["Code"],
@@ -41,6 +188,24 @@ class DynamoDbTable(ABC):
                 )
                 raise e
 
+    def client(self):
+        # Return the plain DynamoDB client, created with the resource's region and
+        # endpoint if none was given.
+        with self.dynamodb_client_lock:
+            if self.dynamodb_client is None:
+                meta = self.dynamo_resource.meta.client.meta
+                self.dynamodb_client = boto3.client(
+                    "dynamodb",
+                    region_name=meta.region_name,
+                    endpoint_url=meta.endpoint_url,
+                )
+
+            return self.dynamodb_client
+
+    def bind(self):
+        # Point to the table without checking that it exists, which takes no AWS calls.
+        self.table = self.dynamo_resource.Table(self.table_name)
+
     def create_table(self):
         # Gather table creation parameters from the abstract methods.
         key_schema = self.get_key_schema()
@@ -66,51 +231,272 @@ class DynamoDbTable(ABC):
             )
             raise e
 
-    def add_elements(self, elements):
-        # Batch insert elements into the table.
-        try:
-            with self.table.batch_writer() as w:
-                for e in elements:
-                    # Serialize each element before inserting it.
-                    w.put_item(Item=self.serialize(e))
+    def add_elements(self, elements, max_workers=None):
+        # Write the elements in batches, paced by the write throttle. Batches are
+        # written by up to `max_workers` threads, each retrying the items DynamoDB
+        # throttles or leaves unprocessed with backoff. Elements whose content is
+        # already stored are skipped. Return the number of elements written, skipped
+        # and dropped, and of item writes retried.
+        report = {"written": 0, "skipped": 0, "retried": 0, "dropped": 0}
 
-            # Log the successful addition of elements.
-            self.event_logger.info(
-                event={"message": f"Saved {len(elements)} into {self.table_name}"}
-            )
+        try:
+            # Marshal each changed element before inserting it, along with the hash
+            # of its content.
+            changed = self._changed_elements(elements, report)
+            items = []
+            for digest, element in changed.values():
+                item = self.marshal(element)
+                item[config.CONTENT_HASH_ATTRIBUTE] = {"S": digest.hex()}
+                items.append(item)
         except Exception as e:
-            # Log any exception during data insertion.
+            # Log any exception during serialization and drop the elements.
             self.event_logger.error(
                 event={
                     "message": f"Couldn't save data into table {self.table_name}. Error: {e}",
                 }
             )
+            report["dropped"] = len(elements) - report["skipped"]
+            return report
 
-    def get_elements(self):
-        # Retrieve elements from the table.
-        elements = []
-        try:
-            done = False
-            start_key = None
-            kwargs = {}
+        batches = [
+            items[i : i + config.DYNAMODB_BATCH_WRITE_SIZE]
+            for i in range(0, len(items), config.DYNAMODB_BATCH_WRITE_SIZE)
+        ]
+        max_workers = min(
+            max_workers or config.WRITE_MAX_CONCURRENCY, max(1, len(batches))
+        )
 
-            # Continue scanning until there is no more data.
-            while not done:
-                if start_key:
-                    kwargs["ExclusiveStartKey"] = start_key
+        # A single worker writes the batches in the calling thread, one at a time.
+        if max_workers == 1:
+            outcomes = map(self._write_batch, batches)
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                outcomes = list(executor.map(self._write_batch, batches))
 
-                # Retrieve a batch of elements.
-                response = self.table.scan(**kwargs)
-                elements.extend(response.get("Items", []))
-                start_key = response.get("LastEvaluatedKey", None)
-                done = start_key is None
+        dropped_keys = set()
+        for batch_report, dropped_items in outcomes:
+            for key, value in batch_report.items():
+                report[key] += value
+            dropped_keys.update(self._item_key(item) for item in dropped_items)
+
+        # Remember the content of the elements that were written.
+        for key, (digest, _) in changed.items():
+            if key not in dropped_keys:
+                self._remember_content(key, digest)
+
+        # The cached pages may hold the previous content of the elements written.
+        if report["written"] and self.page_cache is not None:
+            self.page_cache.invalidate()
+
+        # Log the successful addition of elements.
+        if report["written"]:
+            self.event_logger.info(
+                event={"message": f"Saved {report['written']} into {self.table_name}"}
+            )
+
+        return report
+
+    def _changed_elements(self, elements, report):
+        # Return the hash and the element of each key to write, keeping the last
+        # element of every key since a batch can't write a key twice. Elements whose
+        # content was already written are skipped. The hashes stored with the elements
+        # are looked up for the keys this instance hasn't written yet.
+        latest = {}
+        for element in elements:
+            latest[self._element_key(element)] = element
+        report["skipped"] += len(elements) - len(latest)
+
+        changed = {}
+        with self.content_hashes_lock:
+            for key, element in latest.items():
+                digest = content_hash(element)
+                if self.content_hashes.get(key) == digest:
+                    report["skipped"] += 1
+                else:
+                    changed[key] = (digest, element)
+
+        if config.DEDUP_LOOKUP_STORED_HASHES and changed:
+            for key, stored_hash in self._get_stored_hashes(list(changed)).items():
+                digest = changed[key][0]
+                if stored_hash == digest.hex():
+                    del changed[key]
+                    report["skipped"] += 1
+                    self._remember_content(key, digest)
+
+        return changed
+
+    def _get_stored_hashes(self, keys):
+        # Read the content hashes stored with the given keys, reading as little as
+        # possible. Keys that can't be read are left out, so they're written anyway:
+        # those DynamoDB leaves unprocessed, and every key left once reads are throttled.
+        key_names = [k["AttributeName"] for k in self.get_key_schema()]
+        names = {f"#k{i}": name for i, name in enumerate(key_names)}
+        names["#h"] = config.CONTENT_HASH_ATTRIBUTE
+        stored = {}
+
+        for i in range(0, len(keys), config.DYNAMODB_BATCH_GET_SIZE):
+            request = {
+                "Keys": [
+                    marshal_item(dict(zip(key_names, key)))
+                    for key in keys[i : i + config.DYNAMODB_BATCH_GET_SIZE]
+                ],
+                "ProjectionExpression": ", ".join(names),
+                "ExpressionAttributeNames": names,
+            }
+            try:
+                response = self.client().batch_get_item(
+                    RequestItems={self.table_name: request}
+                )
+            except ClientError as e:
+                # Throttled reads only mean some elements are written again.
+                if (
+                    e.response["Error"]["Code"]
+                    in config.DYNAMODB_THROTTLING_ERROR_CODES
+                ):
+                    break
+
+                self.event_logger.error(
+                    event={
+                        "message": f"Couldn't read content hashes from table {self.table_name}. Error: {e}",
+                    }
+                )
+                continue
+
+            for item in response.get("Responses", {}).get(self.table_name, []):
+                if config.CONTENT_HASH_ATTRIBUTE in item:
+                    stored[self._item_key(item)] = item[config.CONTENT_HASH_ATTRIBUTE][
+                        "S"
+                    ]
+
+        return stored
+
+    def _element_key(self, element):
+        # Return the key of an element, comparing numbers the same whatever their type.
+        return tuple(
+            Decimal(str(element[k["AttributeName"]]))
+            if isinstance(element[k["AttributeName"]], (int, float, Decimal))
+            else element[k["AttributeName"]]
+            for k in self.get_key_schema()
+        )
+
+    def _item_key(self, item):
+        # Return the key of an item in the wire format, like `_element_key` does.
+        return tuple(
+            Decimal(value["N"]) if "N" in value else next(iter(value.values()))
+            for value in (item[k["AttributeName"]] for k in self.get_key_schema())
+        )
+
+    def _remember_content(self, key, digest):
+        # Remember the content hash of a key, forgetting the oldest ones past the limit.
+        with self.content_hashes_lock:
+            self.content_hashes.pop(key, None)
+            self.content_hashes[key] = digest
+            if len(self.content_hashes) > config.DEDUP_MAX_CACHED_KEYS:
+                del self.content_hashes[next(iter(self.content_hashes))]
+
+    def _write_batch(self, items):
+        # Write a batch of marshalled items, retrying the ones that are throttled or left
+        # unprocessed, and return the outcome along with the items dropped.
+        report = {"written": 0, "retried": 0, "dropped": 0}
+        requests = [{"PutRequest": {"Item": item}} for item in items]
+        attempt = 1
+
+        while True:
+            self.write_throttle.wait()
+            try:
+                response = self.client().batch_write_item(
+                    RequestItems={self.table_name: requests},
+                    ReturnConsumedCapacity="TOTAL",
+                )
+            except Exception as e:
+                # Writes rejected for any reason other than throttling would fail again.
+                if not (
+                    isinstance(e, ClientError)
+                    and e.response["Error"]["Code"]
+                    in config.DYNAMODB_THROTTLING_ERROR_CODES
+                ):
+                    self.event_logger.error(
+                        event={
+                            "message": f"Couldn't save data into table {self.table_name}. Error: {e}",
+                        }
+                    )
+                    report["dropped"] += len(requests)
+                    return report, [r["PutRequest"]["Item"] for r in requests]
+
+                self.write_throttle.record(0, throttled=True)
+                unprocessed = requests
+            else:
+                unprocessed = response.get("UnprocessedItems", {}).get(
+                    self.table_name, []
+                )
+                consumed = sum(
+                    capacity.get("CapacityUnits", 0)
+                    for capacity in response.get("ConsumedCapacity", [])
+                )
+                written = len(requests) - len(unprocessed)
+                report["written"] += written
+
+                # Without a consumed capacity, count one unit per item written.
+                self.write_throttle.record(
+                    consumed or written, throttled=bool(unprocessed)
+                )
+
+            if not unprocessed:
+                return report, []
+
+            delay = self.write_retry_policy.backoff(attempt)
+            if delay is None:
+                self.event_logger.error(
+                    event={
+                        "message": f"Dropped {len(unprocessed)} items throttled by table {self.table_name} after {attempt} attempts.",
+                    }
+                )
+                report["dropped"] += len(unprocessed)
+                return report, [r["PutRequest"]["Item"] for r in unprocessed]
+
+            report["retried"] += len(unprocessed)
+            time.sleep(delay)
+            requests = unprocessed
+            attempt += 1
+
+    def get_elements(
+        self,
+        total_segments=1,
+        projection_expression=None,
+        expression_attribute_names=None,
+        max_workers=None,
+    ):
+        # Retrieve elements from the table, optionally returning only some attributes.
+        kwargs = {}
+        if projection_expression:
+            kwargs["ProjectionExpression"] = projection_expression
+        if expression_attribute_names:
+            kwargs["ExpressionAttributeNames"] = expression_attribute_names
+
+        try:
+            # A single segment is read with a plain sequential scan.
+            if total_segments <= 1:
+                return self._scan_segment(kwargs)
+
+            # Otherwise, each segment is scanned by its own worker and the results
+            # are concatenated in segment order.
+            segments = [
+                {**kwargs, "Segment": segment, "TotalSegments": total_segments}
+                for segment in range(total_segments)
+            ]
+            with ThreadPoolExecutor(
+                max_workers=max_workers or total_segments
+            ) as executor:
+                elements = []
+                for segment_elements in executor.map(self._scan_segment, segments):
+                    elements.extend(segment_elements)
 
             return elements
         except ClientError as e:
             # Log any exception during retrieval and return an empty list.
             self.event_logger.error(
                 event={
-                    "message": json.dumps(
+                    "message": codec.dumps(
                         {
                             "message": f"Couldn't get elements from table {self.table_name}",
                             "error_code": e.response["Error"]["Code"],
@@ -121,6 +507,83 @@ class DynamoDbTable(ABC):
             )
             return []
 
+    def get_page(
+        self,
+        limit,
+        start_key=None,
+        projection_expression=None,
+        expression_attribute_names=None,
+    ):
+        # Retrieve a single page of at most `limit` elements, starting after `start_key`.
+        kwargs = {"Limit": limit}
+        if start_key:
+            kwargs["ExclusiveStartKey"] = start_key
+        if projection_expression:
+            kwargs["ProjectionExpression"] = projection_expression
+        if expression_attribute_names:
+            kwargs["ExpressionAttributeNames"] = expression_attribute_names
+
+        try:
+            # Return the elements along with the key to resume from, if any. Cached
+            # pages are shared, and mustn't be changed.
+            if self.page_cache is None:
+                return self._scan_page(kwargs)
+
+            key = codec.dumps(
+                [
+                    limit,
+                    marshal_item(start_key) if start_key else None,
+                    projection_expression,
+                    expression_attribute_names,
+                ]
+            )
+            return self.page_cache.get(key, lambda: self._scan_page(kwargs))
+        except ClientError as e:
+            # A key or projection DynamoDB rejects comes from the caller, who has to
+            # know it instead of getting what looks like the end of the data.
+            if e.response["Error"]["Code"] == "ValidationException":
+                raise ValueError(
+                    f"Invalid page request: {e.response['Error']['Message']}"
+                ) from e
+
+            # Log any other exception during retrieval and return an empty page.
+            self.event_logger.error(
+                event={
+                    "message": codec.dumps(
+                        {
+                            "message": f"Couldn't get a page from table {self.table_name}",
+                            "error_code": e.response["Error"]["Code"],
+                            "error_message": e.response["Error"]["Message"],
+                        }
+                    )
+                }
+            )
+            return [], None
+
+    def _scan_page(self, kwargs):
+        # Retrieve a single page, returning its elements and the key to resume from.
+        response = self.table.scan(**kwargs)
+        return response.get("Items", []), response.get("LastEvaluatedKey", None)
+
+    def _scan_segment(self, kwargs):
+        # Scan pages until there is no more data, following LastEvaluatedKey.
+        elements = []
+        done = False
+        start_key = None
+        kwargs = dict(kwargs)
+
+        while not done:
+            if start_key:
+                kwargs["ExclusiveStartKey"] = start_key
+
+            # Retrieve a batch of elements.
+            response = self.table.scan(**kwargs)
+            elements.extend(response.get("Items", []))
+            start_key = response.get("LastEvaluatedKey", None)
+            done = start_key is None
+
+        return elements
+
     # Define abstract methods that subclasses must implement.
     @abstractmethod
     def get_key_schema(self):
@@ -134,6 +597,10 @@ class DynamoDbTable(ABC):
     def serialize(self, element):
         pass
 
+    # Convert the given element into a DynamoDB item in the wire format.
+    def marshal(self, element):
+        return marshal_item(self.serialize(element))
+
     @abstractmethod
     def get_provisioned_throughput(self):
         pass
@@ -141,9 +608,25 @@ class DynamoDbTable(ABC):
 
 # Implement a concrete class for a specific DynamoDB table.
 class UsersTable(DynamoDbTable):
-    def __init__(self, dynamo_resource, event_logger):
+    def __init__(self, dynamo_resource, event_logger, dynamodb_client=None):
         # Initialize the UsersTable with the specific table name "users".
-        super().__init__(dynamo_resource, "users", event_logger)
+        super().__init__(dynamo_resource, "users", event_logger, dynamodb_client)
+
+        # Cache the pages of users read by /view-data, on disk too if configured.
+        if config.VIEW_CACHE_TTL_SECONDS > 0:
+            directory = None
+            if config.VIEW_CACHE_DIR:
+                directory = os.path.join(config.VIEW_CACHE_DIR, self.table_name)
+
+            self.page_cache = ReadThroughCache(
+                encode_page,
+                decode_page,
+                ttl=config.VIEW_CACHE_TTL_SECONDS,
+                max_bytes=config.VIEW_CACHE_MAX_BYTES,
+                directory=directory,
+                disk_max_bytes=config.VIEW_CACHE_DISK_MAX_BYTES,
+                measure=page_size,
+            )
 
     # Return the key schema for the "users" table.
     def get_key_schema(self):
@@ -178,3 +661,163 @@ class UsersTable(DynamoDbTable):
         }
 
         return element
+
+    # Convert the given element into a DynamoDB item in the wire format, straight from
+    # the API's JSON and without changing it. Floats are marshalled as they are, with
+    # the same digits `serialize` gives the coordinates.
+    def marshal(self, element):
+        return marshal_item(element)
+
+
+# Implement a concrete class for a key-value table of small JSON state items.
+class StateTable(DynamoDbTable):
+    def __init__(self, dynamo_resource, event_logger):
+        # Initialize the StateTable with the configured table name.
+        super().__init__(dynamo_resource, config.STATE_TABLE, event_logger)
+
+    # Return the key schema for the state table.
+    def get_key_schema(self):
+        return [
+            {"AttributeName": "name", "KeyType": "HASH"},  # Partition key
+        ]
+
+    # Return the attribute definitions for the state table.
+    def get_attribute_definitions(self):
+        return [
+            {"AttributeName": "name", "AttributeType": "S"},
+        ]
+
+    # Return the provisioned throughput settings for the state table.
+    def get_provisioned_throughput(self):
+        return {
+            "ReadCapacityUnits": 1,
+            "WriteCapacityUnits": 1,
+        }
+
+    # State items are stored as they are.
+    def serialize(self, element):
+        return element
+
+    def put_state(self, name, state):
+        # Store the state as a JSON document, so any JSON value round-trips untouched.
+        self.table.put_item(Item={"name": name, "state": codec.dumps(state)})
+
+    def get_state(self, name):
+        # Read the state with a single strongly consistent key lookup.
+        try:
+            response = self.table.get_item(Key={"name": name}, ConsistentRead=True)
+        except ClientError as e:
+            # Log any exception during retrieval and report the state as missing.
+            self.event_logger.error(
+                event={
+                    "message": codec.dumps(
+                        {
+                            "message": f"Couldn't get state {name} from table {self.table_name}",
+                            "error_code": e.response["Error"]["Code"],
+                            "error_message": e.response["Error"]["Message"],
+                        }
+                    )
+                }
+            )
+            return None
+
+        item = response.get("Item")
+        return codec.loads(item["state"]) if item else None
+
+    def delete_state(self, name):
+        # Remove the state, if there is one.
+        self.table.delete_item(Key={"name": name})
+
+    def add_counters(self, name, counters, once=None):
+        # Atomically add the given increments to counters kept as attributes of the
+        # state item, next to its state, and return every counter after the update.
+        # Concurrent updates never lose increments. When a `once` token is given, the
+        # increments are only applied the first time the token is seen, so that a
+        # repeated update (e.g. a redelivered message) isn't counted twice, and None is
+        # returned for the repeats.
+        names = {f"#c{i}": counter for i, counter in enumerate(counters)}
+        values = {f":c{i}": value for i, value in enumerate(counters.values())}
+        update_expression = "ADD " + ", ".join(
+            f"#c{i} :c{i}" for i in range(len(names))
+        )
+        kwargs = {}
+
+        if once is not None:
+            names["#once"] = "applied_updates"
+            values[":once"] = {once}
+            values[":token"] = once
+            update_expression += ", #once :once"
+            kwargs["ConditionExpression"] = "NOT contains(#once, :token)"
+
+        try:
+            response = self.table.update_item(
+                Key={"name": name},
+                UpdateExpression=update_expression,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+                ReturnValues="ALL_NEW",
+                **kwargs,
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return None
+            raise
+
+        return self._counters(response["Attributes"])
+
+    def was_applied(self, name, once):
+        # Tell whether an update with the given `once` token was applied to the item.
+        response = self.table.get_item(
+            Key={"name": name},
+            ConsistentRead=True,
+            ProjectionExpression="#once",
+            ExpressionAttributeNames={"#once": "applied_updates"},
+        )
+        return once in response.get("Item", {}).get("applied_updates", set())
+
+    def compare_and_set(self, name, attributes, version=None):
+        # Set the given numeric attributes of the state item, only if nobody else has
+        # changed them since they were read at the given `version` (None if they were
+        # never set). Return the new version, or None if the update lost the race.
+        names = {f"#a{i}": attribute for i, attribute in enumerate(attributes)}
+        values = {
+            f":a{i}": Decimal(str(value)) for i, value in enumerate(attributes.values())
+        }
+        names["#version"] = "version"
+        values[":next"] = (version or 0) + 1
+        assignments = [f"#a{i} = :a{i}" for i in range(len(attributes))]
+
+        if version is None:
+            condition = "attribute_not_exists(#version)"
+        else:
+            values[":version"] = version
+            condition = "#version = :version"
+
+        try:
+            self.table.update_item(
+                Key={"name": name},
+                UpdateExpression="SET " + ", ".join(assignments + ["#version = :next"]),
+                ConditionExpression=condition,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return None
+            raise
+
+        return values[":next"]
+
+    def get_counters(self, name):
+        # Read the counters of the state item with a strongly consistent key lookup.
+        response = self.table.get_item(Key={"name": name}, ConsistentRead=True)
+        return self._counters(response.get("Item", {}))
+
+    @staticmethod
+    def _counters(item):
+        # Counters are the numeric attributes of the item.
+        return {
+            key: int(value) if value == int(value) else float(value)
+            for key, value in item.items()
+            if isinstance(value, Decimal)
+        }
@@ -0,0 +1,62 @@
+import math
+import re
+import threading
+
+# Import local configuration settings.
+from . import config
+
+# The error message the API returns when asked for more users than it allows per call.
+MAX_PAGE_SIZE_ERROR = re.compile(r"Maximum allowed size is (\d+)")
+
+
+# Define a thread-safe plan of API calls that fetches a target number of users with
+# as few calls as possible, given the maximum number of users per call.
+class FetchPlanner:
+    def __init__(self, target_users, max_page_size=None):
+        self.lock = threading.Lock()
+        self.target_users = target_users
+        self.max_page_size = max_page_size or config.MAX_USERS_PER_API_CALL
+        self.remaining_users = target_users
+        self.calls_taken = 0
+
+    def take(self):
+        # Hand out the next call as a (call number, page size) pair, or None when the
+        # plan is complete. Every call asks for a full page, except for the last one.
+        with self.lock:
+            if self.remaining_users <= 0:
+                return None
+
+            size = min(self.max_page_size, self.remaining_users)
+            self.remaining_users -= size
+            self.calls_taken += 1
+            return self.calls_taken, size
+
+    def give_back(self, size):
+        # Return the users of a call that didn't fetch them, so they are planned again.
+        with self.lock:
+            self.remaining_users += size
+
+    def cancel(self):
+        # Drop the calls that haven't been taken yet, and return the users they had.
+        with self.lock:
+            skipped_users = max(0, self.remaining_users)
+            self.remaining_users = 0
+            return skipped_users
+
+    def learn_max_page_size(self, max_page_size):
+        # Plan the rest of the run with the maximum page size reported by the server.
+        with self.lock:
+            self.max_page_size = min(self.max_page_size, max_page_size)
+
+    def total_calls(self):
+        # Return the number of calls taken so far plus the ones still needed.
+        with self.lock:
+            return self.calls_taken + math.ceil(
+                self.remaining_users / self.max_page_size
+            )
+
+    @staticmethod
+    def parse_max_page_size(message):
+        # Extract the maximum page size from an API error message, if it is one.
+        match = MAX_PAGE_SIZE_ERROR.search(message or "")
+        return int(match.group(1)) if match else None
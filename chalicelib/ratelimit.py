@@ -0,0 +1,162 @@
+import collections
+import threading
+import time
+
+# Import local configuration settings.
+from . import config
+
+
+# Define a token bucket whose state lives in an item of the state table, so that every
+# Lambda instance (and every thread of each) draws from one global budget of API calls.
+# Tokens are reserved in batches, so most calls take no round trip to DynamoDB.
+class SharedRateLimiter:
+    def __init__(
+        self,
+        state_table,
+        per_minute=None,
+        capacity=None,
+        reservation_size=None,
+        reservation_ttl=None,
+        key=None,
+        clock=time.time,
+        sleep=time.sleep,
+    ):
+        self.state_table = state_table
+        self.rate = (per_minute or config.API_CALLS_PER_MINUTE) / 60
+        self.capacity = capacity or config.RATE_LIMIT_BURST
+        self.reservation_size = min(
+            self.capacity, reservation_size or config.RATE_LIMIT_RESERVATION_SIZE
+        )
+        self.reservation_ttl = (
+            config.RATE_LIMIT_RESERVATION_TTL_SECONDS
+            if reservation_ttl is None
+            else reservation_ttl
+        )
+        self.key = key or config.RATE_LIMIT_KEY
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+
+        # The bucket as of our last update, which saves reading it before the next one.
+        self.bucket = None
+
+        # The tokens reserved by this instance and not used yet, and when they expire.
+        self.reserved = 0
+        self.reserved_until = 0
+
+    def acquire(self, max_wait=None):
+        # Take a token, waiting for one if the bucket is empty. Return False, without
+        # taking it, when that would take longer than `max_wait` seconds.
+        with self.lock:
+            while True:
+                now = self.clock()
+                if self.reserved and now < self.reserved_until:
+                    self.reserved -= 1
+                    return True
+
+                # Unused tokens expire, so an idle instance can't burst past the limit.
+                self.reserved = 0
+                taken, wait = self._reserve(now)
+                if taken:
+                    self.reserved = taken - 1
+                    self.reserved_until = now + self.reservation_ttl
+                    return True
+
+                # Retry right away after losing a race, there may be tokens left.
+                if not wait:
+                    continue
+
+                if max_wait is not None:
+                    if wait > max_wait:
+                        return False
+                    max_wait -= wait
+                self.sleep(wait)
+
+    def _reserve(self, now):
+        # Take up to a batch of tokens from the shared bucket. Return the tokens taken,
+        # and the seconds to wait for the next one when there are none.
+        if self.bucket is None:
+            self.bucket = self.state_table.get_counters(self.key)
+
+        version = self.bucket.get("version")
+        if version is None:
+            # The first instance to use the bucket fills it up.
+            tokens, refilled_at = self.capacity, now
+        else:
+            tokens = self.bucket["tokens"]
+            refilled_at = self.bucket["refilled_at"]
+
+        # Refill the bucket at a steady rate, for the time since its last update.
+        available = min(self.capacity, tokens + max(0, now - refilled_at) * self.rate)
+        taken = min(self.reservation_size, int(available))
+        if not taken:
+            return 0, (1 - available) / self.rate
+
+        bucket = {"tokens": round(available - taken, 6), "refilled_at": round(now, 3)}
+        version = self.state_table.compare_and_set(self.key, bucket, version)
+        if version is None:
+            # Another instance updated the bucket first, read it again and retry.
+            self.bucket = None
+            return 0, 0
+
+        self.bucket = {**bucket, "version": version}
+        return taken, 0
+
+
+# Define a pacer that spaces out writes to keep the capacity they consume under an
+# adaptive rate. Writes aren't paced until one is throttled. The rate then starts at a
+# fraction of the capacity consumed over the last second, grows by a fixed step after
+# every write that goes through, and is cut by a factor after every throttled one
+# (additive increase, multiplicative decrease).
+class AdaptiveThrottle:
+    def __init__(
+        self,
+        rate=None,
+        min_rate=None,
+        max_rate=None,
+        increase=None,
+        decrease=None,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.rate = rate
+        self.min_rate = min_rate or config.WRITE_THROTTLE_MIN_RATE
+        self.max_rate = max_rate or config.WRITE_THROTTLE_MAX_RATE
+        self.increase = increase or config.WRITE_THROTTLE_INCREASE
+        self.decrease = decrease or config.WRITE_THROTTLE_DECREASE
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+
+        # The time and capacity units of the writes of the last second, and when the
+        # next write may start.
+        self.recent = collections.deque()
+        self.next_at = 0
+
+    def wait(self):
+        # Wait until the capacity consumed by the previous writes has been earned back.
+        with self.lock:
+            delay = self.next_at - self.clock()
+
+        if delay > 0:
+            self.sleep(delay)
+
+    def record(self, units, throttled=False):
+        # Adapt the rate to the outcome of a write that consumed the given capacity
+        # units, and space the next write out by the time it takes to earn them.
+        with self.lock:
+            now = self.clock()
+            self.recent.append((now, units))
+            while self.recent[0][0] <= now - 1:
+                self.recent.popleft()
+
+            if throttled:
+                current = self.rate
+                if current is None:
+                    current = sum(units for _, units in self.recent)
+                self.rate = max(self.min_rate, current * self.decrease)
+            elif self.rate is not None:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+            if self.rate is not None:
+                self.next_at = max(self.next_at, now) + units / self.rate
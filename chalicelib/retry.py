@@ -0,0 +1,111 @@
+import random
+import threading
+from datetime import datetime
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+
+# Import local configuration settings.
+from . import config
+
+
+# Raised when a call is not attempted because the circuit breaker is open.
+class CircuitOpenError(Exception):
+    pass
+
+
+# Define when and how long to wait before retrying a failed API call.
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts=None,
+        base_delay=None,
+        max_delay=None,
+        retryable_status_codes=None,
+    ):
+        self.max_attempts = max_attempts or config.RETRY_MAX_ATTEMPTS
+        self.base_delay = (
+            config.RETRY_BASE_DELAY_SECONDS if base_delay is None else base_delay
+        )
+        self.max_delay = (
+            config.RETRY_MAX_DELAY_SECONDS if max_delay is None else max_delay
+        )
+        self.retryable_status_codes = set(
+            retryable_status_codes or config.RETRYABLE_STATUS_CODES
+        )
+
+    def is_retryable(self, status_code):
+        # Only rate limiting and server-side errors are worth another attempt.
+        return status_code in self.retryable_status_codes
+
+    def backoff(self, attempt, retry_after=None):
+        # Return the seconds to wait after the given failed attempt (starting at 1), or
+        # None when the call shouldn't be retried.
+        if attempt >= self.max_attempts:
+            return None
+
+        # Use "full jitter": a random delay up to the exponential bound, so concurrent
+        # calls that failed together don't retry together.
+        delay = random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        )
+
+        # Never retry before the server says so, and give up when it asks for longer
+        # than we're willing to wait.
+        if retry_after is not None:
+            if retry_after > self.max_delay:
+                return None
+            delay = max(delay, retry_after)
+
+        return delay
+
+    @staticmethod
+    def parse_retry_after(value):
+        # Parse a Retry-After header, given either in seconds or as an HTTP date.
+        if not value:
+            return None
+
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=timezone.utc)
+        return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+# Define a thread-safe circuit breaker that opens after a number of consecutive
+# failures, and stays open for the rest of the run.
+class CircuitBreaker:
+    def __init__(self, failure_threshold=None):
+        self.lock = threading.Lock()
+        self.failure_threshold = (
+            failure_threshold or config.CIRCUIT_BREAKER_FAILURE_THRESHOLD
+        )
+        self.consecutive_failures = 0
+        self.is_open = False
+
+    def check(self):
+        # Raise if calls are no longer allowed.
+        if self.is_open:
+            raise CircuitOpenError(
+                f"Circuit opened after {self.failure_threshold} consecutive failures"
+            )
+
+    def record_success(self):
+        # Any successful call resets the count of consecutive failures.
+        with self.lock:
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        # Count a failed call, and return True if it's the one that opened the circuit.
+        with self.lock:
+            self.consecutive_failures += 1
+            if not self.is_open and self.consecutive_failures >= self.failure_threshold:
+                self.is_open = True
+                return True
+            return False
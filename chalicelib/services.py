@@ -1,5 +1,9 @@
-import json
+import queue
 import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Import exceptions to handle specific AWS SDK client errors.
@@ -7,28 +11,121 @@ from botocore.exceptions import ClientError
 from botocore.exceptions import NoRegionError
 
 # Import a custom session class for rate limiting API calls.
+import requests
+from pyrate_limiter import BucketFullException
+from requests.adapters import HTTPAdapter
 from requests_ratelimiter import LimiterSession
+from urllib3.connection import HTTPConnection
+from urllib3.util import make_headers
 
 # Import local configuration settings and utility functions.
+from . import codec
 from . import config
+from . import persistence
 from . import utils
+from .planner import FetchPlanner
+from .retry import CircuitBreaker
+from .retry import CircuitOpenError
+from .retry import RetryPolicy
+
+
+# Raised when a call is abandoned because the invocation is about to time out.
+class DeadlineReachedError(Exception):
+    pass
+
+
+# Raised when the shared rate budget can't be reached. Like a deadline, it stops the
+# run and leaves its users to the next one.
+class RateLimiterUnavailableError(DeadlineReachedError):
+    pass
+
+
+# Define an HTTP adapter whose connections are kept alive with TCP keep-alives, and whose
+# requests time out unless given their own timeout.
+class KeepAliveAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        # The keep-alive timings can't be tuned on every platform.
+        for name, value in (
+            ("TCP_KEEPIDLE", config.HTTP_KEEPALIVE_IDLE_SECONDS),
+            ("TCP_KEEPINTVL", config.HTTP_KEEPALIVE_INTERVAL_SECONDS),
+        ):
+            if hasattr(socket, name):
+                options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+
+        kwargs["socket_options"] = HTTPConnection.default_socket_options + options
+        super().init_poolmanager(*args, **kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = (
+                config.HTTP_CONNECT_TIMEOUT_SECONDS,
+                config.HTTP_READ_TIMEOUT_SECONDS,
+            )
+        return super().send(request, timeout=timeout, **kwargs)
+
+
+# The connection pool shared by the sessions of every fetcher of the process.
+http_adapter = None
+http_adapter_lock = threading.Lock()
+
+
+def use_shared_connections(session):
+    # Send the session's requests through the connection pool shared by the process,
+    # asking for every compression urllib3 can decode (gzip, and br or zstd when their
+    # libraries are installed).
+    global http_adapter
+    with http_adapter_lock:
+        if http_adapter is None:
+            pool_size = max(config.HTTP_POOL_MAXSIZE, config.MAX_CONCURRENT_CALLS)
+            http_adapter = KeepAliveAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size
+            )
+
+    session.mount("https://", http_adapter)
+    session.mount("http://", http_adapter)
+    session.headers.update(make_headers(accept_encoding=True))
+    return session
 
 
 # Define a class to manage data fetching operations.
 class DataFetcher:
-    def __init__(self, event_logger, users_table, dlq):
+    def __init__(
+        self,
+        event_logger,
+        users_table,
+        dlq,
+        provision=True,
+        state_table=None,
+        rate_limiter=None,
+    ):
         try:
             # Initialize fetch status and various components needed for the data fetch.
             self.current_fetch_status = self._reset_fetch_status()
+            # Guards the fetch status, which is updated by several worker threads.
+            self.status_lock = threading.Lock()
             self.event_logger = event_logger
             self.dlq = dlq
-            self.limiter_session = LimiterSession(
-                per_minute=config.API_CALLS_PER_MINUTE
-            )
+            # Calls are rate limited per process, unless a limiter shared by every
+            # process (such as a SharedRateLimiter) is given.
+            self.rate_limiter = rate_limiter
+            if rate_limiter is None:
+                # 429s are left to the retry policy, which honours Retry-After,
+                # instead of stalling every call for a whole minute.
+                self.limiter_session = LimiterSession(
+                    per_minute=config.API_CALLS_PER_MINUTE, limit_statuses=()
+                )
+            else:
+                self.limiter_session = requests.Session()
+            use_shared_connections(self.limiter_session)
+            self.retry_policy = RetryPolicy()
             self.users = users_table
+            self.state_table = state_table
 
-            # Ensure the users table exists or create it.
-            if not self.users.exists():
+            # Ensure the users table exists or create it, unless it's known to exist.
+            if not provision:
+                self.users.bind()
+            elif not self.users.exists():
                 self.users.create_table()
         except Exception as e:
             # Log a fatal error if initialization fails and re-raise the exception.
@@ -37,54 +134,263 @@ class DataFetcher:
                 "error_message": str(e),
             }
 
-            self.event_logger(event={"message": json.dumps(error_event)})
+            self.event_logger(event={"message": codec.dumps(error_event)})
             raise e
 
-    def fetch(self):
-        # Reset the fetch status and record the start time.
-        self.current_fetch_status = self._reset_fetch_status()
+    def fetch(
+        self,
+        target_users=None,
+        concurrency=config.MAX_CONCURRENT_CALLS,
+        remaining_time=None,
+        on_progress=None,
+        record=True,
+        stream=None,
+    ):
+        # Record the start time. The run stops starting new calls once the callable
+        # `remaining_time` (such as the Lambda context's `get_remaining_time_in_millis`)
+        # reports less time left than the safety margin. The callable `on_progress`, if
+        # any, gets a copy of the status every time a page is written. Runs that are a
+        # part of a larger one don't `record` their status and checkpoint. Responses
+        # are streamed into the table when `stream` is set, STREAM_INGESTION by default.
         start = datetime.now()
+        self.remaining_time = remaining_time
+        self.on_progress = on_progress
+        self.stream = config.STREAM_INGESTION if stream is None else stream
 
-        # Determine the number of API calls to make based on configuration settings.
-        number_of_calls = random.randint(*config.USERS_CALLS_PER_FETCH)
-        for i in range(number_of_calls):
-            # Log the commencement of each API call.
+        # Set once a call had to stop for the deadline, so no more calls are started.
+        self.deadline_reached = False
+
+        # Resume the plan of a run that ran out of time, if there is one, unless a
+        # number of users is explicitly requested. That plan is then kept for later.
+        checkpoint = None
+        if record and self.state_table is not None:
+            checkpoint = self.state_table.get_state(config.CHECKPOINT_KEY)
+        resumed = checkpoint if target_users is None else None
+
+        if resumed is not None:
+            # Keep counting on the status of the interrupted run, with every counter.
+            self.current_fetch_status = {
+                **self._reset_fetch_status(),
+                **checkpoint["status"],
+            }
+            self.planner = FetchPlanner(
+                checkpoint["status"]["remaining_users"],
+                max_page_size=checkpoint["max_page_size"],
+            )
             self.event_logger.info(
                 event={
-                    "message": f"Performing call {i + 1}/{number_of_calls}",
+                    "message": f"Resuming the previous run, {self.planner.remaining_users} users left.",
                 }
             )
+        else:
+            # Reset the fetch status, determine the number of users to fetch based on
+            # configuration settings, and plan the fewest API calls that fetch them.
+            self.current_fetch_status = self._reset_fetch_status()
+            if target_users is None:
+                target_users = random.randint(*config.USERS_PER_FETCH)
+            self.planner = FetchPlanner(target_users)
+
+        # Stop calling the API for the rest of the run once it keeps failing.
+        self.breaker = CircuitBreaker()
+
+        # Fetched pages flow from the HTTP workers to a single writer thread through a
+        # bounded queue, so page N+1 downloads while page N is written. When DynamoDB
+        # falls behind, the queue fills up and the HTTP workers block on it.
+        pages = queue.Queue(maxsize=config.PIPELINE_QUEUE_DEPTH)
+        self.writer_error = None
+        writer = threading.Thread(target=self._write_pages, args=(pages,))
+        writer.start()
+
+        try:
+            # Keep up to `concurrency` calls in flight, each worker taking calls from
+            # the plan until it's complete. All the workers share the same limiter
+            # session, so they draw from a single per-minute rate budget.
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+                futures = [
+                    executor.submit(self._fetch_pages, pages)
+                    for _ in range(max(1, concurrency))
+                ]
 
-            # Get data from the API.
-            data = self._get_data(config.USERS_ENDPOINT)
+                # Wait for every call to finish, re-raising any unexpected error.
+                for future in futures:
+                    future.result()
+        finally:
+            # Tell the writer there are no more pages and wait until it drains the queue.
+            pages.put(None)
+            writer.join()
 
-            # Update fetch status with the number of users fetched.
-            self.current_fetch_status["users"] += len(data)
+        # Surface any unexpected error raised while writing.
+        if self.writer_error is not None:
+            raise self.writer_error
 
-            # Add fetched data to the users table.
-            self.users.add_elements(data)
+        # Send the failed calls still buffered in the DLQ.
+        if self.dlq is not None:
+            self.dlq.flush()
 
-        # Calculate and record the time taken for the fetch operation.
+        # Calculate and record the time taken for the fetch operation, and the users
+        # left for the next run when it ran out of time.
         elapsed = datetime.now() - start
-        self.current_fetch_status["duration"] = elapsed.total_seconds()
+        self.current_fetch_status["duration"] += elapsed.total_seconds()
+        self.current_fetch_status["remaining_users"] = self.planner.cancel()
 
-        # Log the status of the fetch operation.
-        self.event_logger.status(
-            event={"message": json.dumps(self.current_fetch_status)}
-        )
+        # Log and store the status of the fetch operation, and checkpoint the plan if
+        # it has to be resumed.
+        if record:
+            record_status(
+                self.event_logger, self.state_table, self.current_fetch_status
+            )
+
+        # A checkpoint that wasn't resumed still holds users for the next run, so they're
+        # added to the users left by this one.
+        if record and self.state_table is not None:
+            kept = checkpoint if resumed is None else None
+            if self.current_fetch_status["remaining_users"]:
+                remaining_users = self.current_fetch_status["remaining_users"]
+                max_page_size = self.planner.max_page_size
+                if kept is not None:
+                    remaining_users += kept["status"]["remaining_users"]
+                    max_page_size = min(max_page_size, kept["max_page_size"])
+                self.state_table.put_state(
+                    config.CHECKPOINT_KEY,
+                    {
+                        "status": {
+                            **self.current_fetch_status,
+                            "remaining_users": remaining_users,
+                        },
+                        "max_page_size": max_page_size,
+                    },
+                )
+            elif resumed is not None:
+                self.state_table.delete_state(config.CHECKPOINT_KEY)
 
         # Return the current fetch status.
         return self.current_fetch_status
 
-    def _get_data(self, endpoint):
-        # Increment the API call count in fetch status.
-        self.current_fetch_status["api_calls"] += 1
+    def _fetch_pages(self, pages):
+        # Perform the planned calls until there are none left, or no time left for them.
+        while (
+            not self.breaker.is_open
+            and not self.deadline_reached
+            and not self._out_of_time()
+        ):
+            call = self.planner.take()
+            if call is None:
+                break
+
+            self._fetch_page(*call, pages)
+
+    def _fetch_page(self, call_number, size, pages):
+        # Log the commencement of each API call.
+        self.event_logger.info(
+            event={
+                "message": f"Performing call {call_number}/{self.planner.total_calls()}",
+            }
+        )
+
+        # Get data from the API.
+        data = self._get_data(config.USERS_ENDPOINT, size)
+
+        if self.stream:
+            self._stream_page(data, size, pages)
+            return
+
+        # Update fetch status with the number of users fetched.
+        self._update_status(users=len(data))
+
+        # Hand the page over to the writer, waiting if the queue is full.
+        pages.put(data)
+
+    def _stream_page(self, users, size, pages):
+        # Hand the users over to the writer in batches as they're parsed, so the page is
+        # never held in memory as a whole. When the stream breaks, the users parsed so
+        # far are still written, and the missing ones are planned again.
+        batch = []
+        streamed = 0
+        try:
+            for user in users:
+                batch.append(user)
+                streamed += 1
+                if len(batch) == config.DYNAMODB_BATCH_WRITE_SIZE:
+                    self._update_status(users=len(batch))
+                    pages.put(batch)
+                    batch = []
+        except Exception as e:
+            error_event = {
+                "message": "The users stream was interrupted.",
+                "error": str(e),
+                "host": config.USERS_ENDPOINT,
+            }
+            self._add_error(error_event)
+            self.event_logger.error(event={"message": codec.dumps(error_event)})
+            self.dlq.send(message=error_event)
+            self.planner.give_back(size - streamed)
+
+        if batch:
+            self._update_status(users=len(batch))
+            pages.put(batch)
+
+    def _iter_streamed_users(self, response, users):
+        # Yield the users of a streamed response, releasing its connection at the end.
+        count = 0
+        try:
+            for user in users:
+                count += 1
+                yield user
+        finally:
+            response.close()
+
+        self.event_logger.info(
+            event={
+                "message": f"Fetched {count} users successfully.",
+            }
+        )
+
+    def _write_pages(self, pages):
+        # Add fetched pages to the users table until the end marker arrives.
+        done = False
+        while not done:
+            data = pages.get()
+            if data is None:
+                break
+
+            # Streamed users arrive a batch at a time, so write the batches already
+            # waiting together, in parallel.
+            waiting = config.PIPELINE_QUEUE_DEPTH if self.stream else 0
+            while waiting and not done:
+                waiting -= 1
+                try:
+                    batch = pages.get_nowait()
+                except queue.Empty:
+                    break
+                if batch is None:
+                    done = True
+                else:
+                    data = data + batch
+
+            try:
+                # Count the user writes DynamoDB throttled, retried or not, and the
+                # users skipped because they were already stored as they are.
+                report = self.users.add_elements(data)
+                self._update_status(
+                    write_retries=report["retried"],
+                    dropped_users=report["dropped"],
+                    skipped_users=report["skipped"],
+                )
+
+                # Report the progress of the run.
+                if self.on_progress is not None:
+                    self.on_progress(self._status_snapshot())
+            except Exception as e:
+                # Keep draining the queue so the HTTP workers never block forever.
+                self.writer_error = self.writer_error or e
+
+    def _get_data(self, endpoint, size):
         # Set parameters for the API call.
-        params = {"size": random.randint(*config.USERS_PER_API_CALL)}
+        params = {"size": size}
 
         try:
-            # Make a rate-limited API call.
-            response = self.limiter_session.get(endpoint, params=params)
+            # Make a rate-limited API call, retrying transient failures.
+            response = self._call_api(endpoint, params)
 
             # Handle non-200 status codes.
             if response.status_code != 200:
@@ -95,27 +401,56 @@ class DataFetcher:
                 }
 
                 # Log the error and send it to the dead letter queue.
-                self.current_fetch_status["errors"].append(error_event)
-                self.event_logger.error(event={"message": json.dumps(error_event)})
+                self._add_error(error_event)
+                self.event_logger.error(event={"message": codec.dumps(error_event)})
                 self.dlq.send(message=error_event)
 
                 return []
 
-            # Parse the response data.
-            data = response.json()
+            # Parse the response data. When streaming, an array of users is only parsed
+            # as it's iterated over, while it's written.
+            response_text = None
+            if self.stream:
+                try:
+                    users = utils.iter_json_array(
+                        response.iter_content(config.STREAM_CHUNK_SIZE)
+                    )
+                    return self._iter_streamed_users(response, users)
+                except utils.NotJsonArrayError as e:
+                    response_text = e.text
+                    data = codec.loads(response_text)
+            else:
+                data = codec.loads(response.content)
+
+            # When the page is larger than the server allows, learn its actual cap and
+            # plan the users of this call again.
+            if isinstance(data, dict):
+                max_page_size = FetchPlanner.parse_max_page_size(data.get("message"))
+                if max_page_size is not None and max_page_size < size:
+                    self.planner.learn_max_page_size(max_page_size)
+                    self.planner.give_back(size)
+                    self.event_logger.info(
+                        event={
+                            "message": f"Maximum users per call is {max_page_size}, re-planning {size} users.",
+                        }
+                    )
+
+                    return []
 
             # Handle unexpected data in the response.
-            if "message" in data and data["message"] == "Maximum allowed size is 100":
+            if not isinstance(data, list):
                 error_event = {
                     "host": endpoint,
                     "message": "An unexpected error occurred when fetching users.",
                     "response": response.status_code,
-                    "response_content": response.text,
+                    "response_content": response.text
+                    if response_text is None
+                    else response_text,
                 }
 
                 # Log the error and send it to the dead letter queue.
-                self.current_fetch_status["errors"].append(error_event)
-                self.event_logger.error(event={"message": json.dumps(error_event)})
+                self._add_error(error_event)
+                self.event_logger.error(event={"message": codec.dumps(error_event)})
                 self.dlq.send(message=error_event)
 
                 return []
@@ -128,6 +463,15 @@ class DataFetcher:
             )
 
             return data
+        except CircuitOpenError:
+            # The API is known to be down, the failure has already been reported.
+            return []
+        except DeadlineReachedError:
+            # Leave the users of this call, and of the calls not started yet, to the
+            # next run.
+            self.deadline_reached = True
+            self.planner.give_back(size)
+            return []
         except Exception as e:
             # Log any exceptions that occur during the API call.
             error_event = {
@@ -136,10 +480,151 @@ class DataFetcher:
                 "params": params,
                 "host": endpoint,
             }
-            self.event_logger.error(event={"message": json.dumps(error_event)})
+            self.event_logger.error(event={"message": codec.dumps(error_event)})
             self.dlq.send(message=error_event)
             return []
 
+    def _call_api(self, endpoint, params):
+        # Call the API until it doesn't fail with a transient error, the retries are
+        # exhausted or the circuit opens. Every attempt goes through the limiter
+        # session and counts as an API call, so retries are charged to the rate budget.
+        attempt = 1
+        while True:
+            self.breaker.check()
+
+            # Wait for the shared rate budget, but not past the deadline.
+            if self.rate_limiter is not None:
+                self._acquire_token()
+
+            # Don't let the per-process limiter wait past the deadline either. Its
+            # session is shared by the workers, which all have the same deadline.
+            if isinstance(self.limiter_session, LimiterSession):
+                time_left = self._time_left()
+                if time_left is not None and time_left <= 0:
+                    raise DeadlineReachedError()
+                self.limiter_session.max_delay = time_left
+
+            error = None
+            try:
+                response = self.limiter_session.get(
+                    endpoint, params=params, stream=self.stream
+                )
+            except BucketFullException:
+                # The call would have to wait for the rate budget past the deadline.
+                raise DeadlineReachedError()
+            except requests.RequestException as e:
+                response, error = None, e
+
+            self._update_status(api_calls=1)
+
+            if error is None and not self.retry_policy.is_retryable(
+                response.status_code
+            ):
+                self.breaker.record_success()
+                return response
+
+            if self.breaker.record_failure():
+                self._stop_calling_api()
+
+            # Wait as long as the server asks to, if it does, or back off otherwise.
+            retry_after = None
+            if response is not None:
+                retry_after = RetryPolicy.parse_retry_after(
+                    response.headers.get("Retry-After")
+                )
+            delay = self.retry_policy.backoff(attempt, retry_after)
+
+            # Don't wait past the deadline, the next run will fetch these users.
+            if delay is not None and self._out_of_time(delay):
+                raise DeadlineReachedError()
+
+            # Report the last failure when giving up.
+            if delay is None or self.breaker.is_open:
+                if error is not None:
+                    raise error
+                return response
+
+            self.event_logger.info(
+                event={
+                    "message": f"Attempt {attempt} failed with {error or response.status_code}, retrying in {delay:.2f}s.",
+                }
+            )
+            # Release the connection of a streamed response before trying again.
+            if response is not None and self.stream:
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _acquire_token(self):
+        # Take a token from the shared rate budget, raising DeadlineReachedError when
+        # it can't be had before the deadline. Failures to reach the bucket (e.g. when
+        # the state table is throttled) are retried with backoff, and stop the run once
+        # the retries are exhausted.
+        attempt = 1
+        while True:
+            try:
+                if self.rate_limiter.acquire(max_wait=self._time_left()):
+                    return
+                raise DeadlineReachedError()
+            except ClientError as e:
+                delay = self.retry_policy.backoff(attempt)
+                if delay is None or self._out_of_time(delay):
+                    error_event = {
+                        "message": "Could not reach the shared rate limiter, stopping the run.",
+                        "error": str(e),
+                    }
+                    self._add_error(error_event)
+                    self.event_logger.error(event={"message": codec.dumps(error_event)})
+                    raise RateLimiterUnavailableError(str(e)) from e
+
+                time.sleep(delay)
+                attempt += 1
+
+    def _out_of_time(self, seconds=0):
+        # Tell whether waiting the given seconds would get within the safety margin of
+        # the invocation's deadline.
+        time_left = self._time_left()
+        return time_left is not None and time_left - seconds <= 0
+
+    def _time_left(self):
+        # Return the seconds left until the safety margin of the invocation's deadline,
+        # or None if there's no deadline.
+        if self.remaining_time is None:
+            return None
+
+        return (self.remaining_time() - config.FETCH_DEADLINE_MARGIN_MILLIS) / 1000
+
+    def _stop_calling_api(self):
+        # Skip the rest of the plan, reporting it once instead of once per call.
+        skipped_users = self.planner.cancel()
+        error_event = {
+            "message": f"Stopped calling the API after {self.breaker.failure_threshold} consecutive failures.",
+            "skipped_users": skipped_users,
+        }
+
+        self._add_error(error_event)
+        self.event_logger.error(event={"message": codec.dumps(error_event)})
+        self.dlq.send(message=error_event)
+
+    def _update_status(self, **increments):
+        # Add the given increments to the counters of the fetch status.
+        with self.status_lock:
+            for key, value in increments.items():
+                self.current_fetch_status[key] += value
+
+    def _status_snapshot(self):
+        # Return a copy of the fetch status that other threads won't modify.
+        with self.status_lock:
+            return {
+                **self.current_fetch_status,
+                "errors": list(self.current_fetch_status["errors"]),
+            }
+
+    def _add_error(self, error_event):
+        # Record an error in the fetch status.
+        with self.status_lock:
+            self.current_fetch_status["errors"].append(error_event)
+
     @staticmethod
     def _reset_fetch_status():
         # Reset the fetch status to default values.
@@ -149,16 +634,74 @@ class DataFetcher:
             "errors": [],
             "timestamp": utils.get_timestamp_millis(),
             "duration": 0.0,
+            "remaining_users": 0,
+            "write_retries": 0,
+            "dropped_users": 0,
+            "skipped_users": 0,
         }
 
     def status(self):
-        # Retrieve the current status from the event logger.
-        return self.event_logger.peek_status()
+        # Retrieve the status of the latest run.
+        return get_latest_status(lambda: self.event_logger, self.state_table)
 
-    def get(self):
+    def get(self, total_segments=1, projection_expression=None):
         # Retrieve elements from the users table.
         try:
-            return self.users.get_elements()
+            return self.users.get_elements(
+                total_segments=total_segments,
+                projection_expression=projection_expression,
+            )
         except Exception as e:
             # Return an empty list if an exception occurs.
             return []
+
+    def get_page(self, limit=config.VIEW_DATA_DEFAULT_LIMIT, cursor=None, fields=None):
+        # Retrieve a single page of users.
+        return get_users_page(self.users, limit=limit, cursor=cursor, fields=fields)
+
+
+def get_users_page(
+    users_table, limit=config.VIEW_DATA_DEFAULT_LIMIT, cursor=None, fields=None
+):
+    # Retrieve a single page of users. The cursor is opaque to clients and encodes
+    # the key to resume the scan from. An invalid cursor raises a ValueError.
+    start_key = utils.decode_cursor(cursor) if cursor else None
+    projection_expression, expression_attribute_names = (
+        persistence.build_projection(fields) if fields else (None, None)
+    )
+
+    # Cap the page size so every response stays small.
+    limit = max(1, min(limit, config.VIEW_DATA_MAX_LIMIT))
+    items, last_key = users_table.get_page(
+        limit,
+        start_key=start_key,
+        projection_expression=projection_expression,
+        expression_attribute_names=expression_attribute_names,
+    )
+
+    return {
+        "items": items,
+        "next_cursor": utils.encode_cursor(last_key) if last_key else None,
+    }
+
+
+def record_status(event_logger, state_table, status):
+    # Log the status of a fetch run, and keep it as the latest one where it can be
+    # read with a single lookup.
+    event_logger.status(event={"message": codec.dumps(status)})
+
+    if state_table is not None:
+        state_table.put_state(config.LATEST_STATUS_KEY, status)
+
+
+def get_latest_status(get_event_logger, state_table=None):
+    # Read the status of the latest run from the state table, which takes a single key
+    # lookup. The Status log stream is only read when there's no state table, or when
+    # no run has stored its status there yet. The event logger is only built, through
+    # the `get_event_logger` callable, in that case.
+    if state_table is not None:
+        status = state_table.get_state(config.LATEST_STATUS_KEY)
+        if status is not None:
+            return status
+
+    return get_event_logger().peek_status()
@@ -1,7 +1,164 @@
+import base64
+import codecs
+import json
+import os
 from datetime import datetime
 from datetime import timezone
+from decimal import Decimal
+
+from . import config
 
 
 def get_timestamp_millis():
     # Convert the current UTC time to a timestamp in milliseconds and return it.
     return int(datetime.now(timezone.utc).timestamp() * 1000)
+
+
+def encode_cursor(key):
+    # Encode a DynamoDB key as an opaque, URL-safe pagination cursor.
+    payload = json.dumps(key, default=decimal_to_number, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    # Decode a pagination cursor back into a DynamoDB key, or raise ValueError.
+    try:
+        payload = base64.urlsafe_b64decode(cursor.encode("ascii"))
+        key = json.loads(payload, parse_float=Decimal)
+    except (UnicodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+    if not isinstance(key, dict):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+    return key
+
+
+def decimal_to_number(value):
+    # DynamoDB returns numbers as Decimal, which the json module can't encode.
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+# Raised by iter_json_array when the document isn't an array, with the whole document.
+class NotJsonArrayError(ValueError):
+    def __init__(self, text):
+        super().__init__("The JSON document is not an array")
+        self.text = text
+
+
+def iter_json_array(chunks):
+    # Parse a JSON array from chunks of UTF-8 bytes, and return an iterator over its
+    # elements that parses each one as it's reached, so only the current element and
+    # chunk are kept in memory. Raise NotJsonArrayError right away when the document
+    # isn't an array. Invalid JSON raises ValueError while iterating.
+    stream = _JsonTextStream(chunks)
+    if stream.peek() != "[":
+        raise NotJsonArrayError(stream.read_all())
+
+    stream.position += 1
+    return _iter_json_elements(stream)
+
+
+def _iter_json_elements(stream):
+    if stream.peek() == "]":
+        stream.position += 1
+    else:
+        while True:
+            yield stream.decode()
+
+            separator = stream.peek()
+            stream.position += 1
+            if separator == "]":
+                break
+            if separator != ",":
+                raise ValueError(f"Expected ',' or ']' but found {separator!r}")
+
+    if stream.peek():
+        raise ValueError("Extra data after the JSON array")
+
+
+class _JsonTextStream:
+    # The text of a JSON document, decoded from chunks of bytes as it's parsed.
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.ended = False
+
+    def read(self):
+        # Drop the text already parsed and append the next chunk to the rest.
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.ended = True
+            text = self.decoder.decode(b"", final=True)
+        else:
+            text = self.decoder.decode(chunk)
+        self.buffer = self.buffer[self.position :] + text
+        self.position = 0
+
+    def read_all(self):
+        # Return the rest of the document.
+        while not self.ended:
+            self.read()
+        return self.buffer[self.position :]
+
+    def peek(self):
+        # Skip whitespace and return the next character, or "" at the end.
+        while True:
+            while (
+                self.position < len(self.buffer)
+                and self.buffer[self.position] in " \t\n\r"
+            ):
+                self.position += 1
+            if self.position < len(self.buffer) or self.ended:
+                return self.buffer[self.position : self.position + 1]
+            self.read()
+
+    def decode(self):
+        # Parse the next value, reading more text until it's complete. A number may
+        # continue in the next chunk, so it's only complete once followed by something
+        # else.
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if self.ended:
+                    raise
+                self.read()
+                continue
+
+            if not self.ended and (
+                end == len(self.buffer) or self.buffer[end] in "0123456789.eE+-"
+            ):
+                self.read()
+                continue
+
+            self.position = end
+            return value
+
+
+def provisioning_checks_required(resource):
+    # The checks are skipped when explicitly disabled or already done for the resource.
+    if os.environ.get(config.SKIP_PROVISIONING_CHECKS_ENV_VAR, "").lower() in (
+        "1",
+        "true",
+        "yes",
+    ):
+        return False
+
+    return not os.path.exists(config.PROVISIONED_MARKER_PATH.format(resource=resource))
+
+
+def mark_provisioned(resource):
+    # Remember that the resource exists, ignoring failures since it's only an optimization.
+    try:
+        with open(config.PROVISIONED_MARKER_PATH.format(resource=resource), "w"):
+            pass
+    except OSError:
+        pass
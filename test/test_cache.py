@@ -0,0 +1,154 @@
+# Import necessary libraries
+from decimal import Decimal
+
+# Import custom modules from the chalicelib directory
+from chalicelib.cache import ReadThroughCache
+from chalicelib.cache import deep_size
+from chalicelib.persistence import decode_page
+from chalicelib.persistence import encode_page
+from chalicelib.persistence import page_size
+
+
+# A clock that only moves when told to.
+class FakeClock:
+    def __init__(self):
+        self.now = 1700000000.0
+
+    def __call__(self):
+        return self.now
+
+
+# A loader counting its calls, returning the page of the given size.
+class Loader:
+    def __init__(self, page_size=1):
+        self.page_size = page_size
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        users = [
+            {"id": Decimal(i), "last_name": "Smith"} for i in range(self.page_size)
+        ]
+        return users, None
+
+
+def make_cache(clock, **kwargs):
+    return ReadThroughCache(
+        encode_page, decode_page, ttl=60, clock=clock, measure=page_size, **kwargs
+    )
+
+
+# Test that values are served from memory until they expire
+def test_read_through_cache_ttl():
+    clock = FakeClock()
+    cache = make_cache(clock, max_bytes=1024)
+    load = Loader()
+
+    first = cache.get("a", load)
+    clock.now += 59
+    assert cache.get("a", load) is first
+    assert load.calls == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    clock.now += 1
+    cache.get("a", load)
+    assert load.calls == 2
+
+
+# Test that the least recently read values are evicted past the memory budget
+def test_read_through_cache_evicts_least_recently_used():
+    clock = FakeClock()
+    size = page_size(Loader()())
+    cache = make_cache(clock, max_bytes=2 * size)
+    load = Loader()
+
+    cache.get("a", load)
+    cache.get("b", load)
+    cache.get("a", load)
+    cache.get("c", load)
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.size == 2 * size
+
+    # A value larger than the whole budget isn't kept.
+    cache.get("d", Loader(page_size=10))
+    assert list(cache.entries) == ["a", "c"]
+
+
+# Test that invalidating drops every value, and those loaded meanwhile aren't kept
+def test_read_through_cache_invalidate():
+    clock = FakeClock()
+    cache = make_cache(clock, max_bytes=1024)
+    load = Loader()
+
+    cache.get("a", load)
+    cache.invalidate()
+    cache.get("a", load)
+    assert load.calls == 2
+
+    def load_during_write():
+        cache.invalidate()
+        return load()
+
+    cache.get("b", load_during_write)
+    assert "b" not in cache.entries
+
+
+# Test that values kept on disk are picked up by a new cache, numbers kept exactly
+def test_read_through_cache_on_disk(tmp_path):
+    clock = FakeClock()
+    page = (
+        [{"id": Decimal(1), "lat": Decimal("-12.3456789012345678901")}],
+        {"id": Decimal(1), "last_name": "Smith"},
+    )
+    cache = make_cache(clock, max_bytes=0, directory=tmp_path, disk_max_bytes=4096)
+    assert cache.get("a", lambda: page) is page
+
+    # A new process finds the page on disk, without loading it.
+    cache = make_cache(clock, max_bytes=1024, directory=tmp_path, disk_max_bytes=4096)
+    assert cache.get("a", Loader()) == page
+    assert cache.hits == 1
+
+    # Until it expires.
+    clock.now += 60
+    cache.entries.clear()
+    load = Loader()
+    cache.get("a", load)
+    assert load.calls == 1
+
+    # The oldest files are removed past the disk budget, and every file on invalidation.
+    cache.disk_max_bytes = cache.disk_size
+    cache.get("b", Loader())
+    assert len(list(tmp_path.glob("*.json"))) == 1
+    cache.invalidate()
+    assert list(tmp_path.iterdir()) == []
+
+
+# Test that values are measured by their estimated size in memory, and only encoded to
+# be written to disk
+def test_read_through_cache_measure(tmp_path):
+    clock = FakeClock()
+    encoded = []
+
+    def encode(page):
+        encoded.append(page)
+        return encode_page(page)
+
+    page = Loader(page_size=10)()
+    cache = ReadThroughCache(encode, decode_page, ttl=60, max_bytes=8192, clock=clock)
+    cache.get("a", lambda: page)
+    assert cache.size == deep_size(page) > len(encode_page(page))
+    assert encoded == []
+
+    cache = ReadThroughCache(
+        encode,
+        decode_page,
+        ttl=60,
+        max_bytes=8192,
+        directory=tmp_path,
+        disk_max_bytes=4096,
+        clock=clock,
+        measure=page_size,
+    )
+    cache.get("a", lambda: page)
+    assert cache.size == page_size(page)
+    assert encoded == [page]
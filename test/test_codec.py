@@ -0,0 +1,61 @@
+# Import necessary libraries
+from decimal import Decimal
+
+import pytest
+
+# Import custom modules from the chalicelib directory
+from chalicelib import codec
+from chalicelib import config
+
+BACKENDS = [
+    "json",
+    pytest.param(
+        "orjson",
+        marks=pytest.mark.skipif(codec.orjson is None, reason="orjson not installed"),
+    ),
+]
+
+
+@pytest.fixture(name="use_backend")
+def fixture_use_backend():
+    # Restore the configured backend after each test.
+    yield codec.use_backend
+    codec.use_backend(config.JSON_BACKEND)
+
+
+# Test that every backend gives the same compact JSON, Decimals included
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_codec_dumps(use_backend, backend):
+    use_backend(backend)
+
+    value = {
+        "users": Decimal("1000"),
+        "lat": Decimal("-2.5"),
+        "errors": [{"message": "Zoë", "response": None, "retried": True}],
+        "big": 2**70,
+    }
+
+    assert codec.dumps(value) == (
+        '{"users":1000,"lat":-2.5,"errors":[{"message":"Zoë","response":null,'
+        '"retried":true}],"big":1180591620717411303424}'
+    )
+    with pytest.raises(TypeError):
+        codec.dumps({"value": object()})
+
+
+# Test that every backend parses text and UTF-8 bytes alike
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_codec_loads(use_backend, backend):
+    use_backend(backend)
+
+    document = '[{"id": 1, "lat": 1.5, "name": "Zoë"}]'
+    assert codec.loads(document) == [{"id": 1, "lat": 1.5, "name": "Zoë"}]
+    assert codec.loads(document.encode("utf-8")) == codec.loads(document)
+    with pytest.raises(ValueError):
+        codec.loads(b"[1,")
+
+
+# Test that unknown backends are rejected
+def test_codec_unknown_backend(use_backend):
+    with pytest.raises(ValueError):
+        use_backend("simplejson")
@@ -1,12 +1,23 @@
 # Import necessary libraries and modules
+import json
+import threading
+import time
+
 import boto3
 import pytest
+import requests
+from botocore.exceptions import ClientError
+from pyrate_limiter import limit_context_decorator
+from requests_ratelimiter import LimiterSession
 
 # Import custom modules from the chalicelib directory
 from chalicelib import config
+from chalicelib import utils
 from chalicelib.events import EventLogger
+from chalicelib.persistence import StateTable
 from chalicelib.persistence import UsersTable
 from chalicelib.services import DataFetcher
+from test_tools.random_data_api import RandomDataApiServer
 
 
 # Define a parameterized test for the DataFetcher creation process
@@ -116,6 +127,73 @@ def test_data_get(make_stubber, error):
         assert len(results) == 0
 
 
+# Test paging through the users table with an opaque cursor and a field projection
+def test_data_get_page(make_stubber):
+    # Setup AWS CloudWatch and DynamoDB resources and stubbers as before
+    cloudwatch_resource = boto3.client("logs", region_name="us-west-1")
+    cloudwatch_stubber = make_stubber(cloudwatch_resource)
+    cloudwatch_stubber.stub_describe_log_groups()
+    cloudwatch_stubber.stub_describe_log_streams()
+
+    el = EventLogger(client=cloudwatch_resource)
+
+    dynamo_resource = boto3.resource("dynamodb", region_name="us-west-1")
+    dynamo_stubber = make_stubber(dynamo_resource.meta.client)
+
+    users_table = UsersTable(dynamo_resource=dynamo_resource, event_logger=el)
+    dynamo_stubber.stub_describe_table(
+        table_name="users",
+        schema=users_table.get_key_schema(),
+        provisioned_throughput=users_table.get_provisioned_throughput(),
+    )
+    df = DataFetcher(event_logger=el, dlq=None, users_table=users_table)
+
+    # The first page is capped at the maximum limit and has a next cursor
+    projection = {
+        "projection_expression": "#f0, #f1.#f2",
+        "expression_attrs": {"#f0": "id", "#f1": "address", "#f2": "city"},
+    }
+    dynamo_stubber.stub_scan(
+        table_name="users",
+        output_items=[{"id": 1, "address": {"city": "Springfield"}}],
+        limit=config.VIEW_DATA_MAX_LIMIT,
+        last_key={"id": {"N": "1"}, "last_name": {"S": "Smith"}},
+        **projection,
+    )
+    page = df.get_page(limit=1000, fields=["id", "address.city"])
+    assert len(page["items"]) == 1
+    assert utils.decode_cursor(page["next_cursor"]) == {"id": 1, "last_name": "Smith"}
+
+    # The next page resumes from the cursor and is the last one
+    dynamo_stubber.stub_scan(
+        table_name="users",
+        output_items=[{"id": 2, "address": {"city": "Shelbyville"}}],
+        limit=config.VIEW_DATA_MAX_LIMIT,
+        start_key={"id": 1, "last_name": "Smith"},
+        **projection,
+    )
+    page = df.get_page(
+        limit=1000, cursor=page["next_cursor"], fields=["id", "address.city"]
+    )
+    assert page["items"][0]["address"]["city"] == "Shelbyville"
+    assert page["next_cursor"] is None
+
+    # A malformed cursor is rejected before reaching DynamoDB
+    with pytest.raises(ValueError):
+        df.get_page(cursor="not a cursor")
+
+    # A cursor holding a key DynamoDB rejects is reported too, not as an empty page
+    dynamo_stubber.stub_scan(
+        table_name="users",
+        output_items=[],
+        limit=config.VIEW_DATA_DEFAULT_LIMIT,
+        start_key={"id": 1},
+        error_code="ValidationException",
+    )
+    with pytest.raises(ValueError):
+        df.get_page(cursor=utils.encode_cursor({"id": 1}))
+
+
 # Define a test for checking the status of the DataFetcher
 def test_data_fetcher_status(make_stubber):
     # Setup AWS CloudWatch and DynamoDB resources and stubbers as in previous tests
@@ -164,3 +242,621 @@ def test_data_fetcher_status(make_stubber):
     assert len(status["errors"]) == 0
     assert status["timestamp"] == 1700410240494
     assert status["duration"] == 1.23
+
+
+# Test that the status is read from the state table, falling back to the Status stream
+@pytest.mark.parametrize("stored", [True, False])
+def test_data_fetcher_status_from_state_table(make_stubber, stored):
+    cloudwatch_resource = boto3.client("logs", region_name="us-west-1")
+    cloudwatch_stubber = make_stubber(cloudwatch_resource)
+    el = EventLogger(client=cloudwatch_resource, provision=False)
+
+    dynamo_resource = boto3.resource("dynamodb", region_name="us-west-1")
+    dynamo_stubber = make_stubber(dynamo_resource.meta.client)
+
+    # Bind both tables without checking for their existence
+    users_table = UsersTable(dynamo_resource=dynamo_resource, event_logger=el)
+    state_table = StateTable(dynamo_resource=dynamo_resource, event_logger=el)
+    state_table.bind()
+    df = DataFetcher(
+        event_logger=el,
+        dlq=None,
+        users_table=users_table,
+        provision=False,
+        state_table=state_table,
+    )
+
+    stored_status = {
+        "users": 7,
+        "api_calls": 1,
+        "errors": [],
+        "timestamp": 1700410240999,
+        "duration": 0.5,
+    }
+    dynamo_stubber.stub_get_item(
+        table_name=config.STATE_TABLE,
+        key={"name": config.LATEST_STATUS_KEY},
+        output_item={
+            "name": config.LATEST_STATUS_KEY,
+            "state": json.dumps(stored_status),
+        }
+        if stored
+        else None,
+        consistent_read=True,
+    )
+
+    # Without a stored status, the latest event of the Status stream is read instead
+    if not stored:
+        cloudwatch_stubber.stub_get_log_events(
+            log_group_name=config.LOG_GROUP,
+            log_stream_name=config.STATUS_LOG_STREAM,
+            limit=1,
+            empty_response=False,
+        )
+
+    status = df.status()
+    assert status["users"] == (7 if stored else 42)
+
+
+# Minimal in-memory stand-ins used to exercise the fetch loop without AWS.
+class FakeEventLogger:
+    def __init__(self):
+        self.events = []
+
+    def info(self, event):
+        self.events.append(("info", event))
+
+    def error(self, event):
+        self.events.append(("error", event))
+
+    def status(self, event):
+        self.events.append(("status", event))
+
+
+class FakeUsersTable:
+    def __init__(self, latency=0.0):
+        self.elements = []
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+        self.latency = latency
+
+    def exists(self):
+        return True
+
+    def add_elements(self, elements):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.elements.extend(elements)
+            self.batch_sizes.append(len(elements))
+        return {"written": len(elements), "skipped": 0, "retried": 0, "dropped": 0}
+
+
+class FakeStateTable:
+    def __init__(self):
+        self.states = {}
+
+    def put_state(self, name, state):
+        self.states[name] = state
+
+    def get_state(self, name):
+        return self.states.get(name)
+
+    def delete_state(self, name):
+        self.states.pop(name, None)
+
+
+class FakeDeadLetterQueue:
+    def __init__(self):
+        self.messages = []
+
+    def send(self, message, attributes=None):
+        self.messages.append(message)
+
+    def flush(self):
+        pass
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200, headers=None, stream_error=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.payload = payload
+        self.text = json.dumps(payload)
+        self.content = self.text.encode("utf-8")
+        self.stream_error = stream_error
+        self.closed = False
+
+    def json(self):
+        return self.payload
+
+    def iter_content(self, chunk_size):
+        body = self.content
+        # A broken stream fails halfway through the body.
+        end = len(body) // 2 if self.stream_error else len(body)
+        for i in range(0, end, chunk_size):
+            yield body[i : min(i + chunk_size, end)]
+        if self.stream_error:
+            raise self.stream_error
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    def __init__(self, latency=0.0, max_page_size=100, failures=()):
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.failures = list(failures)
+        self.sizes = []
+
+    def get(self, endpoint, params, stream=False):
+        if self.latency:
+            time.sleep(self.latency)
+        size = params["size"]
+        self.sizes.append(size)
+        if self.failures:
+            return self.failures.pop(0)
+        if size > self.max_page_size:
+            return FakeResponse(
+                {"message": f"Maximum allowed size is {self.max_page_size}"}
+            )
+        return FakeResponse([{"id": i, "last_name": "Smith"} for i in range(size)])
+
+
+# Verify that concurrent calls overlap while keeping the status totals correct.
+def test_data_fetcher_fetch_concurrently(monkeypatch):
+    monkeypatch.setattr(config, "MAX_USERS_PER_API_CALL", 5)
+
+    users_table = FakeUsersTable()
+    state_table = FakeStateTable()
+    df = DataFetcher(
+        event_logger=FakeEventLogger(),
+        dlq=None,
+        users_table=users_table,
+        state_table=state_table,
+    )
+    df.limiter_session = FakeSession(latency=0.1)
+
+    start = time.monotonic()
+    status = df.fetch(target_users=50, concurrency=10)
+    elapsed = time.monotonic() - start
+
+    # Ten overlapping calls should take much less than their summed latency.
+    assert elapsed < 0.5
+    assert status["users"] == 50
+    assert status["api_calls"] == 10
+    assert len(status["errors"]) == 0
+    assert len(users_table.elements) == 50
+
+    # The status of the run is the latest one
+    assert df.status() == status
+
+
+# Verify that HTTP calls and DynamoDB writes overlap, even with a single HTTP worker.
+def test_data_fetcher_fetch_pipelined(monkeypatch):
+    monkeypatch.setattr(config, "MAX_USERS_PER_API_CALL", 5)
+    monkeypatch.setattr(config, "PIPELINE_QUEUE_DEPTH", 1)
+
+    users_table = FakeUsersTable(latency=0.05)
+    df = DataFetcher(event_logger=FakeEventLogger(), dlq=None, users_table=users_table)
+    df.limiter_session = FakeSession(latency=0.05)
+
+    start = time.monotonic()
+    status = df.fetch(target_users=25, concurrency=1)
+    elapsed = time.monotonic() - start
+
+    # Strictly alternating stages would take 5 * (0.05 + 0.05) = 0.5 seconds.
+    assert elapsed < 0.45
+    assert status["users"] == 25
+    assert len(users_table.elements) == 25
+
+
+# Verify that the fetch learns the server's page size cap and re-plans the rejected users.
+def test_data_fetcher_fetch_learns_max_page_size():
+    users_table = FakeUsersTable()
+    df = DataFetcher(event_logger=FakeEventLogger(), dlq=None, users_table=users_table)
+    df.limiter_session = FakeSession(max_page_size=40)
+
+    status = df.fetch(target_users=130, concurrency=1)
+
+    # Only the first call is wasted, the rest of the plan uses the learned cap.
+    assert df.limiter_session.sizes == [100, 40, 40, 40, 10]
+    assert status["users"] == 130
+    assert len(status["errors"]) == 0
+
+
+# Verify that transient failures are retried, waiting as long as the server asks to.
+def test_data_fetcher_fetch_retries(monkeypatch):
+    monkeypatch.setattr(config, "RETRY_BASE_DELAY_SECONDS", 0)
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+
+    users_table = FakeUsersTable()
+    dlq = FakeDeadLetterQueue()
+    df = DataFetcher(event_logger=FakeEventLogger(), dlq=dlq, users_table=users_table)
+    df.limiter_session = FakeSession(
+        failures=[
+            FakeResponse({}, status_code=429, headers={"Retry-After": "2"}),
+            FakeResponse({}, status_code=503),
+        ]
+    )
+
+    status = df.fetch(target_users=10, concurrency=1)
+
+    # Every attempt is counted as an API call, but the users are not lost.
+    assert sleeps == [2, 0]
+    assert status["api_calls"] == 3
+    assert status["users"] == 10
+    assert len(status["errors"]) == 0
+    assert len(dlq.messages) == 0
+
+
+# Verify that a 429 is only waited out by the retry policy, honouring Retry-After, and
+# doesn't make the limiter session stall the next calls for a minute.
+def test_data_fetcher_fetch_429_does_not_stall_limiter(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+    monkeypatch.setattr(limit_context_decorator, "sleep", sleeps.append)
+    monkeypatch.setattr(config, "RETRY_BASE_DELAY_SECONDS", 0)
+
+    df = DataFetcher(
+        event_logger=FakeEventLogger(),
+        dlq=FakeDeadLetterQueue(),
+        users_table=FakeUsersTable(),
+    )
+
+    with RandomDataApiServer(throttle_rate=1.0, seed=0) as server:
+        monkeypatch.setattr(config, "USERS_ENDPOINT", server.url)
+        status = df.fetch(target_users=100, concurrency=1)
+
+    assert status["api_calls"] == config.RETRY_MAX_ATTEMPTS
+    assert [seconds for seconds in sleeps if seconds] == [1] * (
+        config.RETRY_MAX_ATTEMPTS - 1
+    )
+
+
+# Verify that non-transient failures are not retried.
+def test_data_fetcher_fetch_does_not_retry_client_errors(monkeypatch):
+    users_table = FakeUsersTable()
+    dlq = FakeDeadLetterQueue()
+    df = DataFetcher(event_logger=FakeEventLogger(), dlq=dlq, users_table=users_table)
+    df.limiter_session = FakeSession(failures=[FakeResponse({}, status_code=404)])
+
+    status = df.fetch(target_users=10, concurrency=1)
+
+    assert status["api_calls"] == 1
+    assert status["users"] == 0
+    assert dlq.messages[0]["response_code"] == 404
+
+
+# Verify that a run stops before its deadline, and that the next one resumes its plan.
+def test_data_fetcher_fetch_resumes_after_deadline():
+    users_table = FakeUsersTable()
+    state_table = FakeStateTable()
+    df = DataFetcher(
+        event_logger=FakeEventLogger(),
+        dlq=None,
+        users_table=users_table,
+        state_table=state_table,
+    )
+    df.limiter_session = FakeSession()
+
+    # Every call takes 2 seconds, so only 3 calls start before the 10 seconds margin.
+    def remaining_time():
+        return 15000 - 2000 * len(df.limiter_session.sizes)
+
+    status = df.fetch(target_users=500, concurrency=1, remaining_time=remaining_time)
+    assert status["users"] == 300
+    assert status["remaining_users"] == 200
+    checkpoint = state_table.get_state(config.CHECKPOINT_KEY)
+    assert checkpoint["max_page_size"] == 100
+
+    # The next run picks up where the previous one stopped, and completes the plan.
+    status = df.fetch(concurrency=1)
+    assert df.limiter_session.sizes == [100] * 5
+    assert status["users"] == 500
+    assert status["api_calls"] == 5
+    assert status["remaining_users"] == 0
+    assert len(users_table.elements) == 500
+    assert state_table.get_state(config.CHECKPOINT_KEY) is None
+    assert df.status() == status
+
+
+# Verify that a run with an explicit target keeps the checkpoint it doesn't resume,
+# adding to it the users it leaves.
+def test_data_fetcher_fetch_explicit_target_keeps_checkpoint():
+    users_table = FakeUsersTable()
+    state_table = FakeStateTable()
+    df = DataFetcher(
+        event_logger=FakeEventLogger(),
+        dlq=None,
+        users_table=users_table,
+        state_table=state_table,
+    )
+    df.limiter_session = FakeSession()
+
+    # Every call takes 2 seconds, so only 3 calls start before the 10 seconds margin.
+    def remaining_time():
+        return 15000 - 2000 * len(df.limiter_session.sizes)
+
+    df.fetch(target_users=500, concurrency=1, remaining_time=remaining_time)
+    assert (
+        state_table.get_state(config.CHECKPOINT_KEY)["status"]["remaining_users"] == 200
+    )
+
+    # A run leaving users adds them to the checkpoint, and one completing keeps it.
+    df.limiter_session = FakeSession()
+    status = df.fetch(target_users=400, concurrency=1, remaining_time=remaining_time)
+    assert status["remaining_users"] == 100
+    assert (
+        state_table.get_state(config.CHECKPOINT_KEY)["status"]["remaining_users"] == 300
+    )
+
+    status = df.fetch(target_users=100, concurrency=1)
+    assert status["remaining_users"] == 0
+    assert (
+        state_table.get_state(config.CHECKPOINT_KEY)["status"]["remaining_users"] == 300
+    )
+
+    # The next run without a target fetches all of them.
+    df.limiter_session = FakeSession()
+    status = df.fetch(concurrency=1)
+    assert df.limiter_session.sizes == [100] * 3
+    assert status["remaining_users"] == 0
+    assert state_table.get_state(config.CHECKPOINT_KEY) is None
+
+
+# Verify that the per-process limiter never waits past the deadline, leaving the users
+# of the call to the next run.
+def test_data_fetcher_fetch_limiter_does_not_wait_past_deadline(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(limit_context_decorator, "sleep", sleeps.append)
+
+    df = DataFetcher(
+        event_logger=FakeEventLogger(),
+        dlq=FakeDeadLetterQueue(),
+        users_table=FakeUsersTable(),
+        state_table=FakeStateTable(),
+    )
+    df.limiter_session = LimiterSession(per_minute=1, limit_statuses=())
+
+    # The second call would wait for a minute, but only 5 seconds are left.
+    with RandomDataApiServer(seed=0) as server:
+        monkeypatch.setattr(config, "USERS_ENDPOINT", server.url)
+        status = df.fetch(target_users=200, concurrency=1, remaining_time=lambda: 15000)
+
+    assert sleeps == []
+    assert status["api_calls"] == 1
+    assert status["users"] == 100
+    assert status["remaining_users"] == 100
+
+
+# Verify that a call isn't retried past the deadline, leaving its users to the next run.
+def test_data_fetcher_fetch_does_not_retry_past_deadline():
+    state_table = FakeStateTable()
+    dlq = FakeDeadLetterQueue()
+    df = DataFetcher(
+        event_logger=FakeEventLogger(),
+        dlq=dlq,
+        users_table=FakeUsersTable(),
+        state_table=state_table,
+    )
+    df.limiter_session = FakeSession(
+        failures=[FakeResponse({}, status_code=429, headers={"Retry-After": "5"})]
+    )
+
+    # The failed call leaves exactly the safety margin, so waiting would exceed it.
+    def remaining_time():
+        return 11000 - 1000 * len(df.limiter_session.sizes)
+
+    status = df.fetch(target_users=100, concurrency=1, remaining_time=remaining_time)
+
+    assert status["users"] == 0
+    assert status["remaining_users"] == 100
+    assert len(status["errors"]) == 0
+    assert len(dlq.messages) == 0
+    assert state_table.get_state(config.CHECKPOINT_KEY)["status"] == status
+
+
+# A shared rate limiter with a fixed number of tokens, that never waits for more.
+class FakeRateLimiter:
+    def __init__(self, tokens, error=None):
+        self.tokens = tokens
+        self.error = error
+        self.max_waits = []
+
+    def acquire(self, max_wait=None):
+        self.max_waits.append(max_wait)
+        if self.error is not None:
+            raise self.error
+        if not self.tokens:
+            return False
+        self.tokens -= 1
+        return True
+
+
+# Verify that every call draws from the shared rate limiter, and that a call that can't
+# get a token before the deadline leaves its users to the next run.
+def test_data_fetcher_fetch_with_shared_rate_limiter():
+    state_table = FakeStateTable()
+    rate_limiter = FakeRateLimiter(tokens=2)
+    df = DataFetcher(
+        event_logger=FakeEventLogger(),
+        dlq=FakeDeadLetterQueue(),
+        users_table=FakeUsersTable(),
+        state_table=state_table,
+        rate_limiter=rate_limiter,
+    )
+    df.limiter_session = FakeSession()
+
+    status = df.fetch(target_users=300, concurrency=1, remaining_time=lambda: 15000)
+
+    assert rate_limiter.max_waits == [5, 5, 5]
+    assert status["api_calls"] == 2
+    assert status["users"] == 200
+    assert status["remaining_users"] == 100
+    assert len(status["errors"]) == 0
+
+
+# Verify that a run that can't reach the shared rate limiter retries, then stops and
+# leaves its users to the next run instead of reporting them to the DLQ.
+def test_data_fetcher_fetch_rate_limiter_unavailable(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+
+    error = ClientError(
+        {"Error": {"Code": "ProvisionedThroughputExceededException", "Message": ""}},
+        "UpdateItem",
+    )
+    dlq = FakeDeadLetterQueue()
+    df = DataFetcher(
+        event_logger=FakeEventLogger(),
+        dlq=dlq,
+        users_table=FakeUsersTable(),
+        state_table=FakeStateTable(),
+        rate_limiter=FakeRateLimiter(tokens=0, error=error),
+    )
+    df.limiter_session = FakeSession()
+
+    status = df.fetch(target_users=300, concurrency=1)
+
+    assert len(sleeps) == config.RETRY_MAX_ATTEMPTS - 1
+    assert df.limiter_session.sizes == []
+    assert status["api_calls"] == 0
+    assert status["remaining_users"] == 300
+    assert status["errors"][0]["message"].startswith("Could not reach")
+    assert dlq.messages == []
+
+
+# Run a fetch over HTTP against the local Random Data API simulator.
+@pytest.mark.parametrize("error_rate", [0.0, 1.0])
+def test_data_fetcher_fetch_from_simulator(monkeypatch, error_rate):
+    monkeypatch.setattr(config, "MAX_USERS_PER_API_CALL", 150)
+    monkeypatch.setattr(config, "RETRY_BASE_DELAY_SECONDS", 0)
+
+    users_table = FakeUsersTable()
+    dlq = FakeDeadLetterQueue()
+    df = DataFetcher(event_logger=FakeEventLogger(), dlq=dlq, users_table=users_table)
+    # Skip the client-side rate limit, the simulator is local.
+    df.limiter_session = requests.Session()
+
+    with RandomDataApiServer(max_size=100, error_rate=error_rate, seed=0) as server:
+        monkeypatch.setattr(config, "USERS_ENDPOINT", server.url)
+        # Fail deterministically, one call at a time.
+        status = df.fetch(target_users=1000, concurrency=1 if error_rate else 2)
+
+    if not error_rate:
+        # The oversized first page is re-planned within the simulator's cap.
+        assert status["users"] == 1000
+        assert len(status["errors"]) == 0
+        assert len({user["id"] for user in users_table.elements}) == 1000
+        coordinates = users_table.elements[0]["address"]["coordinates"]
+        assert {"lat", "lng"} <= coordinates.keys()
+    else:
+        # The circuit opens after a few failures, and the rest of the plan is skipped.
+        assert status["users"] == 0
+        assert status["api_calls"] == config.CIRCUIT_BREAKER_FAILURE_THRESHOLD
+        assert status["errors"][1]["skipped_users"] == 700
+        assert [message.get("response_code") for message in dlq.messages] == [
+            503,
+            None,
+            503,
+        ]
+
+
+# Verify that fetchers share kept-alive connections, and get their pages compressed.
+def test_data_fetcher_reuses_connections(monkeypatch):
+    def make_fetcher():
+        return DataFetcher(
+            event_logger=FakeEventLogger(),
+            dlq=FakeDeadLetterQueue(),
+            users_table=FakeUsersTable(),
+            rate_limiter=FakeRateLimiter(tokens=100),
+        )
+
+    with RandomDataApiServer(max_size=100, seed=0) as server:
+        monkeypatch.setattr(config, "USERS_ENDPOINT", server.url)
+        # One fetcher per invocation, as after a cold start.
+        statuses = [make_fetcher().fetch(target_users=300, concurrency=1) for _ in "ab"]
+
+    assert [status["users"] for status in statuses] == [300, 300]
+    assert server.connections == 1
+    assert server.compressed_responses == server.responses[200] == 6
+
+
+# Verify that a call to an unresponsive API times out, and its page is dead-lettered.
+def test_data_fetcher_call_times_out(monkeypatch):
+    monkeypatch.setattr(config, "HTTP_READ_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(config, "RETRY_MAX_ATTEMPTS", 1)
+
+    dlq = FakeDeadLetterQueue()
+    df = DataFetcher(
+        event_logger=FakeEventLogger(),
+        dlq=dlq,
+        users_table=FakeUsersTable(),
+        rate_limiter=FakeRateLimiter(tokens=100),
+    )
+
+    with RandomDataApiServer(latency_ms=500, seed=0) as server:
+        monkeypatch.setattr(config, "USERS_ENDPOINT", server.url)
+        status = df.fetch(target_users=100, concurrency=1)
+
+    assert status["users"] == 0
+    assert status["api_calls"] == 1
+    assert len(dlq.messages) == 1
+    assert "Read timed out" in dlq.messages[0]["error"]
+
+
+# Stream a fetch over HTTP into the table, never handing over more than a batch of users.
+def test_data_fetcher_fetch_streaming(monkeypatch):
+    monkeypatch.setattr(config, "MAX_USERS_PER_API_CALL", 150)
+    monkeypatch.setattr(config, "STREAM_CHUNK_SIZE", 256)
+
+    users_table = FakeUsersTable()
+    df = DataFetcher(
+        event_logger=FakeEventLogger(),
+        dlq=FakeDeadLetterQueue(),
+        users_table=users_table,
+    )
+    df.limiter_session = requests.Session()
+
+    with RandomDataApiServer(max_size=100, seed=0) as server:
+        monkeypatch.setattr(config, "USERS_ENDPOINT", server.url)
+        status = df.fetch(target_users=1000, concurrency=2, stream=True)
+
+    # The oversized first page is still re-planned within the simulator's cap.
+    assert status["users"] == 1000
+    assert len(status["errors"]) == 0
+    assert len({user["id"] for user in users_table.elements}) == 1000
+    # The writer takes the batches waiting in the queue at most.
+    assert max(users_table.batch_sizes) <= config.DYNAMODB_BATCH_WRITE_SIZE * (
+        config.PIPELINE_QUEUE_DEPTH + 1
+    )
+
+
+# Verify that the users parsed before a stream breaks are written, and the failure reported.
+def test_data_fetcher_fetch_streaming_interrupted():
+    users_table = FakeUsersTable()
+    dlq = FakeDeadLetterQueue()
+    df = DataFetcher(event_logger=FakeEventLogger(), dlq=dlq, users_table=users_table)
+    broken = FakeResponse(
+        [{"id": i, "last_name": "Smith"} for i in range(100)],
+        stream_error=requests.exceptions.ChunkedEncodingError("Connection broken"),
+    )
+    df.limiter_session = FakeSession(failures=[broken])
+
+    status = df.fetch(target_users=100, concurrency=1, stream=True)
+
+    # The users missing from the broken stream are fetched by another call.
+    assert df.limiter_session.sizes[0] == 100
+    assert 0 < df.limiter_session.sizes[1] < 100
+    assert status["users"] == 100
+    assert status["remaining_users"] == 0
+    assert len(users_table.elements) == 100
+    assert users_table.elements[0] == {"id": 0, "last_name": "Smith"}
+    assert [error["message"] for error in status["errors"]] == [
+        "The users stream was interrupted."
+    ]
+    assert dlq.messages[0]["message"] == "The users stream was interrupted."
+    assert broken.closed
@@ -90,7 +90,7 @@ def test_dlq_send(make_stubber, error):
         )
         sqs_stubber.stub_send_message(
             url="my_existing_queue",
-            body="""{"message": "Body message"}""",
+            body="""{"message":"Body message"}""",
             message_id="123",
             attributes={},
             error_code=error,
@@ -103,10 +103,113 @@ def test_dlq_send(make_stubber, error):
         )
         sqs_stubber.stub_send_message(
             url="my_existing_queue",
-            body="""{"message": "Body message"}""",
+            body="""{"message":"Body message"}""",
             message_id="123",
             attributes={},
         )
 
     # Attempt to send a message using the DeadLetterQueue instance
     d.send(message={"message": "Body message"})
+
+
+# Test that a DeadLetterQueue without provisioning only looks up its queue on the first send
+def test_dlq_lazy_lookup(make_stubber):
+    # Setup AWS CloudWatch logs and SQS clients and stubbers
+    cloudwatch_resource = boto3.client("logs", region_name="us-west-1")
+    cloudwatch_stubber = make_stubber(cloudwatch_resource)
+    el = EventLogger(client=cloudwatch_resource, provision=False)
+
+    sqs_resource = boto3.client("sqs", region_name="us-west-1")
+    sqs_stubber = make_stubber(sqs_resource)
+
+    # Creating the DeadLetterQueue makes no AWS calls
+    d = DeadLetterQueue(sqs_resource, el, provision=False)
+    assert d.queue_url is None
+
+    # The queue is looked up right before sending the first message
+    sqs_stubber.stub_list_queues(urls=["my_existing_queue"], prefix="dlq")
+    sqs_stubber.stub_send_message(
+        url="my_existing_queue",
+        body="""{"message":"Body message"}""",
+        message_id="123",
+        attributes={},
+    )
+    cloudwatch_stubber.stub_put_log_events(
+        log_group_name=config.LOG_GROUP,
+        log_stream_name=config.INFO_LOG_STREAM,
+    )
+    d.send(message={"message": "Body message"})
+    assert d.queue_url == "my_existing_queue"
+
+
+# Test that a buffered DeadLetterQueue sends batches and only retries the failed entries
+def test_dlq_buffered_send(make_stubber, monkeypatch):
+    monkeypatch.setattr(config, "DLQ_BATCH_SIZE", 3)
+
+    # Setup AWS CloudWatch logs and SQS clients and stubbers
+    cloudwatch_resource = boto3.client("logs", region_name="us-west-1")
+    cloudwatch_stubber = make_stubber(cloudwatch_resource)
+    el = EventLogger(client=cloudwatch_resource, provision=False)
+
+    sqs_resource = boto3.client("sqs", region_name="us-west-1")
+    sqs_stubber = make_stubber(sqs_resource)
+    sqs_stubber.stub_list_queues(urls=["my_existing_queue"], prefix="dlq")
+    d = DeadLetterQueue(sqs_resource, el, buffered=True)
+
+    def entry(i, n):
+        return {"Id": str(i), "MessageBody": f'{{"n":{n}}}', "MessageAttributes": {}}
+
+    # The third message fills a batch, which is sent right away. The second entry
+    # fails on SQS's side and is retried on its own.
+    sqs_stubber.stub_send_message_batch(
+        url="my_existing_queue",
+        entries=[entry(0, 0), entry(1, 1), entry(2, 2)],
+        failed=[{"Id": "1", "SenderFault": False, "Code": "InternalError"}],
+    )
+    sqs_stubber.stub_send_message_batch(url="my_existing_queue", entries=[entry(1, 1)])
+    cloudwatch_stubber.stub_put_log_events(log_stream_name=config.INFO_LOG_STREAM)
+    for n in range(3):
+        d.send(message={"n": n})
+
+    # The remaining message is sent on flush. A sender fault isn't retried.
+    d.send(message={"n": 3})
+    sqs_stubber.stub_send_message_batch(
+        url="my_existing_queue",
+        entries=[entry(0, 3)],
+        failed=[{"Id": "0", "SenderFault": True, "Code": "InvalidMessageContents"}],
+    )
+    cloudwatch_stubber.stub_put_log_events(log_stream_name=config.ERROR_LOG_STREAM)
+    d.flush()
+
+
+# Test the buffered DeadLetterQueue against the in-memory SQS fake
+def test_dlq_with_fake(make_fake):
+    cloudwatch_resource = boto3.client("logs", region_name="us-west-1")
+    make_fake(cloudwatch_resource)
+    el = EventLogger(client=cloudwatch_resource)
+
+    sqs_resource = boto3.client("sqs", region_name="us-west-1")
+    sqs_fake = make_fake(sqs_resource)
+
+    # The queue is created on initialization
+    d = DeadLetterQueue(sqs_resource, el, buffered=True)
+    assert d.queue_url is not None
+
+    # Some entries fail on SQS's side, but they are retried
+    sqs_fake.fail_next_entries(3)
+    for n in range(25):
+        d.send(message={"n": n})
+    d.flush()
+
+    assert sqs_fake.call_count("send_message_batch") == 4
+    assert len(sqs_fake.messages(d.queue_url)) == 25
+
+    # Received messages stay invisible until they time out
+    response = sqs_resource.receive_message(
+        QueueUrl=d.queue_url, MaxNumberOfMessages=10
+    )
+    assert len(response["Messages"]) == 10
+    response = sqs_resource.receive_message(
+        QueueUrl=d.queue_url, MaxNumberOfMessages=20
+    )
+    assert len(response["Messages"]) == 15
@@ -1,6 +1,7 @@
 # Import necessary libraries
 import boto3
 import pytest
+from botocore.exceptions import ClientError
 
 # Import configurations and EventLogger class from chalicelib directory
 from chalicelib import config
@@ -41,3 +42,116 @@ def test_peek_status(make_stubber, empty_response):
         assert len(status["errors"]) == 0
         assert status["timestamp"] == 1700410240494
         assert status["duration"] == 1.23
+
+
+# Test that a buffered logger holds events until flushed, then sends one batch per stream
+def test_buffered_flush(make_stubber):
+    cloudwatch_resource = boto3.client("logs", region_name="us-west-1")
+    cloudwatch_stubber = make_stubber(cloudwatch_resource)
+    cloudwatch_stubber.stub_describe_log_groups()
+    cloudwatch_stubber.stub_describe_log_streams()
+
+    event_logger = EventLogger(client=cloudwatch_resource, buffered=True)
+
+    # Nothing is sent while logging, since no put_log_events call is stubbed yet
+    event_logger.info(event={"message": "second", "timestamp": 2})
+    event_logger.info(event={"message": "first", "timestamp": 1})
+    event_logger.error(event={"message": "failure", "timestamp": 3})
+
+    # Flushing sends each stream's events in chronological order
+    cloudwatch_stubber.stub_put_log_events(
+        log_group_name=config.LOG_GROUP,
+        log_stream_name=config.INFO_LOG_STREAM,
+        log_events=[
+            {"message": "first", "timestamp": 1},
+            {"message": "second", "timestamp": 2},
+        ],
+    )
+    cloudwatch_stubber.stub_put_log_events(
+        log_group_name=config.LOG_GROUP,
+        log_stream_name=config.ERROR_LOG_STREAM,
+        log_events=[{"message": "failure", "timestamp": 3}],
+    )
+    event_logger.flush()
+
+    # A second flush has nothing left to send
+    event_logger.flush()
+
+
+# Test that buffered events are split into batches that respect the PutLogEvents limits
+def test_buffered_flush_respects_limits(make_stubber, monkeypatch):
+    monkeypatch.setattr(config, "LOG_BATCH_MAX_EVENTS", 2)
+
+    cloudwatch_resource = boto3.client("logs", region_name="us-west-1")
+    cloudwatch_stubber = make_stubber(cloudwatch_resource)
+    cloudwatch_stubber.stub_describe_log_groups()
+    cloudwatch_stubber.stub_describe_log_streams()
+
+    event_logger = EventLogger(client=cloudwatch_resource, buffered=True)
+
+    # Two events fill the buffer, so they are flushed right away
+    cloudwatch_stubber.stub_put_log_events(
+        log_stream_name=config.INFO_LOG_STREAM,
+        log_events=[
+            {"message": "a", "timestamp": 1},
+            {"message": "b", "timestamp": 2},
+        ],
+    )
+    event_logger.info(event={"message": "a", "timestamp": 1})
+    event_logger.info(event={"message": "b", "timestamp": 2})
+
+    # Events more than 24 hours apart can't share a batch
+    day = config.LOG_BATCH_MAX_SPAN_MILLIS
+    cloudwatch_stubber.stub_put_log_events(
+        log_stream_name=config.INFO_LOG_STREAM,
+        log_events=[{"message": "c", "timestamp": 3}],
+    )
+    cloudwatch_stubber.stub_put_log_events(
+        log_stream_name=config.INFO_LOG_STREAM,
+        log_events=[{"message": "d", "timestamp": day + 4}],
+    )
+    event_logger.info(event={"message": "c", "timestamp": 3})
+    event_logger.info(event={"message": "d", "timestamp": day + 4})
+    event_logger.close()
+
+
+# Test the event logger against the in-memory CloudWatch Logs fake
+def test_event_logger_with_fake(make_fake):
+    cloudwatch_resource = boto3.client("logs", region_name="us-west-1")
+    cloudwatch_fake = make_fake(cloudwatch_resource)
+
+    # The log group and streams are created on initialization
+    event_logger = EventLogger(client=cloudwatch_resource, buffered=True)
+
+    for i in range(500):
+        event_logger.info(event={"message": f"Info {i}"})
+    for users in (1, 2, 3):
+        event_logger.status(event={"message": f'{{"users": {users}}}'})
+    event_logger.flush()
+
+    # The buffered events took a single call per stream, and the latest status is read back
+    assert cloudwatch_fake.call_count("put_log_events") == 2
+    assert len(cloudwatch_fake.events(config.LOG_GROUP, config.INFO_LOG_STREAM)) == 500
+    assert event_logger.peek_status() == {"users": 3}
+
+
+# Test that a stream failing to flush keeps its events, without holding back the others
+def test_buffered_flush_failure(make_fake):
+    cloudwatch_resource = boto3.client("logs", region_name="us-west-1")
+    cloudwatch_fake = make_fake(cloudwatch_resource)
+    event_logger = EventLogger(client=cloudwatch_resource, buffered=True)
+
+    event_logger.info(event={"message": "info"})
+    event_logger.error(event={"message": "error"})
+    cloudwatch_fake.fail_next("put_log_events", "ServiceUnavailableException")
+    with pytest.raises(ClientError):
+        event_logger.flush()
+
+    # The info stream failed, while the error stream was still sent
+    assert cloudwatch_fake.events(config.LOG_GROUP, config.INFO_LOG_STREAM) == []
+    assert len(cloudwatch_fake.events(config.LOG_GROUP, config.ERROR_LOG_STREAM)) == 1
+
+    # The info events are sent by the next flush, and only them
+    event_logger.flush()
+    assert len(cloudwatch_fake.events(config.LOG_GROUP, config.INFO_LOG_STREAM)) == 1
+    assert len(cloudwatch_fake.events(config.LOG_GROUP, config.ERROR_LOG_STREAM)) == 1
@@ -0,0 +1,232 @@
+# Import necessary libraries
+import json
+
+import boto3
+import pytest
+
+# Import custom modules from the chalicelib directory
+from chalicelib import config
+from chalicelib import jobs
+from chalicelib.events import EventLogger
+from chalicelib.persistence import StateTable
+
+
+# A stand-in for the data fetcher that reports some progress before returning.
+class FakeDataFetcher:
+    def __init__(self, event_logger, remaining_users=0, error=None):
+        self.event_logger = event_logger
+        self.remaining_users = remaining_users
+        self.error = error
+        self.runs = 0
+
+    def fetch(
+        self, target_users=None, remaining_time=None, on_progress=None, record=True
+    ):
+        self.runs += 1
+        if self.error is not None:
+            raise self.error
+
+        # Fetch the target users, or 100 by default, minus the remaining ones of the
+        # first run only
+        remaining_users = self.remaining_users if self.runs == 1 else 0
+        users = (target_users or 100) - remaining_users
+        status = {"users": users, "api_calls": 1, "errors": []}
+        if on_progress is not None:
+            on_progress(status)
+        return {**status, "remaining_users": remaining_users}
+
+
+@pytest.fixture(name="aws")
+def fixture_aws(make_fake):
+    # Set up the state table, the jobs queue and the logger on in-memory fakes.
+    logs_client = boto3.client("logs", region_name="us-west-1")
+    make_fake(logs_client)
+    event_logger = EventLogger(client=logs_client)
+
+    dynamo_resource = boto3.resource("dynamodb", region_name="us-west-1")
+    dynamo_fake = make_fake(dynamo_resource.meta.client)
+    state_table = StateTable(dynamo_resource, event_logger)
+    state_table.create_table()
+
+    sqs_client = boto3.client("sqs", region_name="us-west-1")
+    sqs_fake = make_fake(sqs_client)
+    job_queue = jobs.JobQueue(sqs_client, event_logger)
+
+    return event_logger, state_table, job_queue, sqs_fake, dynamo_fake
+
+
+# Test that a job is recorded as queued and enqueued by id, creating the queue once
+def test_create_job(aws):
+    event_logger, state_table, job_queue, sqs_fake, dynamo_fake = aws
+
+    job = jobs.create_job(state_table, job_queue)
+    other_job = jobs.create_job(state_table, job_queue)
+
+    assert job["state"] == jobs.QUEUED
+    assert jobs.get_job(state_table, job["id"]) == job
+    assert sqs_fake.call_count("create_queue") == 1
+    assert [json.loads(body) for body in sqs_fake.messages(job_queue.queue_url)] == [
+        {"job_id": job["id"]},
+        {"job_id": other_job["id"]},
+    ]
+    assert jobs.get_job(state_table, "unknown") is None
+
+
+# Test that a job that can't be enqueued isn't left queued
+def test_create_job_fails(aws):
+    event_logger, state_table, job_queue, sqs_fake, dynamo_fake = aws
+    sqs_fake.fail_next("send_message_batch", "InternalError", "Boom", times=1)
+
+    with pytest.raises(Exception):
+        jobs.create_job(state_table, job_queue)
+
+    (item,) = dynamo_fake.items(config.STATE_TABLE)
+    assert json.loads(item["state"]["S"])["state"] == jobs.FAILED
+
+
+# Test running a job, which records its final status and is never run again
+@pytest.mark.parametrize(
+    "remaining_users,state", [(0, jobs.COMPLETED), (50, jobs.INTERRUPTED)]
+)
+def test_run_job(aws, monkeypatch, remaining_users, state):
+    event_logger, state_table, job_queue, sqs_fake, dynamo_fake = aws
+    monkeypatch.setattr(config, "JOB_PROGRESS_INTERVAL_SECONDS", 0)
+
+    # Record every update of the job
+    updates = []
+    put_state = state_table.put_state
+
+    def record_put_state(name, value):
+        updates.append(dict(value))
+        put_state(name, value)
+
+    monkeypatch.setattr(state_table, "put_state", record_put_state)
+
+    fetcher = FakeDataFetcher(event_logger, remaining_users=remaining_users)
+    job = jobs.create_job(state_table, job_queue)
+    jobs.run_job(fetcher, state_table, job["id"])
+
+    # The job goes through every state, with its progress in between
+    assert [update["state"] for update in updates] == [
+        jobs.QUEUED,
+        jobs.RUNNING,
+        jobs.RUNNING,
+        state,
+    ]
+    assert updates[2]["status"]["users"] == 100 - remaining_users
+    job = jobs.get_job(state_table, job["id"])
+    assert job["status"]["remaining_users"] == remaining_users
+
+    # A redelivered message doesn't run the job again
+    jobs.run_job(fetcher, state_table, job["id"])
+    assert fetcher.runs == 1
+
+
+# Test that a failing job is recorded as failed instead of raising
+def test_run_job_fails(aws):
+    event_logger, state_table, job_queue, sqs_fake, dynamo_fake = aws
+    fetcher = FakeDataFetcher(event_logger, error=RuntimeError("Boom"))
+
+    job = jobs.create_job(state_table, job_queue)
+    job = jobs.run_job(fetcher, state_table, job["id"])
+
+    assert job["state"] == jobs.FAILED
+    assert job["error"] == "Boom"
+    assert jobs.get_job(state_table, job["id"]) == job
+
+
+# Test that a fan-out job is split into slices, and that their statuses are reduced
+def test_fanout_job(aws):
+    event_logger, state_table, job_queue, sqs_fake, dynamo_fake = aws
+
+    job = jobs.create_fanout_job(state_table, job_queue, 1200, slice_users=500)
+    assert job["state"] == jobs.RUNNING
+    assert job["slices"] == 3
+
+    # The first slice runs out of time, and leaves 50 users to a new slice
+    fetcher = FakeDataFetcher(event_logger, remaining_users=50)
+    handled = []
+    while True:
+        response = job_queue.sqs.receive_message(
+            QueueUrl=job_queue.queue_url, MaxNumberOfMessages=10
+        )
+        if not response.get("Messages"):
+            break
+        for message in response["Messages"]:
+            handled.append(json.loads(message["Body"]))
+            jobs.handle_message(fetcher, state_table, job_queue, handled[-1])
+
+    assert [message["users"] for message in handled] == [500, 500, 200, 50]
+    job = jobs.get_job(state_table, job["id"])
+    assert job["state"] == jobs.COMPLETED
+    assert job["slices_done"] == job["slices"] == 4
+    assert job["status"]["users"] == 1200
+    assert job["status"]["api_calls"] == 4
+
+    # A redelivered slice is neither fetched again nor counted twice
+    assert jobs.handle_message(fetcher, state_table, job_queue, handled[0]) is None
+    assert fetcher.runs == 4
+    assert jobs.get_job(state_table, job["id"])["status"] == job["status"]
+
+    # The status of the whole job is the latest one
+    assert state_table.get_state(config.LATEST_STATUS_KEY) == job["status"]
+
+
+# Test that a slice whose split can't be enqueued fails the job instead of raising
+def test_fanout_slice_fails(aws):
+    event_logger, state_table, job_queue, sqs_fake, dynamo_fake = aws
+    job = jobs.create_fanout_job(state_table, job_queue, 500, slice_users=500)
+    message = {"job_id": job["id"], "slice": 0, "users": 500}
+
+    sqs_fake.fail_next_entries(1)
+    fetcher = FakeDataFetcher(event_logger, remaining_users=50)
+    job = jobs.handle_message(fetcher, state_table, job_queue, message)
+
+    assert job["state"] == jobs.FAILED
+    assert jobs.get_job(state_table, job["id"])["state"] == jobs.FAILED
+
+    # The redelivered slice is skipped.
+    assert jobs.handle_message(fetcher, state_table, job_queue, message) is None
+    assert fetcher.runs == 1
+
+
+# Test that a slice split by an interrupted delivery still lets the job complete
+def test_fanout_slice_redelivered_after_split(aws):
+    event_logger, state_table, job_queue, sqs_fake, dynamo_fake = aws
+    job = jobs.create_fanout_job(state_table, job_queue, 500, slice_users=500)
+    message = {"job_id": job["id"], "slice": 0, "users": 500}
+    key = jobs.job_key(job["id"])
+
+    # The first delivery counted its split, then stopped before enqueueing it.
+    state_table.add_counters(key, {"slices": 1}, once="split-0")
+
+    # The next one fetches every user, so the split slice is done with nothing to do.
+    fetcher = FakeDataFetcher(event_logger)
+    jobs.handle_message(fetcher, state_table, job_queue, message)
+
+    job = jobs.get_job(state_table, job["id"])
+    assert job["state"] == jobs.COMPLETED
+    assert job["slices_done"] == job["slices"] == 2
+    assert job["status"]["users"] == 500
+
+
+# Test that a fan-out job that can't be fully enqueued fails, and its slices are skipped
+def test_fanout_job_fails(aws):
+    event_logger, state_table, job_queue, sqs_fake, dynamo_fake = aws
+    sqs_fake.fail_next_entries(1)
+
+    with pytest.raises(RuntimeError):
+        jobs.create_fanout_job(state_table, job_queue, 1200, slice_users=100)
+
+    (item,) = dynamo_fake.items(config.STATE_TABLE)
+    job = jobs.get_job(state_table, json.loads(item["state"]["S"])["id"])
+    assert job["state"] == jobs.FAILED
+
+    # The slices enqueued before the failure are not fetched
+    fetcher = FakeDataFetcher(event_logger)
+    messages = [json.loads(body) for body in sqs_fake.messages(job_queue.queue_url)]
+    assert len(messages) == 9
+    for message in messages:
+        assert jobs.handle_message(fetcher, state_table, job_queue, message) is None
+    assert fetcher.runs == 0
+    assert jobs.get_job(state_table, job["id"])["state"] == jobs.FAILED
@@ -0,0 +1,50 @@
+# Import necessary libraries
+import pytest
+
+# Import custom modules from the chalicelib directory
+from chalicelib.planner import FetchPlanner
+
+
+# Test that the plan uses full pages, except for the last one
+@pytest.mark.parametrize(
+    "target_users,sizes", [(0, []), (1, [1]), (100, [100]), (250, [100, 100, 50])]
+)
+def test_planner_minimal_schedule(target_users, sizes):
+    planner = FetchPlanner(target_users, max_page_size=100)
+    assert planner.total_calls() == len(sizes)
+
+    taken = []
+    while (call := planner.take()) is not None:
+        taken.append(call)
+
+    assert taken == [(i + 1, size) for i, size in enumerate(sizes)]
+
+
+# Test that given-back users are re-planned with the learned page size
+def test_planner_learns_max_page_size():
+    planner = FetchPlanner(150, max_page_size=100)
+    assert planner.take() == (1, 100)
+
+    # The server only allows 30 users per call
+    planner.learn_max_page_size(
+        FetchPlanner.parse_max_page_size("Maximum allowed size is 30")
+    )
+    planner.give_back(100)
+    assert planner.total_calls() == 1 + 5
+
+    sizes = []
+    while (call := planner.take()) is not None:
+        sizes.append(call[1])
+
+    assert sizes == [30, 30, 30, 30, 30]
+    assert FetchPlanner.parse_max_page_size("Something else") is None
+
+
+# Test that cancelling the plan drops the calls not taken yet
+def test_planner_cancel():
+    planner = FetchPlanner(250, max_page_size=100)
+    assert planner.take() == (1, 100)
+
+    assert planner.cancel() == 150
+    assert planner.take() is None
+    assert planner.total_calls() == 1
@@ -0,0 +1,150 @@
+# Import necessary libraries
+import boto3
+import pytest
+
+# Import custom modules from the chalicelib directory
+from chalicelib import config
+from chalicelib.events import EventLogger
+from chalicelib.persistence import StateTable
+from chalicelib.ratelimit import AdaptiveThrottle
+from chalicelib.ratelimit import SharedRateLimiter
+
+
+# A clock that only moves when something sleeps.
+class FakeClock:
+    def __init__(self):
+        self.now = 1700000000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture(name="state_table")
+def fixture_state_table(make_fake):
+    # Set up the state table on an in-memory fake.
+    logs_client = boto3.client("logs", region_name="us-west-1")
+    make_fake(logs_client)
+    event_logger = EventLogger(client=logs_client)
+
+    dynamo_resource = boto3.resource("dynamodb", region_name="us-west-1")
+    dynamo_fake = make_fake(dynamo_resource.meta.client)
+    state_table = StateTable(dynamo_resource, event_logger)
+    state_table.create_table()
+
+    return state_table, dynamo_fake
+
+
+def make_limiter(state_table, clock, **kwargs):
+    return SharedRateLimiter(
+        state_table,
+        per_minute=60,
+        capacity=10,
+        reservation_size=5,
+        clock=clock,
+        sleep=clock.sleep,
+        **kwargs,
+    )
+
+
+# Test that tokens are reserved in batches, taking one update per batch
+def test_shared_rate_limiter_reserves_in_batches(state_table):
+    state_table, dynamo_fake = state_table
+    clock = FakeClock()
+    limiter = make_limiter(state_table, clock)
+
+    assert all(limiter.acquire() for _ in range(10))
+
+    assert dynamo_fake.call_count("update_item") == 2
+    assert dynamo_fake.call_count("get_item") == 1
+    assert state_table.get_counters(config.RATE_LIMIT_KEY)["tokens"] == 0
+    assert clock.sleeps == []
+
+
+# Test that instances share a single budget, waiting for it to be refilled
+def test_shared_rate_limiter_shares_budget(state_table):
+    state_table, dynamo_fake = state_table
+    clock = FakeClock()
+    limiters = [make_limiter(state_table, clock) for _ in range(2)]
+
+    # Both instances drain the bucket.
+    for _ in range(5):
+        assert limiters[0].acquire()
+        assert limiters[1].acquire()
+    assert dynamo_fake.call_count("update_item") == 2
+
+    # The first instance loses the race against the second one's update, reads the
+    # bucket again and waits a second for the next token, at one token per second.
+    assert limiters[0].acquire()
+    assert dynamo_fake.call_count("update_item") == 4
+    assert clock.sleeps == [1]
+
+
+# Test that waiting longer than allowed gives up without taking a token
+def test_shared_rate_limiter_max_wait(state_table):
+    state_table, dynamo_fake = state_table
+    clock = FakeClock()
+    limiter = make_limiter(state_table, clock)
+
+    for _ in range(10):
+        limiter.acquire()
+
+    assert not limiter.acquire(max_wait=0.5)
+    assert clock.sleeps == []
+    assert limiter.acquire(max_wait=1)
+    assert clock.sleeps == [1]
+
+
+# Test that reserved tokens left unused expire
+def test_shared_rate_limiter_reservations_expire(state_table):
+    state_table, dynamo_fake = state_table
+    clock = FakeClock()
+    limiter = make_limiter(state_table, clock, reservation_ttl=5)
+
+    limiter.acquire()
+    clock.now += 6
+    limiter.acquire()
+
+    # The 4 tokens reserved first are lost, and 5 are taken again.
+    assert dynamo_fake.call_count("update_item") == 2
+    assert state_table.get_counters(config.RATE_LIMIT_KEY)["tokens"] == 5
+
+
+# Test that writes aren't paced until one is throttled, then paced with AIMD
+def test_adaptive_throttle():
+    clock = FakeClock()
+    throttle = AdaptiveThrottle(
+        min_rate=1,
+        max_rate=100,
+        increase=5,
+        decrease=0.5,
+        clock=clock,
+        sleep=clock.sleep,
+    )
+
+    throttle.record(20)
+    throttle.record(20)
+    throttle.wait()
+    assert throttle.rate is None
+    assert clock.sleeps == []
+
+    # The first throttled write halves the capacity consumed over the last second.
+    throttle.record(10, throttled=True)
+    assert throttle.rate == 25
+    throttle.wait()
+    assert clock.sleeps == [pytest.approx(10 / 25)]
+
+    # Writes that go through increase the rate, throttled ones halve it.
+    throttle.record(30)
+    assert throttle.rate == 30
+    throttle.wait()
+    assert clock.sleeps[-1] == pytest.approx(1)
+    throttle.record(0, throttled=True)
+    assert throttle.rate == 15
+    for _ in range(30):
+        throttle.record(0)
+    assert throttle.rate == 100
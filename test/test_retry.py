@@ -0,0 +1,72 @@
+# Import necessary libraries
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from email.utils import format_datetime
+
+import pytest
+
+# Import custom modules from the chalicelib directory
+from chalicelib.retry import CircuitBreaker
+from chalicelib.retry import CircuitOpenError
+from chalicelib.retry import RetryPolicy
+
+
+# Test that the backoff grows exponentially, with jitter, up to the maximum delay
+def test_retry_policy_backoff():
+    policy = RetryPolicy(max_attempts=5, base_delay=1, max_delay=3)
+
+    for attempt, bound in [(1, 1), (2, 2), (3, 3), (4, 3)]:
+        delays = [policy.backoff(attempt) for _ in range(50)]
+        assert all(0 <= delay <= bound for delay in delays)
+        assert len(set(delays)) > 1
+
+    # The retries are exhausted
+    assert policy.backoff(5) is None
+
+
+# Test that Retry-After is honoured, unless it asks to wait for too long
+def test_retry_policy_retry_after():
+    policy = RetryPolicy(max_attempts=3, base_delay=0, max_delay=10)
+
+    assert policy.backoff(1, retry_after=4) == 4
+    assert policy.backoff(1, retry_after=60) is None
+    assert policy.backoff(3, retry_after=1) is None
+
+
+# Test parsing Retry-After headers in seconds and as HTTP dates
+@pytest.mark.parametrize(
+    "value,expected",
+    [(None, None), ("", None), ("3", 3.0), ("-1", 0.0), ("soon", None)],
+)
+def test_retry_policy_parse_retry_after(value, expected):
+    assert RetryPolicy.parse_retry_after(value) == expected
+
+
+def test_retry_policy_parse_retry_after_date():
+    date = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 < RetryPolicy.parse_retry_after(format_datetime(date, usegmt=True)) <= 30
+
+
+# Test that only rate limiting and server errors are retried
+@pytest.mark.parametrize(
+    "status_code,retryable", [(200, False), (404, False), (429, True), (503, True)]
+)
+def test_retry_policy_is_retryable(status_code, retryable):
+    assert RetryPolicy().is_retryable(status_code) == retryable
+
+
+# Test that the breaker opens after consecutive failures only, and stays open
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2)
+
+    assert not breaker.record_failure()
+    breaker.record_success()
+    assert not breaker.record_failure()
+    breaker.check()
+
+    # The second consecutive failure opens it, later ones don't open it again
+    assert breaker.record_failure()
+    assert not breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
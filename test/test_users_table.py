@@ -1,12 +1,20 @@
 # Importing necessary libraries and modules
+import copy
+import gc
+import random
+import time
+
 import boto3
 import pytest
+from boto3.dynamodb.types import TypeSerializer
 from botocore.exceptions import ClientError
 
 # Import custom modules for configuration and utility classes
 from chalicelib import config
 from chalicelib.events import EventLogger
 from chalicelib.persistence import UsersTable
+from chalicelib.persistence import content_hash
+from test_tools.random_data_api import make_user
 
 
 # This test checks if a user table can be created with and without simulated errors.
@@ -108,7 +116,9 @@ def test_users_table_exist(make_stubber, error):
 
 # This test checks if elements can be added to the user table with and without simulated errors.
 @pytest.mark.parametrize("error", [None, "TestError"])
-def test_users_table_add_elements(make_stubber, error):
+def test_users_table_add_elements(make_stubber, monkeypatch, error):
+    monkeypatch.setattr(config, "DEDUP_LOOKUP_STORED_HASHES", True)
+
     # Setup for AWS clients is identical to previous tests.
     cloudwatch_resource = boto3.client("logs", region_name="us-west-1")
     cloudwatch_stubber = make_stubber(cloudwatch_resource)
@@ -118,8 +128,15 @@ def test_users_table_add_elements(make_stubber, error):
 
     dynamo_resource = boto3.resource("dynamodb", region_name="us-west-1")
     dynamo_stubber = make_stubber(dynamo_resource.meta.client)
+    # Batches are read and written through a plain client, already marshalled.
+    dynamodb_client = boto3.client("dynamodb", region_name="us-west-1")
+    client_stubber = make_stubber(dynamodb_client)
 
-    users_table = UsersTable(dynamo_resource=dynamo_resource, event_logger=el)
+    users_table = UsersTable(
+        dynamo_resource=dynamo_resource,
+        event_logger=el,
+        dynamodb_client=dynamodb_client,
+    )
 
     # Create the users table for this test.
     dynamo_stubber.stub_create_table(
@@ -142,12 +159,48 @@ def test_users_table_add_elements(make_stubber, error):
         "last_name": "Smith",
         "address": {"coordinates": {"lat": 1.0, "lng": 2.0}},
     }
-    # Prepare the request format for DynamoDB batch writing.
-    request_items = {"users": [{"PutRequest": {"Item": users_table.serialize(item)}}]}
+    # Prepare the request format for DynamoDB batch writing, along with the lookup of
+    # the content hash stored with the item. Items are sent already marshalled.
+    digest = content_hash(item)
+    request_items = {
+        "users": [
+            {
+                "PutRequest": {
+                    "Item": {
+                        "id": {"N": "1"},
+                        "last_name": {"S": "Smith"},
+                        "address": {
+                            "M": {
+                                "coordinates": {
+                                    "M": {"lat": {"N": "1.0"}, "lng": {"N": "2.0"}}
+                                }
+                            }
+                        },
+                        "content_hash": {"S": digest.hex()},
+                    }
+                }
+            },
+        ]
+    }
+    client_stubber.stub_batch_get_item(
+        request_items={
+            "users": {
+                "Keys": [{"id": {"N": "1"}, "last_name": {"S": "Smith"}}],
+                "ProjectionExpression": "#k0, #k1, #h",
+                "ExpressionAttributeNames": {
+                    "#k0": "id",
+                    "#k1": "last_name",
+                    "#h": "content_hash",
+                },
+            }
+        }
+    )
 
     # If no error is simulated, stub the batch write operation and add the item.
     if not error:
-        dynamo_stubber.stub_batch_write_item(request_items=request_items)
+        client_stubber.stub_batch_write_item(
+            request_items=request_items, return_consumed_capacity="TOTAL"
+        )
 
         cloudwatch_stubber.stub_put_log_events(
             log_group_name=config.LOG_GROUP,
@@ -157,8 +210,9 @@ def test_users_table_add_elements(make_stubber, error):
         users_table.add_elements([item])
     else:
         # If an error is simulated, stub the batch write with an error.
-        dynamo_stubber.stub_batch_write_item(
+        client_stubber.stub_batch_write_item(
             request_items=request_items,
+            return_consumed_capacity="TOTAL",
             error_code=error,
         )
         cloudwatch_stubber.stub_put_log_events(
@@ -225,3 +279,363 @@ def test_users_table_get_elements(make_stubber, error):
         )
         results = users_table.get_elements()
         assert len(results) == 0
+
+
+# This test checks that a parallel scan reads every segment, following LastEvaluatedKey.
+def test_users_table_get_elements_parallel(make_stubber):
+    # AWS client setup is the same as before.
+    cloudwatch_resource = boto3.client("logs", region_name="us-west-1")
+    cloudwatch_stubber = make_stubber(cloudwatch_resource)
+    cloudwatch_stubber.stub_describe_log_groups()
+    cloudwatch_stubber.stub_describe_log_streams()
+    el = EventLogger(client=cloudwatch_resource)
+
+    dynamo_resource = boto3.resource("dynamodb", region_name="us-west-1")
+    dynamo_stubber = make_stubber(dynamo_resource.meta.client)
+
+    users_table = UsersTable(dynamo_resource=dynamo_resource, event_logger=el)
+    dynamo_stubber.stub_describe_table(
+        table_name="users",
+        schema=users_table.get_key_schema(),
+        provisioned_throughput=users_table.get_provisioned_throughput(),
+    )
+    assert users_table.exists()
+
+    # The first segment spans two pages, the second one fits in a single page.
+    last_key = {"id": 1, "last_name": "Smith"}
+    projection = {"projection_expression": "id, last_name"}
+    dynamo_stubber.stub_scan(
+        table_name="users",
+        output_items=[{"id": 1, "last_name": "Smith"}],
+        last_key={"id": {"N": "1"}, "last_name": {"S": "Smith"}},
+        segment=0,
+        total_segments=2,
+        **projection,
+    )
+    dynamo_stubber.stub_scan(
+        table_name="users",
+        output_items=[{"id": 2, "last_name": "Jones"}],
+        start_key=last_key,
+        segment=0,
+        total_segments=2,
+        **projection,
+    )
+    dynamo_stubber.stub_scan(
+        table_name="users",
+        output_items=[{"id": 3, "last_name": "Brown"}],
+        segment=1,
+        total_segments=2,
+        **projection,
+    )
+
+    # A single worker keeps the order of the stubbed calls deterministic.
+    results = users_table.get_elements(
+        total_segments=2, projection_expression="id, last_name", max_workers=1
+    )
+    assert [r["last_name"] for r in results] == ["Smith", "Jones", "Brown"]
+
+
+# This test runs a realistic workload against the in-memory DynamoDB fake.
+def test_users_table_with_fake(make_fake):
+    cloudwatch_resource = boto3.client("logs", region_name="us-west-1")
+    make_fake(cloudwatch_resource)
+    el = EventLogger(client=cloudwatch_resource)
+
+    dynamo_resource = boto3.resource("dynamodb", region_name="us-west-1")
+    dynamo_fake = make_fake(dynamo_resource.meta.client)
+    dynamodb_client = dynamo_fake.attach(
+        boto3.client("dynamodb", region_name="us-west-1")
+    )
+
+    # The table is created by the fake, then filled with a thousand users.
+    users_table = UsersTable(
+        dynamo_resource=dynamo_resource,
+        event_logger=el,
+        dynamodb_client=dynamodb_client,
+    )
+    assert users_table.exists() is False
+    users_table.create_table()
+    for page in range(10):
+        users_table.add_elements(
+            [
+                {
+                    "id": page * 100 + i,
+                    "last_name": "Smith",
+                    "address": {"coordinates": {"lat": 1.5, "lng": -2.5}},
+                }
+                for i in range(100)
+            ]
+        )
+
+    # A parallel scan returns every user exactly once.
+    results = users_table.get_elements(total_segments=4)
+    assert sorted(r["id"] for r in results) == list(range(1000))
+
+    # Paging through the table also returns every user exactly once.
+    ids = []
+    start_key = None
+    while True:
+        items, start_key = users_table.get_page(
+            300, start_key=start_key, projection_expression="id"
+        )
+        ids.extend(item["id"] for item in items)
+        if start_key is None:
+            break
+
+    assert sorted(ids) == list(range(1000))
+
+
+# This test checks that pages are read once, until users are written.
+def test_users_table_get_page_cached(make_fake):
+    cloudwatch_resource = boto3.client("logs", region_name="us-west-1")
+    make_fake(cloudwatch_resource)
+    el = EventLogger(client=cloudwatch_resource)
+
+    dynamo_resource = boto3.resource("dynamodb", region_name="us-west-1")
+    dynamo_fake = make_fake(dynamo_resource.meta.client)
+    dynamodb_client = dynamo_fake.attach(
+        boto3.client("dynamodb", region_name="us-west-1")
+    )
+    users_table = UsersTable(
+        dynamo_resource=dynamo_resource,
+        event_logger=el,
+        dynamodb_client=dynamodb_client,
+    )
+    users_table.create_table()
+    users_table.add_elements([make_user(i, random.Random(i)) for i in range(10)])
+
+    first_page = users_table.get_page(5)
+    assert users_table.get_page(5) == first_page
+    assert dynamo_fake.call_count("scan") == 1
+
+    # Another page, or other fields, are read from the table.
+    users_table.get_page(5, start_key=first_page[1])
+    users_table.get_page(5, projection_expression="id")
+    assert dynamo_fake.call_count("scan") == 3
+
+    # Writing an unchanged user keeps the cache, writing a changed one drops it.
+    users_table.add_elements([make_user(0, random.Random(0))])
+    users_table.get_page(5)
+    assert dynamo_fake.call_count("scan") == 3
+
+    users = [make_user(i, random.Random(i)) for i in range(10)]
+    for user in users:
+        user["first_name"] = "Changed"
+    users_table.add_elements(users)
+    items, _ = users_table.get_page(5)
+    assert dynamo_fake.call_count("scan") == 4
+    assert {item["first_name"] for item in items} == {"Changed"}
+
+
+# This test checks that writes throttled by the table's capacity are paced and retried.
+def test_users_table_add_elements_throttled(make_fake):
+    cloudwatch_resource = boto3.client("logs", region_name="us-west-1")
+    make_fake(cloudwatch_resource)
+    el = EventLogger(client=cloudwatch_resource)
+
+    # The table accepts 100 writes per second, with a full second's worth at first.
+    dynamo_resource = boto3.resource("dynamodb", region_name="us-west-1")
+    dynamo_fake = make_fake(dynamo_resource.meta.client, write_capacity=100)
+    dynamodb_client = dynamo_fake.attach(
+        boto3.client("dynamodb", region_name="us-west-1")
+    )
+    users_table = UsersTable(
+        dynamo_resource=dynamo_resource,
+        event_logger=el,
+        dynamodb_client=dynamodb_client,
+    )
+    users_table.create_table()
+
+    report = users_table.add_elements(
+        [
+            {
+                "id": i,
+                "last_name": "Smith",
+                "address": {"coordinates": {"lat": 1.5, "lng": -2.5}},
+            }
+            for i in range(150)
+        ]
+    )
+
+    assert report["written"] == 150
+    assert report["retried"] > 0
+    assert report["dropped"] == 0
+    assert len(dynamo_fake.items("users")) == 150
+    assert users_table.write_throttle.rate is not None
+
+
+# This test checks that users already stored with the same content aren't written again.
+def test_users_table_add_elements_skips_unchanged(make_fake, monkeypatch):
+    monkeypatch.setattr(config, "DEDUP_LOOKUP_STORED_HASHES", True)
+
+    cloudwatch_resource = boto3.client("logs", region_name="us-west-1")
+    logs_fake = make_fake(cloudwatch_resource)
+    el = EventLogger(client=cloudwatch_resource)
+
+    dynamo_resource = boto3.resource("dynamodb", region_name="us-west-1")
+    dynamo_fake = make_fake(dynamo_resource.meta.client)
+    dynamodb_client = dynamo_fake.attach(
+        boto3.client("dynamodb", region_name="us-west-1")
+    )
+    users_table = UsersTable(
+        dynamo_resource=dynamo_resource,
+        event_logger=el,
+        dynamodb_client=dynamodb_client,
+    )
+    users_table.create_table()
+
+    def make_users(count, city="Springfield"):
+        return [
+            {
+                "id": i,
+                "last_name": "Smith",
+                "address": {"city": city, "coordinates": {"lat": 1.5, "lng": -2.5}},
+            }
+            for i in range(count)
+        ]
+
+    # Duplicates within a call are written once.
+    report = users_table.add_elements(make_users(30) + make_users(10))
+    assert report == {"written": 30, "skipped": 10, "retried": 0, "dropped": 0}
+    consumed = dynamo_fake.consumed_write_capacity
+
+    # This instance remembers what it wrote, and doesn't even look it up.
+    report = users_table.add_elements(make_users(30))
+    assert report["skipped"] == 30
+    assert dynamo_fake.call_count("batch_write_item") == 2
+    assert dynamo_fake.call_count("batch_get_item") == 1
+
+    # Another instance reads the stored hashes, and only writes the changed users.
+    other_table = UsersTable(
+        dynamo_resource=dynamo_resource,
+        event_logger=el,
+        dynamodb_client=dynamodb_client,
+    )
+    assert other_table.exists()
+    report = other_table.add_elements(
+        make_users(20) + make_users(40, "Shelbyville")[20:]
+    )
+    assert report == {"written": 20, "skipped": 20, "retried": 0, "dropped": 0}
+    assert dynamo_fake.call_count("batch_write_item") == 3
+    assert dynamo_fake.consumed_write_capacity < 2 * consumed
+    assert len(dynamo_fake.items("users")) == 40
+    assert all("content_hash" in item for item in dynamo_fake.items("users"))
+
+    # When the lookup is throttled, the users are written anyway, without an error.
+    dynamo_fake.fail_next("batch_get_item", "ProvisionedThroughputExceededException")
+    third_table = UsersTable(
+        dynamo_resource=dynamo_resource,
+        event_logger=el,
+        dynamodb_client=dynamodb_client,
+    )
+    third_table.bind()
+    report = third_table.add_elements(make_users(20))
+    assert report == {"written": 20, "skipped": 0, "retried": 0, "dropped": 0}
+    assert logs_fake.events(config.LOG_GROUP, config.ERROR_LOG_STREAM) == []
+
+
+# This test checks that writes still throttled after every attempt are reported dropped.
+def test_users_table_add_elements_dropped(make_fake, monkeypatch):
+    monkeypatch.setattr(config, "WRITE_RETRY_BASE_DELAY_SECONDS", 0)
+
+    cloudwatch_resource = boto3.client("logs", region_name="us-west-1")
+    make_fake(cloudwatch_resource)
+    el = EventLogger(client=cloudwatch_resource)
+
+    dynamo_resource = boto3.resource("dynamodb", region_name="us-west-1")
+    dynamo_fake = make_fake(dynamo_resource.meta.client, throttle_rate=1.0)
+    dynamodb_client = dynamo_fake.attach(
+        boto3.client("dynamodb", region_name="us-west-1")
+    )
+    users_table = UsersTable(
+        dynamo_resource=dynamo_resource,
+        event_logger=el,
+        dynamodb_client=dynamodb_client,
+    )
+    users_table.create_table()
+    users_table.write_throttle.sleep = lambda seconds: None
+
+    report = users_table.add_elements(
+        [
+            {
+                "id": i,
+                "last_name": "Smith",
+                "address": {"coordinates": {"lat": 1.5, "lng": -2.5}},
+            }
+            for i in range(30)
+        ]
+    )
+
+    assert report == {
+        "written": 0,
+        "skipped": 0,
+        "retried": 30 * (config.WRITE_RETRY_MAX_ATTEMPTS - 1),
+        "dropped": 30,
+    }
+
+
+# This test checks that batches are written concurrently, up to the given limit.
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_users_table_add_elements_parallel(make_fake, max_workers):
+    cloudwatch_resource = boto3.client("logs", region_name="us-west-1")
+    make_fake(cloudwatch_resource)
+    el = EventLogger(client=cloudwatch_resource)
+
+    # Every DynamoDB call takes 50 ms.
+    dynamo_resource = boto3.resource("dynamodb", region_name="us-west-1")
+    dynamo_fake = make_fake(dynamo_resource.meta.client, latency=0.05)
+    dynamodb_client = dynamo_fake.attach(
+        boto3.client("dynamodb", region_name="us-west-1")
+    )
+    users_table = UsersTable(
+        dynamo_resource=dynamo_resource,
+        event_logger=el,
+        dynamodb_client=dynamodb_client,
+    )
+    users_table.create_table()
+
+    # Collect the garbage of the previous tests, so it isn't timed along.
+    gc.collect()
+    start = time.monotonic()
+    report = users_table.add_elements(
+        [
+            {
+                "id": i,
+                "last_name": "Smith",
+                "address": {"coordinates": {"lat": 1.5, "lng": -2.5}},
+            }
+            for i in range(200)
+        ],
+        max_workers=max_workers,
+    )
+    elapsed = time.monotonic() - start
+
+    # Eight sequential batches take 0.4 seconds, four workers take about a quarter.
+    assert report == {"written": 200, "skipped": 0, "retried": 0, "dropped": 0}
+    assert dynamo_fake.call_count("batch_write_item") == 8
+    assert len(dynamo_fake.items("users")) == 200
+    if max_workers == 1:
+        assert elapsed >= 0.4
+    else:
+        assert elapsed < 0.3
+
+
+# This test checks that users are marshalled the same as through the resource layer.
+@pytest.mark.parametrize(
+    "coordinates", [(1.5, -2.25), (1e-07, 123456789.123), (0.0, -0.0)]
+)
+def test_users_table_marshal(coordinates):
+    users_table = UsersTable(dynamo_resource=None, event_logger=None)
+    user = make_user(1, random.Random(0))
+    user["address"]["coordinates"] = dict(zip(["lat", "lng"], coordinates))
+    user["tags"] = ["a", None, True, 3]
+    original = copy.deepcopy(user)
+
+    serializer = TypeSerializer()
+    expected = {
+        name: serializer.serialize(value)
+        for name, value in users_table.serialize(copy.deepcopy(user)).items()
+    }
+
+    assert users_table.marshal(user) == expected
+    assert user == original
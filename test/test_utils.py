@@ -0,0 +1,48 @@
+# Import necessary libraries
+import json
+
+import pytest
+
+# Import custom modules from the chalicelib directory
+from chalicelib.utils import NotJsonArrayError
+from chalicelib.utils import iter_json_array
+
+
+def chunked(text, size):
+    body = text.encode("utf-8")
+    return [body[i : i + size] for i in range(0, len(body), size)]
+
+
+# Test that arrays are parsed the same however their bytes are split
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 4096])
+def test_iter_json_array(chunk_size):
+    array = [
+        {"id": 1, "name": "Zoë 😀", "address": {"lat": -2.5e-3, "tags": [None, True]}},
+        12345678901234,
+        1.25,
+        "",
+    ]
+    text = " \n" + json.dumps(array, ensure_ascii=False) + "\n"
+
+    assert list(iter_json_array(chunked(text, chunk_size))) == array
+    assert list(iter_json_array(chunked("[ ]", chunk_size))) == []
+
+
+# Test that other documents are returned whole, before anything is iterated
+def test_iter_json_array_not_an_array():
+    with pytest.raises(NotJsonArrayError) as error:
+        iter_json_array(chunked(' {"message": "Maximum allowed size is 100"}', 4))
+
+    assert json.loads(error.value.text) == {"message": "Maximum allowed size is 100"}
+
+
+# Test that invalid arrays fail while iterating, after their valid elements
+@pytest.mark.parametrize(
+    "text", ["[1, 2", "[1, 2 3]", "[1, 2] 3", "[1, 2, tru]", "[1, 2.]"]
+)
+def test_iter_json_array_invalid(text):
+    elements = iter_json_array(chunked(text, 2))
+
+    assert next(elements) == 1
+    with pytest.raises(ValueError):
+        list(elements)
@@ -0,0 +1,109 @@
+"""
+An in-memory fake of the Amazon CloudWatch Logs calls used by this project.
+"""
+
+from test_tools.fake import BaseFake
+from test_tools.fake import FakeError
+
+# PutLogEvents limits enforced by the fake.
+MAX_BATCH_EVENTS = 10000
+MAX_BATCH_BYTES = 1048576
+EVENT_OVERHEAD_BYTES = 26
+MAX_BATCH_SPAN_MILLIS = 24 * 60 * 60 * 1000
+
+
+class CloudWatchFake(BaseFake):
+    """
+    Keeps log groups and the events of their streams in memory, and validates
+    every PutLogEvents batch against the service limits.
+    """
+
+    def __init__(self, client, **kwargs):
+        super().__init__(client, **kwargs)
+        self.log_groups = {}
+
+    def events(self, log_group_name, log_stream_name):
+        """Return the events stored in a log stream."""
+        return list(self.log_groups[log_group_name]["streams"][log_stream_name])
+
+    def _group(self, name):
+        if name not in self.log_groups:
+            raise FakeError(
+                "ResourceNotFoundException", "The log group does not exist."
+            )
+        return self.log_groups[name]
+
+    def _stream(self, group_name, stream_name):
+        streams = self._group(group_name)["streams"]
+        if stream_name not in streams:
+            raise FakeError(
+                "ResourceNotFoundException", "The log stream does not exist."
+            )
+        return streams[stream_name]
+
+    def create_log_group(self, params):
+        name = params["logGroupName"]
+        if name in self.log_groups:
+            raise FakeError("ResourceAlreadyExistsException", "Log group exists.")
+        self.log_groups[name] = {"streams": {}, "retention": None}
+        return {}
+
+    def put_retention_policy(self, params):
+        self._group(params["logGroupName"])["retention"] = params["retentionInDays"]
+        return {}
+
+    def describe_log_groups(self, params):
+        prefix = params.get("logGroupNamePrefix", "")
+        return {
+            "logGroups": [
+                {"logGroupName": name}
+                for name in self.log_groups
+                if name.startswith(prefix)
+            ]
+        }
+
+    def create_log_stream(self, params):
+        streams = self._group(params["logGroupName"])["streams"]
+        if params["logStreamName"] in streams:
+            raise FakeError("ResourceAlreadyExistsException", "Log stream exists.")
+        streams[params["logStreamName"]] = []
+        return {}
+
+    def describe_log_streams(self, params):
+        streams = self._group(params["logGroupName"])["streams"]
+        return {"logStreams": [{"logStreamName": name} for name in streams]}
+
+    def put_log_events(self, params):
+        events = params["logEvents"]
+        timestamps = [e["timestamp"] for e in events]
+        size = sum(
+            len(e["message"].encode("utf-8")) + EVENT_OVERHEAD_BYTES for e in events
+        )
+
+        if len(events) > MAX_BATCH_EVENTS or size > MAX_BATCH_BYTES:
+            raise FakeError("InvalidParameterException", "Batch is too large.")
+        if timestamps != sorted(timestamps):
+            raise FakeError(
+                "InvalidParameterException",
+                "Log events in a single PutLogEvents request must be in chronological order.",
+            )
+        if timestamps[-1] - timestamps[0] > MAX_BATCH_SPAN_MILLIS:
+            raise FakeError(
+                "InvalidParameterException",
+                "The batch of log events in a single PutLogEvents request cannot span more than 24 hours.",
+            )
+
+        stream = self._stream(params["logGroupName"], params["logStreamName"])
+        stream.extend(
+            {"timestamp": e["timestamp"], "message": e["message"]} for e in events
+        )
+        return {"nextSequenceToken": str(len(stream))}
+
+    def get_log_events(self, params):
+        events = self._stream(params["logGroupName"], params["logStreamName"])
+        limit = params.get("limit", 10000)
+        if params.get("startFromHead", False):
+            page = events[:limit]
+        else:
+            page = events[-limit:] if events else []
+        return {"events": [dict(e) for e in page]}
@@ -50,12 +50,14 @@ class CloudWatchStubber(BaseStubber):
         log_stream_name,
         limit,
         empty_response=None,
+        start_from_head=False,
         error_code=None,
     ):
         expected_params = {
             "logGroupName": log_group_name,
             "logStreamName": log_stream_name,
             "limit": limit,
+            "startFromHead": start_from_head,
         }
 
         if empty_response:
@@ -0,0 +1,353 @@
+"""
+An in-memory fake of the Amazon DynamoDB calls used by this project.
+"""
+
+import bisect
+import json
+import math
+import operator
+import random
+import re
+import time
+import zlib
+
+from test_tools.fake import BaseFake
+from test_tools.fake import FakeError
+
+# BatchWriteItem and Scan limits enforced by the fake.
+MAX_BATCH_GET_KEYS = 100
+MAX_BATCH_WRITE_ITEMS = 25
+MAX_SCAN_PAGE_BYTES = 1024 * 1024
+
+# The comparisons supported in condition expressions.
+COMPARATORS = {
+    "=": operator.eq,
+    "<>": operator.ne,
+    "<=": operator.le,
+    ">=": operator.ge,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+COMPARISON = re.compile(r"^(\S+)\s*(<>|<=|>=|=|<|>)\s*(\S+)$")
+FUNCTION = re.compile(r"^(NOT\s+)?(\w+)\(([^,)]+)(?:,\s*([^)]+))?\)$")
+
+
+class DynamoDBFake(BaseFake):
+    """
+    Keeps tables and their items in memory, in wire (AttributeValue) format.
+
+    Scans are paginated like the real service, by Limit and by a 1 MB page size,
+    and can be split into segments. BatchWriteItem can simulate throttling, either
+    with a write capacity (in WCUs per second) past which items come back as
+    UnprocessedItems, or with a rate of calls rejected with a
+    ProvisionedThroughputExceededException.
+    """
+
+    def __init__(
+        self,
+        client,
+        write_capacity=None,
+        throttle_rate=0.0,
+        seed=None,
+        **kwargs,
+    ):
+        super().__init__(client, **kwargs)
+        self.tables = {}
+        self.write_capacity = write_capacity
+        self.write_tokens = write_capacity
+        self.refilled_at = time.monotonic()
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.consumed_write_capacity = 0
+
+    def add_table(self, table_name, key_schema):
+        """Create a table right away, with the given KeySchema."""
+        with self.lock:
+            self.tables[table_name] = {
+                "key": [k["AttributeName"] for k in key_schema],
+                "key_schema": key_schema,
+                "items": {},
+                "sorted_keys": [],
+            }
+
+    def items(self, table_name):
+        """Return every item of a table, in wire format."""
+        with self.lock:
+            return list(self._table(table_name)["items"].values())
+
+    def _table(self, name):
+        if name not in self.tables:
+            raise FakeError("ResourceNotFoundException", "Requested resource not found")
+        return self.tables[name]
+
+    @staticmethod
+    def _sort_key(value):
+        # Compare numbers numerically and everything else as strings.
+        ((kind, raw),) = value.items()
+        return (kind, float(raw)) if kind == "N" else (kind, str(raw))
+
+    def _key(self, table, item):
+        try:
+            return tuple(self._sort_key(item[name]) for name in table["key"])
+        except KeyError:
+            raise FakeError(
+                "ValidationException",
+                "One of the required keys was not given a value",
+            )
+
+    def _put(self, table, item):
+        key = self._key(table, item)
+        if key not in table["items"]:
+            bisect.insort(table["sorted_keys"], key)
+        table["items"][key] = item
+
+    @staticmethod
+    def _write_units(item):
+        # Writes consume one WCU per started KB.
+        return max(1, math.ceil(len(json.dumps(item)) / 1024))
+
+    def _take_write_capacity(self, units):
+        # Refill the write capacity, one second's worth at most, then take from it.
+        if self.write_capacity is None:
+            return True
+
+        now = time.monotonic()
+        self.write_tokens = min(
+            self.write_capacity,
+            self.write_tokens + (now - self.refilled_at) * self.write_capacity,
+        )
+        self.refilled_at = now
+        if self.write_tokens < units:
+            return False
+        self.write_tokens -= units
+        return True
+
+    def create_table(self, params):
+        if params["TableName"] in self.tables:
+            raise FakeError("ResourceInUseException", "Table already exists")
+        self.add_table(params["TableName"], params["KeySchema"])
+        return {
+            "TableDescription": {
+                "TableName": params["TableName"],
+                "KeySchema": params["KeySchema"],
+                "TableStatus": "ACTIVE",
+            }
+        }
+
+    def describe_table(self, params):
+        table = self._table(params["TableName"])
+        return {
+            "Table": {
+                "TableName": params["TableName"],
+                "KeySchema": table["key_schema"],
+                "TableStatus": "ACTIVE",
+                "ItemCount": len(table["items"]),
+            }
+        }
+
+    def put_item(self, params):
+        table = self._table(params["TableName"])
+        self._put(table, params["Item"])
+        return {}
+
+    def get_item(self, params):
+        table = self._table(params["TableName"])
+        item = table["items"].get(self._key(table, params["Key"]))
+        return {"Item": self._project(item, params)} if item is not None else {}
+
+    def update_item(self, params):
+        table = self._table(params["TableName"])
+        key = self._key(table, params["Key"])
+        current = table["items"].get(key)
+        item = dict(current) if current is not None else dict(params["Key"])
+
+        names = params.get("ExpressionAttributeNames", {})
+        values = params.get("ExpressionAttributeValues", {})
+        if "ConditionExpression" in params and not self._check(
+            params["ConditionExpression"], current or {}, names, values
+        ):
+            raise FakeError(
+                "ConditionalCheckFailedException", "The conditional request failed"
+            )
+
+        # Apply the SET and ADD clauses, e.g. "SET #a = :a ADD #b :b, #c :c".
+        clauses = re.split(r"\b(SET|ADD)\b", params["UpdateExpression"])
+        for action, actions in zip(clauses[1::2], clauses[2::2]):
+            for assignment in actions.split(","):
+                name, value = re.split(r"\s*=\s*|\s+", assignment.strip(), 1)
+                name, value = names.get(name, name), values[value]
+                if action == "SET":
+                    item[name] = value
+                elif "N" in value:
+                    total = float(item.get(name, {"N": "0"})["N"]) + float(value["N"])
+                    item[name] = {"N": str(int(total) if total.is_integer() else total)}
+                else:
+                    ((kind, members),) = value.items()
+                    existing = item.get(name, {kind: []})[kind]
+                    item[name] = {kind: sorted(set(existing) | set(members))}
+
+        self._put(table, item)
+        if params.get("ReturnValues") == "ALL_NEW":
+            return {"Attributes": dict(item)}
+        return {}
+
+    def _check(self, expression, item, names, values):
+        # Evaluate a condition made of comparisons and functions, all joined either by
+        # AND or by OR.
+        if " OR " in expression:
+            return any(
+                self._check(part, item, names, values)
+                for part in expression.split(" OR ")
+            )
+        if " AND " in expression:
+            return all(
+                self._check(part, item, names, values)
+                for part in expression.split(" AND ")
+            )
+
+        expression = expression.strip()
+        match = FUNCTION.match(expression)
+        if match:
+            negated, function, name, value = match.groups()
+            attribute = item.get(names.get(name.strip(), name.strip()))
+            if function == "attribute_exists":
+                result = attribute is not None
+            elif function == "attribute_not_exists":
+                result = attribute is None
+            else:
+                ((kind, members),) = (attribute or {"SS": []}).items()
+                ((_, member),) = values[value.strip()].items()
+                result = member in members
+            return result != bool(negated)
+
+        name, comparator, value = COMPARISON.match(expression).groups()
+        attribute = item.get(names.get(name, name))
+        if attribute is None:
+            return False
+        return COMPARATORS[comparator](
+            self._sort_key(attribute), self._sort_key(values[value])
+        )
+
+    def delete_item(self, params):
+        table = self._table(params["TableName"])
+        table["items"].pop(self._key(table, params["Key"]), None)
+        return {}
+
+    def batch_write_item(self, params):
+        requests = [
+            (table_name, request)
+            for table_name, table_requests in params["RequestItems"].items()
+            for request in table_requests
+        ]
+        if len(requests) > MAX_BATCH_WRITE_ITEMS:
+            raise FakeError(
+                "ValidationException",
+                "Too many items requested for the BatchWriteItem call",
+            )
+        if self.throttle_rate and self.random.random() < self.throttle_rate:
+            raise FakeError(
+                "ProvisionedThroughputExceededException",
+                "The level of configured provisioned throughput for the table was exceeded.",
+            )
+
+        unprocessed = {}
+        consumed = {}
+        for table_name, request in requests:
+            table = self._table(table_name)
+            item = request["PutRequest"]["Item"]
+            units = self._write_units(item)
+            if not self._take_write_capacity(units):
+                unprocessed.setdefault(table_name, []).append(request)
+                continue
+
+            self._put(table, item)
+            consumed[table_name] = consumed.get(table_name, 0) + units
+            self.consumed_write_capacity += units
+
+        response = {"UnprocessedItems": unprocessed}
+        if params.get("ReturnConsumedCapacity", "NONE") != "NONE":
+            response["ConsumedCapacity"] = [
+                {"TableName": name, "CapacityUnits": float(units)}
+                for name, units in consumed.items()
+            ]
+        return response
+
+    def batch_get_item(self, params):
+        if sum(len(r["Keys"]) for r in params["RequestItems"].values()) > (
+            MAX_BATCH_GET_KEYS
+        ):
+            raise FakeError(
+                "ValidationException",
+                "Too many items requested for the BatchGetItem call",
+            )
+
+        responses = {}
+        for table_name, request in params["RequestItems"].items():
+            table = self._table(table_name)
+            found = responses.setdefault(table_name, [])
+            for key in request["Keys"]:
+                item = table["items"].get(self._key(table, key))
+                if item is not None:
+                    found.append(self._project(item, request))
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+    def scan(self, params):
+        table = self._table(params["TableName"])
+        keys = table["sorted_keys"]
+
+        # Resume right after the ExclusiveStartKey.
+        start = 0
+        if "ExclusiveStartKey" in params:
+            start = bisect.bisect_right(
+                keys, self._key(table, params["ExclusiveStartKey"])
+            )
+
+        # Every item belongs to a segment, chosen by a hash of its partition key.
+        segment = params.get("Segment")
+        total_segments = params.get("TotalSegments")
+
+        limit = params.get("Limit")
+        page = []
+        page_bytes = 0
+        last_key = None
+        for key in keys[start:]:
+            if total_segments and (
+                zlib.crc32(repr(key[0]).encode()) % total_segments != segment
+            ):
+                continue
+
+            item = table["items"][key]
+            page.append(self._project(item, params))
+            page_bytes += len(json.dumps(item))
+            last_key = key
+            if (limit and len(page) >= limit) or page_bytes >= MAX_SCAN_PAGE_BYTES:
+                break
+        else:
+            last_key = None
+
+        response = {"Items": page, "Count": len(page), "ScannedCount": len(page)}
+        if last_key is not None:
+            item = table["items"][last_key]
+            response["LastEvaluatedKey"] = {name: item[name] for name in table["key"]}
+        return response
+
+    @staticmethod
+    def _project(item, params):
+        # Keep only the attributes (or nested paths) named in the ProjectionExpression.
+        if "ProjectionExpression" not in params:
+            return dict(item)
+
+        names = params.get("ExpressionAttributeNames", {})
+        projected = {}
+        for path in params["ProjectionExpression"].split(","):
+            parts = [names.get(p.strip(), p.strip()) for p in path.split(".")]
+            source, target = item, projected
+            for i, part in enumerate(parts):
+                if part not in source:
+                    break
+                if i == len(parts) - 1:
+                    target[part] = source[part]
+                    break
+                source = source[part].get("M", {})
+                target = target.setdefault(part, {"M": {}})["M"]
+        return projected
@@ -112,9 +112,17 @@ class DynamoDBStubber(BaseStubber):
         expression_attrs=None,
         start_key=None,
         last_key=None,
+        segment=None,
+        total_segments=None,
+        limit=None,
         error_code=None,
     ):
         expected_params = {"TableName": table_name}
+        if limit:
+            expected_params["Limit"] = limit
+        if total_segments is not None:
+            expected_params["Segment"] = segment
+            expected_params["TotalSegments"] = total_segments
         if select:
             expected_params["Select"] = select
         if filter_expression:
@@ -133,14 +141,61 @@ class DynamoDBStubber(BaseStubber):
         self._stub_bifurcator("scan", expected_params, response, error_code=error_code)
 
     def stub_batch_write_item(
-        self, request_items, unprocessed_items=None, error_code=None
+        self,
+        request_items,
+        unprocessed_items=None,
+        return_consumed_capacity=None,
+        consumed_capacity=None,
+        error_code=None,
     ):
         expected_params = {"RequestItems": request_items}
+        if return_consumed_capacity:
+            expected_params["ReturnConsumedCapacity"] = return_consumed_capacity
         response = {
             "UnprocessedItems": unprocessed_items
             if unprocessed_items is not None
             else {}
         }
+        if consumed_capacity is not None:
+            response["ConsumedCapacity"] = consumed_capacity
         self._stub_bifurcator(
             "batch_write_item", expected_params, response, error_code=error_code
         )
+
+    def stub_batch_get_item(self, request_items, output_items=None, error_code=None):
+        expected_params = {"RequestItems": request_items}
+        response = {
+            "Responses": {
+                table_name: [self._build_out_item(item) for item in items]
+                for table_name, items in (output_items or {}).items()
+            },
+            "UnprocessedKeys": {},
+        }
+        self._stub_bifurcator(
+            "batch_get_item", expected_params, response, error_code=error_code
+        )
+
+    def stub_put_item(self, table_name, item, error_code=None):
+        expected_params = {"TableName": table_name, "Item": item}
+        self._stub_bifurcator(
+            "put_item", expected_params, response={}, error_code=error_code
+        )
+
+    def stub_get_item(
+        self, table_name, key, output_item=None, consistent_read=None, error_code=None
+    ):
+        expected_params = {"TableName": table_name, "Key": key}
+        if consistent_read is not None:
+            expected_params["ConsistentRead"] = consistent_read
+        response = {}
+        if output_item is not None:
+            response["Item"] = self._build_out_item(output_item)
+        self._stub_bifurcator(
+            "get_item", expected_params, response, error_code=error_code
+        )
+
+    def stub_delete_item(self, table_name, key, error_code=None):
+        expected_params = {"TableName": table_name, "Key": key}
+        self._stub_bifurcator(
+            "delete_item", expected_params, response={}, error_code=error_code
+        )
@@ -0,0 +1,126 @@
+import threading
+import time
+
+from botocore import xform_name
+from botocore.awsrequest import AWSResponse
+
+
+class FakeError(Exception):
+    """Raised by fake operations to answer a call with a service error."""
+
+    def __init__(self, code, message="", status_code=400):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.message = message
+        self.status_code = status_code
+
+
+class BaseFake:
+    """
+    A base class for stateful, in-memory fakes of AWS services.
+
+    Unlike the stubbers, which answer a pre-registered sequence of calls, a fake
+    keeps the service's state and answers any sequence of calls, from any number
+    of threads. It plugs into a real boto3 client through botocore's event system,
+    so calls still go through boto3's parameter validation and (for resources)
+    the DynamoDB marshalling layer. Only the network round trip is replaced.
+
+    Subclasses implement one method per supported operation, named after the
+    client method (e.g. `put_log_events`), which receives the request parameters
+    in their wire format and returns the parsed response, or raises FakeError.
+
+    The fake can also inject latency into every call, report call latencies to a
+    recorder and fail the next calls of an operation on demand.
+    """
+
+    def __init__(self, client, latency=0.0, recorder=None, stage=None):
+        self.client = client
+        self.clients = [client]
+        self.latency = latency
+        self.recorder = recorder
+        self.service = client.meta.service_model.service_id.hyphenize()
+        self.stage = stage or self.service
+        self.lock = threading.RLock()
+        self.pending = threading.local()
+        self.injected_errors = {}
+        self.calls = {}
+
+    def activate(self):
+        """Start answering the client's calls."""
+        self._register(self.client)
+        return self
+
+    def attach(self, client):
+        """Also answer the calls of another client of the service, from the same state."""
+        self.clients.append(client)
+        self._register(client)
+        return client
+
+    def deactivate(self):
+        """Stop answering the clients' calls."""
+        for client in self.clients:
+            events = client.meta.events
+            events.unregister(
+                f"before-parameter-build.{self.service}",
+                unique_id=f"fake-{id(self)}-params",
+            )
+            events.unregister(
+                f"before-call.{self.service}", unique_id=f"fake-{id(self)}-call"
+            )
+
+    def _register(self, client):
+        events = client.meta.events
+        # Run after every other parameter handler (e.g. the DynamoDB resource
+        # marshalling), so the parameters are in their wire format.
+        events.register_last(
+            f"before-parameter-build.{self.service}",
+            self._build_response,
+            unique_id=f"fake-{id(self)}-params",
+        )
+        events.register(
+            f"before-call.{self.service}",
+            self._respond,
+            unique_id=f"fake-{id(self)}-call",
+        )
+
+    def assert_no_pending_responses(self):
+        """Fakes have no queue of responses, so there's nothing to check."""
+
+    def fail_next(self, operation, code, message="", times=1):
+        """Answer the next `times` calls of the operation with the given error."""
+        with self.lock:
+            self.injected_errors.setdefault(operation, []).extend(
+                [FakeError(code, message)] * times
+            )
+
+    def call_count(self, operation):
+        """Return the number of calls made to the operation."""
+        with self.lock:
+            return self.calls.get(operation, 0)
+
+    def _build_response(self, params, model, **kwargs):
+        operation = xform_name(model.name)
+        with self.lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            try:
+                injected = self.injected_errors.get(operation)
+                if injected:
+                    raise injected.pop(0)
+                self.pending.response = (200, getattr(self, operation)(params))
+            except FakeError as e:
+                self.pending.response = (
+                    e.status_code,
+                    {
+                        "Error": {"Code": e.code, "Message": e.message},
+                        "ResponseMetadata": {"HTTPStatusCode": e.status_code},
+                    },
+                )
+
+    def _respond(self, model, **kwargs):
+        start = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        status_code, response = self.pending.response
+        if self.recorder is not None:
+            self.recorder.record(self.stage, time.perf_counter() - start)
+        return AWSResponse(None, status_code, {}, None), response
@@ -2,6 +2,7 @@ import logging
 
 import pytest
 
+from test_tools.stubber_factory import fake_factory
 from test_tools.stubber_factory import stubber_factory
 
 logger = logging.getLogger(__name__)
@@ -46,3 +47,29 @@ def fixture_make_stubber(request, monkeypatch):
         return stubber
 
     return _make_stubber
+
+
+@pytest.fixture(name="make_fake")
+def fixture_make_fake(request):
+    """
+    Return a factory function that makes a stateful, in-memory fake of the service
+    behind a client.
+    """
+
+    def _make_fake(service_client, **kwargs):
+        """
+        Create a fake that answers every call made through the specified service
+        client, for any sequence of calls and from any number of threads. Keyword
+        arguments are passed to the fake, e.g. to inject latency or throttling.
+
+        After tests complete, the fake is detached from the client.
+        """
+        fact = fake_factory(service_client.meta.service_model.service_name)
+        fake = fact(service_client, **kwargs)
+
+        request.addfinalizer(fake.deactivate)
+        fake.activate()
+
+        return fake
+
+    return _make_fake
@@ -0,0 +1,282 @@
+"""
+A local stand-in for the Random Data API users endpoint, to load-test and profile
+the data fetcher deterministically.
+
+It serves users with the same schema as https://random-data-api.com/api/v2/users,
+rejects pages larger than its maximum size like the real API does, and can inject
+latency, 5xx errors and 429 rate limiting. Responses are gzip-compressed when the
+client accepts it.
+
+Usage:
+    python -m test_tools.random_data_api --port 8080 --latency-ms 50 --error-rate 0.05
+
+Then point the fetcher to it:
+    export USERS_ENDPOINT=http://localhost:8080/api/v2/users
+"""
+
+import argparse
+import collections
+import gzip
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+USERS_PATH = "/api/v2/users"
+
+FIRST_NAMES = ["Yolando", "Andrew", "Maria", "Kim", "Olga", "Tyrone", "Mei", "Lars"]
+LAST_NAMES = ["Howell", "Metz", "Smith", "Jones", "Brown", "Nguyen", "Garcia", "Kuhn"]
+
+
+def make_user(user_id, rng=random):
+    """Build a user with the same schema as the ones returned by the Random Data API."""
+    first_name = rng.choice(FIRST_NAMES)
+    last_name = rng.choice(LAST_NAMES)
+    username = f"{first_name}.{last_name}".lower()
+    return {
+        "id": user_id,
+        "uid": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        "password": "".join(rng.choices("abcdefghijkLMNOPQ0123456789", k=10)),
+        "first_name": first_name,
+        "last_name": last_name,
+        "username": username,
+        "email": f"{username}@email.com",
+        "avatar": f"https://robohash.org/{username}.png?size=300x300&set=set1",
+        "gender": rng.choice(["Male", "Female", "Genderfluid", "Agender"]),
+        "phone_number": f"+1 {rng.randint(100, 999)}-555-{rng.randint(1000, 9999)}",
+        "social_insurance_number": str(rng.randint(100000000, 999999999)),
+        "date_of_birth": f"19{rng.randint(50, 99)}-{rng.randint(1, 12):02}-{rng.randint(1, 28):02}",
+        "employment": {
+            "title": rng.choice(["Future Technician", "Manufacturing Architect"]),
+            "key_skill": rng.choice(["Work under pressure", "Technical savvy"]),
+        },
+        "address": {
+            "city": rng.choice(["Matildamouth", "East Joellachester"]),
+            "street_name": rng.choice(["Gerhold Glens", "Crooks Points"]),
+            "street_address": f"{rng.randint(1, 9999)} Miller Street",
+            "zip_code": f"{rng.randint(10000, 99999)}",
+            "state": rng.choice(["Iowa", "New Jersey"]),
+            "country": "United States",
+            "coordinates": {
+                "lat": rng.uniform(-90, 90),
+                "lng": rng.uniform(-180, 180),
+            },
+        },
+        "credit_card": {"cc_number": "4396-8073-7993-3981"},
+        "subscription": {
+            "plan": rng.choice(["Basic", "Gold", "Platinum"]),
+            "status": rng.choice(["Pending", "Active", "Blocked"]),
+            "payment_method": rng.choice(["Visa checkout", "Money transfer"]),
+            "term": rng.choice(["Payment in advance", "Annual"]),
+        },
+    }
+
+
+class RandomDataApiServer:
+    """
+    A threaded HTTP server serving random users.
+
+    Latency is drawn from the given distribution ("fixed", "uniform" between 0 and
+    twice the mean, or "exponential"). Each request fails with a 503 with
+    probability `error_rate`, and with a 429 with probability `throttle_rate` or
+    when more than `rate_limit_per_minute` requests arrived in the last minute.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency_ms=0.0,
+        latency_distribution="fixed",
+        error_rate=0.0,
+        throttle_rate=0.0,
+        rate_limit_per_minute=None,
+        max_size=100,
+        seed=None,
+    ):
+        self.latency_ms = latency_ms
+        self.latency_distribution = latency_distribution
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit_per_minute = rate_limit_per_minute
+        self.max_size = max_size
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.requests = collections.deque()
+        self.responses = collections.Counter()
+        self.connections = 0
+        self.compressed_responses = 0
+        self.thread = None
+
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with simulator.lock:
+                    simulator.connections += 1
+
+            def do_GET(self):
+                simulator._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        """The URL of the users endpoint."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{USERS_PATH}"
+
+    def start(self):
+        """Serve requests from a background thread."""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving requests."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _latency(self):
+        mean = self.latency_ms / 1000
+        if self.latency_distribution == "uniform":
+            return self.random.uniform(0, 2 * mean)
+        if self.latency_distribution == "exponential":
+            return self.random.expovariate(1 / mean) if mean else 0.0
+        return mean
+
+    def _rate_limited(self):
+        # Keep the arrival times of the last minute, and throttle past the limit.
+        now = time.monotonic()
+        self.requests.append(now)
+        while self.requests and self.requests[0] <= now - 60:
+            self.requests.popleft()
+        if self.rate_limit_per_minute is None:
+            return None
+        if len(self.requests) > self.rate_limit_per_minute:
+            return max(1, int(self.requests[0] + 60 - now) + 1)
+        return None
+
+    def _handle(self, request):
+        url = urlparse(request.path)
+        if url.path != USERS_PATH:
+            return self._send(request, 404, {"error": "Not Found"})
+
+        try:
+            size = int(parse_qs(url.query).get("size", ["1"])[0])
+        except ValueError:
+            return self._send(request, 400, {"error": "size must be an integer"})
+
+        with self.lock:
+            latency = self._latency()
+            retry_after = self._rate_limited()
+            roll = self.random.random()
+            first_id = self.next_id
+
+            if retry_after is None and roll < self.throttle_rate:
+                retry_after = 1
+            failed = retry_after is None and roll < self.throttle_rate + self.error_rate
+            valid = retry_after is None and not failed and size <= self.max_size
+            if valid:
+                self.next_id += size
+                users = [make_user(first_id + i, self.random) for i in range(size)]
+
+        time.sleep(latency)
+
+        if retry_after is not None:
+            return self._send(
+                request,
+                429,
+                {"error": "Too Many Requests"},
+                {"Retry-After": str(retry_after)},
+            )
+        if failed:
+            return self._send(request, 503, {"error": "Service Unavailable"})
+        if not valid:
+            # The real API answers oversized pages with a 200 and an error message.
+            return self._send(
+                request, 200, {"message": f"Maximum allowed size is {self.max_size}"}
+            )
+
+        return self._send(request, 200, users)
+
+    def _send(self, request, status, payload, headers=None):
+        with self.lock:
+            self.responses[status] += 1
+
+        body = json.dumps(payload).encode("utf-8")
+        compressed = "gzip" in request.headers.get("Accept-Encoding", "")
+        if compressed:
+            body = gzip.compress(body)
+            with self.lock:
+                self.compressed_responses += 1
+
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json; charset=utf-8")
+        request.send_header("Content-Length", str(len(body)))
+        if compressed:
+            request.send_header("Content-Encoding", "gzip")
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument(
+        "--latency-distribution",
+        choices=["fixed", "uniform", "exponential"],
+        default="fixed",
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-per-minute", type=int, default=None)
+    parser.add_argument("--max-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    server = RandomDataApiServer(
+        host=args.host,
+        port=args.port,
+        latency_ms=args.latency_ms,
+        latency_distribution=args.latency_distribution,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        rate_limit_per_minute=args.rate_limit_per_minute,
+        max_size=args.max_size,
+        seed=args.seed,
+    )
+    print(f"Serving random users on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+An in-memory fake of the Amazon SQS calls used by this project.
+"""
+
+import hashlib
+import itertools
+import time
+import uuid
+
+from test_tools.fake import BaseFake
+from test_tools.fake import FakeError
+
+# SendMessageBatch and ReceiveMessage limits enforced by the fake.
+MAX_BATCH_ENTRIES = 10
+
+
+class SqsFake(BaseFake):
+    """
+    Keeps queues and their messages in memory. Received messages stay invisible
+    for the queue's visibility timeout, until deleted.
+    """
+
+    def __init__(self, client, visibility_timeout=30, **kwargs):
+        super().__init__(client, **kwargs)
+        self.visibility_timeout = visibility_timeout
+        self.queues = {}
+        self.receipts = itertools.count()
+        self.failing_entries = 0
+
+    def messages(self, queue_url):
+        """Return the bodies of every message in the queue, received or not."""
+        return [m["Body"] for m in self._queue(queue_url)]
+
+    def fail_next_entries(self, count):
+        """Report the next `count` batch entries as failed, on SQS's side."""
+        with self.lock:
+            self.failing_entries += count
+
+    def _queue(self, url):
+        if url not in self.queues:
+            raise FakeError(
+                "AWS.SimpleQueueService.NonExistentQueue",
+                "The specified queue does not exist.",
+            )
+        return self.queues[url]
+
+    def _enqueue(self, url, body, attributes):
+        message = {
+            "MessageId": str(uuid.uuid4()),
+            "Body": body,
+            "MD5OfBody": hashlib.md5(body.encode("utf-8")).hexdigest(),
+            "MessageAttributes": attributes or {},
+            "visible_at": 0,
+            "ReceiptHandle": None,
+        }
+        self._queue(url).append(message)
+        return message
+
+    def create_queue(self, params):
+        url = f"https://sqs.{self.client.meta.region_name}.amazonaws.com/000000000000/{params['QueueName']}"
+        self.queues.setdefault(url, [])
+        return {"QueueUrl": url}
+
+    def list_queues(self, params):
+        prefix = params.get("QueueNamePrefix", "")
+        urls = [u for u in self.queues if u.rsplit("/", 1)[-1].startswith(prefix)]
+        if "MaxResults" in params:
+            urls = urls[: params["MaxResults"]]
+        return {"QueueUrls": urls}
+
+    def get_queue_url(self, params):
+        for url in self.queues:
+            if url.rsplit("/", 1)[-1] == params["QueueName"]:
+                return {"QueueUrl": url}
+        raise FakeError(
+            "AWS.SimpleQueueService.NonExistentQueue",
+            "The specified queue does not exist.",
+        )
+
+    def send_message(self, params):
+        message = self._enqueue(
+            params["QueueUrl"], params["MessageBody"], params.get("MessageAttributes")
+        )
+        return {
+            "MessageId": message["MessageId"],
+            "MD5OfMessageBody": message["MD5OfBody"],
+        }
+
+    def send_message_batch(self, params):
+        entries = params["Entries"]
+        if len(entries) > MAX_BATCH_ENTRIES:
+            raise FakeError(
+                "AWS.SimpleQueueService.TooManyEntriesInBatchRequest",
+                f"Maximum number of entries per request are {MAX_BATCH_ENTRIES}.",
+            )
+        if len({e["Id"] for e in entries}) != len(entries):
+            raise FakeError(
+                "AWS.SimpleQueueService.BatchEntryIdsNotDistinct",
+                "Two or more batch entries in the request have the same Id.",
+            )
+
+        successful = []
+        failed = []
+        for entry in entries:
+            if self.failing_entries:
+                self.failing_entries -= 1
+                failed.append(
+                    {"Id": entry["Id"], "SenderFault": False, "Code": "InternalError"}
+                )
+                continue
+
+            message = self._enqueue(
+                params["QueueUrl"], entry["MessageBody"], entry.get("MessageAttributes")
+            )
+            successful.append(
+                {
+                    "Id": entry["Id"],
+                    "MessageId": message["MessageId"],
+                    "MD5OfMessageBody": message["MD5OfBody"],
+                }
+            )
+        return {"Successful": successful, "Failed": failed}
+
+    def receive_message(self, params):
+        now = time.monotonic()
+        timeout = params.get("VisibilityTimeout", self.visibility_timeout)
+        received = []
+        for message in self._queue(params["QueueUrl"]):
+            if len(received) >= params.get("MaxNumberOfMessages", 1):
+                break
+            if message["visible_at"] > now:
+                continue
+
+            message["visible_at"] = now + timeout
+            message["ReceiptHandle"] = str(next(self.receipts))
+            received.append(
+                {
+                    "MessageId": message["MessageId"],
+                    "ReceiptHandle": message["ReceiptHandle"],
+                    "MD5OfBody": message["MD5OfBody"],
+                    "Body": message["Body"],
+                    "MessageAttributes": message["MessageAttributes"],
+                }
+            )
+        return {"Messages": received}
+
+    def delete_message(self, params):
+        queue = self._queue(params["QueueUrl"])
+        queue[:] = [m for m in queue if m["ReceiptHandle"] != params["ReceiptHandle"]]
+        return {}
@@ -54,6 +54,24 @@ class SqsStubber(BaseStubber):
             "send_message", expected_params, response, error_code=error_code
         )
 
+    def stub_send_message_batch(
+        self, url, entries, successful_ids=None, failed=None, error_code=None
+    ):
+        expected_params = {"QueueUrl": url, "Entries": entries}
+        if successful_ids is None:
+            failed_ids = [f["Id"] for f in failed or []]
+            successful_ids = [e["Id"] for e in entries if e["Id"] not in failed_ids]
+        response = {
+            "Successful": [
+                {"Id": i, "MessageId": f"message-{i}", "MD5OfMessageBody": "md5"}
+                for i in successful_ids
+            ],
+            "Failed": failed or [],
+        }
+        self._stub_bifurcator(
+            "send_message_batch", expected_params, response, error_code=error_code
+        )
+
     def stub_set_queue_attributes(self, queue_url, attributes, error_code=None):
         expected_params = {"QueueUrl": queue_url, "Attributes": attributes}
         self._stub_bifurcator(
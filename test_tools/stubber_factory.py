@@ -1,5 +1,8 @@
+from test_tools.cloudwatch_fake import CloudWatchFake
 from test_tools.cloudwatch_stubber import CloudWatchStubber
+from test_tools.dynamodb_fake import DynamoDBFake
 from test_tools.dynamodb_stubber import DynamoDBStubber
+from test_tools.sqs_fake import SqsFake
 from test_tools.sqs_stubber import SqsStubber
 
 
@@ -18,3 +21,16 @@ def stubber_factory(service_name):
         raise StubberFactoryNotImplemented(
             "Make sure you added a new stubber to stubber_factory.py."
         )
+
+
+def fake_factory(service_name):
+    if service_name == "logs":
+        return CloudWatchFake
+    elif service_name == "dynamodb":
+        return DynamoDBFake
+    elif service_name == "sqs":
+        return SqsFake
+    else:
+        raise StubberFactoryNotImplemented(
+            "Make sure you added a new fake to stubber_factory.py."
+        )